@@ -10,6 +10,9 @@ import io.ktor.client.request.*
 import io.ktor.client.request.forms.*
 import io.ktor.client.statement.*
 import io.ktor.http.*
+import io.ktor.http.content.*
+import io.ktor.util.cio.*
+import io.ktor.utils.io.*
 import io.ktor.utils.io.streams.*
 import io.ktor.utils.io.core.*
 import kotlinx.coroutines.Dispatchers
@@ -57,15 +60,16 @@ class AudioFileUploader(
                 return@withContext Result.failure(IOException("Audio file is empty: ${song.data}"))
             }
 
-            // Read file bytes
-            val fileBytes = audioFile.readBytes()
-            Log.d(TAG, "Read ${fileBytes.size} bytes from file")
-
-            // Upload the file to the server using raw binary data
+            // Upload the file to the server using raw binary data, streamed from disk
+            // so large files are never held in memory; the server stops decoding
+            // once it has the first 10 seconds
             val response = client.post("$baseUrl/classify_audio_file") {
-                setBody(fileBytes)
+                setBody(object : OutgoingContent.ReadChannelContent() {
+                    override val contentLength: Long = fileSize
+                    override val contentType: ContentType = ContentType("audio", "ogg")
+                    override fun readFrom(): ByteReadChannel = audioFile.readChannel()
+                })
                 headers {
-                    append(HttpHeaders.ContentType, "audio/ogg")
                     append("X-Song-ID", "${song.id}_${song.title}")
                     append("X-File-Name", audioFile.name)
                 }
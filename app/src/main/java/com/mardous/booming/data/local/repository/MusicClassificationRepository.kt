@@ -523,7 +523,7 @@ class MusicClassificationRepository(
             val healthResult = cloudService.checkHealth()
             if (healthResult.isSuccess) {
                 val health = healthResult.getOrThrow()
-                Result.success(health.status == "healthy" && health.model_loaded)
+                Result.success(health.status == "healthy" && health.model_loaded && health.ready)
             } else {
                 Result.failure(healthResult.exceptionOrNull() ?: IOException("Health check failed"))
             }
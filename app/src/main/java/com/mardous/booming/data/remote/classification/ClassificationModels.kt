@@ -82,7 +82,8 @@ data class HealthCheckResponse(
     val status: String,
     val model_loaded: Boolean,
     val service: String,
-    val version: String
+    val version: String,
+    val ready: Boolean = true // false while the service warms up; absent on older services
 )
 
 @Serializable
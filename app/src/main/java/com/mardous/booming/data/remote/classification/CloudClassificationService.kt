@@ -56,7 +56,7 @@ class CloudClassificationService(
                 contentType(ContentType.Application.Json)
             }.body<HealthCheckResponse>()
             
-            Log.d(TAG, "Health check successful: ${response.status}, model loaded: ${response.model_loaded}")
+            Log.d(TAG, "Health check successful: ${response.status}, model loaded: ${response.model_loaded}, ready: ${response.ready}")
             Result.success(response)
         } catch (e: Exception) {
             Log.e(TAG, "Health check failed", e)
@@ -0,0 +1,334 @@
+# Benchmark suite for the Local Music Classification Service
+# Times feature extraction stage by stage, the whole extractor, the model
+# pipeline and every classification endpoint on a synthetic audio corpus.
+#
+#   python benchmark_local_service.py                      # run, write benchmark_results.json
+#   python benchmark_local_service.py --output base.json   # keep a baseline
+#   python benchmark_local_service.py --compare base.json  # run and compare against it
+#
+# Runs offline: all audio is generated, and without a model file the service's
+# dummy model is used (pipeline numbers are then not comparable to real ones).
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import struct
+import subprocess
+import sys
+import time
+import warnings
+
+import numpy as np
+
+SAMPLE_RATES = (22050, 44100, 48000)
+CLIP_SECONDS = 10.0
+SUITES = ('stages', 'extractor', 'pipeline', 'endpoints')
+PIPELINE_ROWS = (1, 8, 64, 512)
+
+def synthetic_clip(kind, sample_rate, seconds=CLIP_SECONDS):
+    """Deterministic test audio: same kind, rate and length always give the same samples."""
+    rng = np.random.default_rng(sample_rate + len(kind))
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+
+    if kind == 'tone':
+        y = sum(0.2 * np.sin(2 * np.pi * frequency * t) for frequency in (220.0, 277.2, 329.6))
+    elif kind == 'noise':
+        y = 0.3 * rng.standard_normal(len(t))
+    elif kind == 'clicks':
+        # 120 bpm click track with a decaying 1 kHz blip on every beat
+        y = np.zeros(len(t))
+        y[::sample_rate // 2] = 1.0
+        blip = np.exp(-np.arange(sample_rate // 50) / (sample_rate / 1000)) * np.sin(
+            2 * np.pi * 1000 * np.arange(sample_rate // 50) / sample_rate
+        )
+        y = np.convolve(y, blip, mode='same')
+    elif kind == 'music':
+        # Chord changes every two seconds, a kick on every beat and some noise
+        roots = np.array([220.0, 196.0, 174.6, 196.0, 220.0])[(t // 2).astype(int) % 5]
+        y = sum(0.15 * np.sin(2 * np.pi * roots * ratio * t) for ratio in (1.0, 1.26, 1.5))
+        kicks = np.zeros(len(t))
+        kicks[::sample_rate // 2] = 1.0
+        y += np.convolve(kicks, 0.6 * np.exp(-np.arange(2000) / 200.0) * np.sin(
+            2 * np.pi * 60 * np.arange(2000) / sample_rate), mode='same')
+        y += 0.02 * rng.standard_normal(len(t))
+    elif kind == 'silence':
+        y = np.zeros(len(t))
+    elif kind == 'short':
+        # A quarter second, far below the 10 s analysis window
+        t = t[:sample_rate // 4]
+        y = 0.3 * np.sin(2 * np.pi * 440.0 * t)
+    else:
+        raise ValueError(f"Unknown clip kind {kind}")
+    return y.astype(np.float32)
+
+CLIP_KINDS = ('tone', 'noise', 'clicks', 'music', 'silence', 'short')
+
+def summarize(samples):
+    """Milliseconds statistics of a list of durations in seconds."""
+    ms = sorted(sample * 1000 for sample in samples)
+    return {
+        'runs': len(ms),
+        'median_ms': round(statistics.median(ms), 3),
+        'mean_ms': round(statistics.fmean(ms), 3),
+        'min_ms': round(ms[0], 3),
+        'p95_ms': round(ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))], 3),
+        'stdev_ms': round(statistics.stdev(ms), 3) if len(ms) > 1 else 0.0
+    }
+
+def time_calls(function, repeat, warmup):
+    """Durations in seconds of ``repeat`` calls of ``function`` after ``warmup`` untimed ones."""
+    for _ in range(warmup):
+        function()
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+def bench_stages(service, extractor, repeat, warmup, results):
+    """Per-extractor stage times for every clip, read from the service's stage timers."""
+    out = extractor.new_matrix(1)[0]
+    for rate in SAMPLE_RATES:
+        for kind in CLIP_KINDS:
+            clip = synthetic_clip(kind, rate)
+            for _ in range(warmup):
+                extractor.extract_into(clip, rate, out)
+            runs = {}
+            for _ in range(repeat):
+                service.request_timings.start()
+                try:
+                    extractor.extract_into(clip, rate, out)
+                finally:
+                    stages = service.request_timings.stop()
+                for stage, seconds in stages.items():
+                    runs.setdefault(stage, []).append(seconds)
+            for stage, samples in sorted(runs.items()):
+                results[f'stages/{kind}@{rate}/{stage}'] = summarize(samples)
+
+def bench_extractor(extractor, repeat, warmup, results):
+    """The whole extractor per clip, the way raw PCM endpoints run it and the way decoded files are analysed."""
+    out = extractor.new_matrix(1)[0]
+    for rate in SAMPLE_RATES:
+        for kind in CLIP_KINDS:
+            clip = synthetic_clip(kind, rate)
+            results[f'extractor/{kind}@{rate}'] = summarize(
+                time_calls(lambda: extractor.extract_into(clip, rate, out), repeat, warmup)
+            )
+            results[f'extractor/{kind}@{rate}/as_decoded'] = summarize(
+                time_calls(lambda: extractor.extract_into(clip, rate, out, fit_to_window=False), repeat, warmup)
+            )
+
+def bench_pipeline(service, extractor, repeat, warmup, results):
+    """Preprocessing and model on N rows: the compiled path the service uses, and scikit-learn."""
+    rows = extractor.new_matrix(len(CLIP_KINDS))
+    for i, kind in enumerate(CLIP_KINDS):
+        extractor.extract_into(synthetic_clip(kind, 22050), 22050, rows[i])
+    rows = np.nan_to_num(rows)
+
+    model_data = service.model_data
+    sklearn_model = model_data if 'model' in model_data else None
+    model_path = service.find_model_path()
+    if sklearn_model is None and model_path is not None:
+        import joblib
+        sklearn_model = joblib.load(model_path)
+
+    for n_rows in PIPELINE_ROWS:
+        X = np.resize(rows, (n_rows, rows.shape[1]))
+        results[f'pipeline/service/rows={n_rows}'] = summarize(
+            time_calls(lambda: service.predict_matrix(X), repeat, warmup)
+        )
+        if sklearn_model is not None:
+            def sklearn_predict():
+                X_processed = service.transform_stepwise(sklearn_model, np.asarray(X, dtype=np.float64))
+                sklearn_model['model'].predict_proba(X_processed)
+            results[f'pipeline/sklearn/rows={n_rows}'] = summarize(time_calls(sklearn_predict, repeat, warmup))
+
+def pcm_frame(service, song_id, sample_rate, samples):
+    """One XPCM frame (float32 samples), the binary format the single-song endpoints accept."""
+    song_id = song_id.encode('utf-8')
+    header = service.PCM_HEADER.pack(service.PCM_MAGIC, 1, 1, len(song_id), sample_rate, len(samples))
+    padding = b'\0' * (-len(song_id) % 4)
+    return header + song_id + padding + np.asarray(samples, dtype='<f4').tobytes()
+
+def wav_bytes(samples, sample_rate):
+    import soundfile as sf
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format='WAV')
+    return buffer.getvalue()
+
+def bench_endpoints(service, repeat, warmup, results):
+    """Each classification endpoint through Flask's test client, with a 44.1 kHz music clip."""
+    client = service.app.test_client()
+    rate = 44100
+    clip = synthetic_clip('music', rate)
+    samples = clip.tolist()
+    wav = wav_bytes(clip, rate)
+    features = service.extraction_pool.extract_vector(clip, rate)
+    batch = [
+        {'song_id': f'{kind}-{i}', 'audio_data': synthetic_clip(kind, rate).tolist(), 'sample_rate': rate}
+        for i, kind in enumerate(CLIP_KINDS + ('music', 'tone'))
+    ]
+
+    requests = {
+        'classify/json': lambda: client.post('/classify', json={
+            'audio_data': samples, 'sample_rate': rate, 'song_id': 'bench'
+        }),
+        'classify/pcm': lambda: client.post(
+            '/classify', data=pcm_frame(service, 'bench', rate, clip), content_type='application/x-audio-pcm'
+        ),
+        'classify_audio_data/json': lambda: client.post('/classify_audio_data', json={
+            'audio_data': samples, 'sample_rate': rate, 'song_id': 'bench'
+        }),
+        'classify_audio_file/wav': lambda: client.post(
+            '/classify_audio_file', data=wav, headers={'X-Song-ID': 'bench', 'X-File-Name': 'bench.wav'}
+        ),
+        'classify_file/multipart': lambda: client.post('/classify_file', data={
+            'file': (io.BytesIO(wav), 'bench.wav'), 'song_id': 'bench'
+        }, content_type='multipart/form-data'),
+        'classify_features/json': lambda: client.post('/classify_features', json={
+            'features': np.nan_to_num(features).tolist(), 'song_id': 'bench'
+        }),
+        'batch_classify/json8': lambda: client.post('/batch_classify', json={'songs': batch}),
+    }
+    for name, send in requests.items():
+        response = send()
+        if response.status_code != 200:
+            raise RuntimeError(f"{name} returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+        results[f'endpoint/{name}'] = summarize(time_calls(send, repeat, warmup))
+
+def environment(service, args):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+
+    import librosa
+    import sklearn
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'librosa': librosa.__version__,
+        'scikit_learn': sklearn.__version__,
+        'model_version': service.model_version,
+        'model_source': service.startup_info.get('model_source'),
+        'workers': service.MAX_WORKERS,
+        'repeat': args.repeat,
+        'warmup': args.warmup,
+        'suites': args.suites
+    }
+
+def compare(results, baseline, threshold):
+    """
+    Print median changes against ``baseline`` and return the benchmarks that
+    got slower by more than ``threshold`` (a fraction).
+    """
+    regressions = []
+    rows = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or base['median_ms'] <= 0:
+            continue
+        change = result['median_ms'] / base['median_ms'] - 1
+        # Sub-millisecond timings jitter by more than any sensible threshold
+        significant = abs(change) > threshold and abs(result['median_ms'] - base['median_ms']) > 0.5
+        if significant:
+            rows.append((name, base['median_ms'], result['median_ms'], change))
+            if change > 0:
+                regressions.append(name)
+
+    print()
+    print(f"Compared {sum(name in baseline for name in results)} benchmarks with the baseline "
+          f"(threshold {threshold:.0%}):")
+    for name, before, after, change in sorted(rows, key=lambda row: row[3]):
+        marker = 'slower' if change > 0 else 'faster'
+        print(f"   {name:<58} {before:>10.2f} ms -> {after:>10.2f} ms  {change:+7.1%} {marker}")
+    if not rows:
+        print("   no significant changes")
+    missing = sorted(set(baseline) - set(results))
+    if missing:
+        print(f"   {len(missing)} baseline benchmarks were not run")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__ or 'Benchmark the local classification service')
+    parser.add_argument('--suites', nargs='+', choices=SUITES, default=list(SUITES),
+                        help='what to benchmark (default: everything)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--warmup', type=int, default=1, help='untimed runs before each benchmark')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='extraction worker processes for the endpoint suite (default: the service default)')
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the results')
+    parser.add_argument('--compare', metavar='BASELINE', help='results file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative slowdown of a median counted as a regression (default 0.10)')
+    args = parser.parse_args()
+
+    # Measure the work itself: no result cache, feature store, jobs, profiling or model watching
+    os.environ.update({
+        'CLASSIFIER_CACHE_ENTRIES': '0',
+        'CLASSIFIER_CACHE_PATH': '',
+        'CLASSIFIER_FEATURE_STORE_DIR': '',
+        'CLASSIFIER_JOBS_DIR': '',
+        'CLASSIFIER_PROFILE_EVERY': '0',
+        'CLASSIFIER_MODEL_WATCH_SECONDS': '0'
+    })
+    if args.workers is not None:
+        os.environ['CLASSIFIER_WORKERS'] = str(args.workers)
+    # librosa (silent clips) and scikit-learn (pickled with another version) warnings
+    warnings.simplefilter('ignore', UserWarning)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    print("🚀 Loading the service...")
+    import local_music_classification_service as service
+
+    if not service.start_service():
+        print("❌ The service could not load a model")
+        sys.exit(1)
+    while not service.warm_up_state['ready']:
+        time.sleep(0.1)
+    extractor = service.LocalAudioFeatureExtractor(service.model_data['feature_names'])
+    service.warm_up_extractor(extractor, SAMPLE_RATES)
+
+    results = {}
+    suites = {
+        'stages': lambda: bench_stages(service, extractor, args.repeat, args.warmup, results),
+        'extractor': lambda: bench_extractor(extractor, args.repeat, args.warmup, results),
+        'pipeline': lambda: bench_pipeline(service, extractor, args.repeat, args.warmup, results),
+        'endpoints': lambda: bench_endpoints(service, args.repeat, args.warmup, results),
+    }
+    for suite in args.suites:
+        started = time.perf_counter()
+        print(f"⏱️  {suite}...")
+        suites[suite]()
+        print(f"   done in {time.perf_counter() - started:.1f}s")
+
+    report = {'environment': environment(service, args), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"📊 {len(results)} benchmarks written to {args.output}")
+
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline['results'], args.threshold)
+        if baseline['environment'].get('cpu_count') != os.cpu_count():
+            print("⚠️ The baseline was recorded on a machine with a different CPU count")
+
+    service.extraction_pool.shutdown()
+    if regressions:
+        print(f"❌ {len(regressions)} benchmarks regressed")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
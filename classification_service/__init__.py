@@ -0,0 +1 @@
+"""Parts of the local music classification service that do not depend on its Flask app or model state."""
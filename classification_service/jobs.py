@@ -0,0 +1,463 @@
+"""
+Asynchronous classification jobs: their persistent state, the background
+runner that classifies uploaded songs and the bound on event streams.
+"""
+
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class JobStore:
+    """
+    Persistent state of asynchronous classification jobs.
+
+    ``jobs.sqlite3`` has a row per job and a row per song of its manifest,
+    holding the song's state (awaiting_upload, queued, running, done or
+    failed) and, once finished, its result and the sequence number result
+    pages and event streams resume from. An uploaded song is kept decoded,
+    as float32 samples of its analysis window, in ``audio/<job>/<index>.npy``
+    until it is classified. Songs left running by a process that stopped are
+    queued again, so jobs resume after a restart. Pre-forked server workers
+    share the store through SQLite's locking.
+    """
+
+    ITEM_STATES = ('awaiting_upload', 'queued', 'running', 'done', 'failed')
+
+    def __init__(self, directory: str, retention_hours: float):
+        self.directory = Path(directory)
+        self.db_path = self.directory / 'jobs.sqlite3'
+        self.retention_hours = retention_hours
+        self._lock = threading.Lock()
+        self._db = None
+        self._pid = None
+
+    def _open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        db = sqlite3.connect(str(self.db_path), check_same_thread=False, timeout=30)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute('PRAGMA synchronous=NORMAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS jobs ('
+            'id TEXT PRIMARY KEY, created REAL NOT NULL, finished REAL, total INTEGER NOT NULL, '
+            'last_result INTEGER NOT NULL DEFAULT 0)'
+        )
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS items ('
+            'job_id TEXT NOT NULL, idx INTEGER NOT NULL, song_id TEXT NOT NULL, state TEXT NOT NULL, '
+            'mode TEXT, content_key TEXT, sample_rate INTEGER, worker INTEGER, queued REAL, '
+            'result TEXT, result_seq INTEGER, PRIMARY KEY (job_id, idx))'
+        )
+        db.execute('CREATE INDEX IF NOT EXISTS items_state ON items (state, queued)')
+        db.execute('CREATE INDEX IF NOT EXISTS items_results ON items (job_id, result_seq)')
+        db.commit()
+        return db
+
+    def _connection(self):
+        # One connection per process: SQLite connections must not be used across fork()
+        if self._db is None or self._pid != os.getpid():
+            self._db, self._pid = self._open(), os.getpid()
+        return self._db
+
+    def _audio_path(self, job_id: str, index: int) -> Path:
+        return self.directory / 'audio' / job_id / f'{index}.npy'
+
+    def create(self, song_ids: List[str]) -> str:
+        """Start a job whose songs all await their upload; returns its id."""
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            db = self._connection()
+            db.execute('INSERT INTO jobs (id, created, total) VALUES (?, ?, ?)', (job_id, time.time(), len(song_ids)))
+            db.executemany(
+                "INSERT INTO items (job_id, idx, song_id, state) VALUES (?, ?, ?, 'awaiting_upload')",
+                [(job_id, index, song_id) for index, song_id in enumerate(song_ids)]
+            )
+            db.commit()
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Progress of a job, or None if there is no such job."""
+        with self._lock:
+            db = self._connection()
+            job = db.execute('SELECT created, finished, total, last_result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(db.execute('SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state', (job_id,)))
+        created, finished, total, last_result = job
+        songs = {state: counts.get(state, 0) for state in self.ITEM_STATES}
+        completed = songs['done'] + songs['failed']
+        if completed == total:
+            state = 'completed'
+        elif songs['queued'] or songs['running']:
+            state = 'running'
+        else:
+            state = 'awaiting_uploads'
+        return {
+            'job_id': job_id,
+            'state': state,
+            'total': total,
+            'songs': songs,
+            'progress': round(completed / total, 4) if total else 1.0,
+            'last_result': last_result,
+            'created': created,
+            'finished': finished,
+            'elapsed_seconds': round((finished or time.time()) - created, 1)
+        }
+
+    def awaiting_upload(self, job_id: str) -> List[int]:
+        """Indices of the job's songs that have not been uploaded yet."""
+        with self._lock:
+            return [index for (index,) in self._connection().execute(
+                "SELECT idx FROM items WHERE job_id = ? AND state = 'awaiting_upload' ORDER BY idx", (job_id,)
+            )]
+
+    def item(self, job_id: str, index: int) -> Optional[tuple]:
+        """(song_id, state) of one song of a job, or None."""
+        with self._lock:
+            return self._connection().execute(
+                'SELECT song_id, state FROM items WHERE job_id = ? AND idx = ?', (job_id, index)
+            ).fetchone()
+
+    def queue(self, job_id: str, index: int, audio: np.ndarray, sample_rate: int, mode: str, content_key: str) -> bool:
+        """
+        Keep a song's decoded audio and queue it for classification. Returns
+        False if it was queued or finished meanwhile (a repeated upload).
+        """
+        path = self._audio_path(job_id, index)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial = path.with_name(f'{path.stem}.{os.getpid()}.{threading.get_ident()}.partial')
+        with open(partial, 'wb') as f:
+            np.save(f, np.ascontiguousarray(audio, dtype=np.float32))
+        with self._lock:
+            db = self._connection()
+            queued = db.execute(
+                "UPDATE items SET state = 'queued', mode = ?, content_key = ?, sample_rate = ?, queued = ?, "
+                "result = NULL, result_seq = NULL WHERE job_id = ? AND idx = ? AND state IN ('awaiting_upload', 'failed')",
+                (mode, content_key, int(sample_rate), time.time(), job_id, index)
+            ).rowcount
+            if queued:
+                os.replace(partial, path)
+                db.execute('UPDATE jobs SET finished = NULL WHERE id = ?', (job_id,))
+            db.commit()
+        if not queued:
+            partial.unlink(missing_ok=True)
+        return bool(queued)
+
+    def claim(self, limit: int, worker: int) -> List[tuple]:
+        """
+        Mark up to ``limit`` queued songs (oldest upload first) as running in
+        process ``worker``; returns (job_id, index, song_id, mode, content_key,
+        sample_rate) for each.
+        """
+        with self._lock:
+            db = self._connection()
+            try:
+                # SQLite's write lock, held until the commit, keeps two processes from claiming a song twice
+                db.execute('BEGIN IMMEDIATE')
+                claimed = db.execute(
+                    "SELECT job_id, idx, song_id, mode, content_key, sample_rate FROM items "
+                    "WHERE state = 'queued' ORDER BY queued LIMIT ?", (limit,)
+                ).fetchall()
+                db.executemany(
+                    "UPDATE items SET state = 'running', worker = ? WHERE job_id = ? AND idx = ?",
+                    [(worker, job_id, index) for job_id, index, *_ in claimed]
+                )
+                db.commit()
+            except sqlite3.Error:
+                db.rollback()
+                raise
+        return claimed
+
+    def load_audio(self, job_id: str, index: int) -> np.ndarray:
+        return np.load(self._audio_path(job_id, index))
+
+    def finish(self, entries: List[tuple]):
+        """Record (job_id, index, result) entries and drop their audio."""
+        with self._lock:
+            db = self._connection()
+            try:
+                db.execute('BEGIN IMMEDIATE')
+                jobs = set()
+                for job_id, index, result in entries:
+                    if db.execute(
+                            "SELECT 1 FROM items WHERE job_id = ? AND idx = ? AND state != 'done'", (job_id, index)
+                    ).fetchone() is None:
+                        continue  # the job was deleted meanwhile
+                    db.execute('UPDATE jobs SET last_result = last_result + 1 WHERE id = ?', (job_id,))
+                    (seq,) = db.execute('SELECT last_result FROM jobs WHERE id = ?', (job_id,)).fetchone()
+                    db.execute(
+                        'UPDATE items SET state = ?, result = ?, result_seq = ?, worker = NULL WHERE job_id = ? AND idx = ?',
+                        ('done' if result.get('success') else 'failed', json.dumps(result), seq, job_id, index)
+                    )
+                    jobs.add(job_id)
+                now = time.time()
+                for job_id in jobs:
+                    db.execute(
+                        "UPDATE jobs SET finished = ? WHERE id = ? AND NOT EXISTS "
+                        "(SELECT 1 FROM items WHERE job_id = ? AND state NOT IN ('done', 'failed'))",
+                        (now, job_id, job_id)
+                    )
+                db.commit()
+            except sqlite3.Error:
+                db.rollback()
+                raise
+        for job_id, index, _ in entries:
+            path = self._audio_path(job_id, index)
+            path.unlink(missing_ok=True)
+            try:
+                path.parent.rmdir()  # once the job's last upload is classified
+            except OSError:
+                pass
+
+    def results(self, job_id: str, after: int, limit: int) -> List[tuple]:
+        """(sequence number, result) of the job's songs finished after ``after``, in the order they finished."""
+        with self._lock:
+            rows = self._connection().execute(
+                'SELECT idx, result_seq, result FROM items WHERE job_id = ? AND result_seq > ? ORDER BY result_seq LIMIT ?',
+                (job_id, after, limit)
+            ).fetchall()
+        return [(seq, {'index': index, **json.loads(result)}) for index, seq, result in rows]
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            db = self._connection()
+            deleted = db.execute('DELETE FROM jobs WHERE id = ?', (job_id,)).rowcount
+            db.execute('DELETE FROM items WHERE job_id = ?', (job_id,))
+            db.commit()
+        shutil.rmtree(self.directory / 'audio' / job_id, ignore_errors=True)
+        return bool(deleted)
+
+    def requeue(self, worker: Optional[int] = None) -> int:
+        """
+        Queue running songs again: those of server worker ``worker``, which has
+        exited, or all of them when the server starts, before it classifies
+        anything. Never called on import: another process may be serving from
+        the same directory.
+        """
+        if not self.db_path.exists():
+            return 0
+        # On a connection of its own, so the pre-fork server process never holds one its workers inherit
+        with self._lock, closing(self._open()) as db:
+            if worker is None:
+                requeued = db.execute("UPDATE items SET state = 'queued', worker = NULL WHERE state = 'running'").rowcount
+            else:
+                requeued = db.execute(
+                    "UPDATE items SET state = 'queued', worker = NULL WHERE state = 'running' AND worker = ?", (worker,)
+                ).rowcount
+            db.commit()
+        if requeued:
+            logger.info(f"Queued {requeued} job songs again that were being classified when their process stopped")
+        return requeued
+
+    def has_queued(self) -> bool:
+        if not self.db_path.exists():
+            return False
+        with self._lock:
+            return self._connection().execute("SELECT 1 FROM items WHERE state = 'queued' LIMIT 1").fetchone() is not None
+
+    def expire(self) -> int:
+        """Delete jobs that finished, or were left with nothing queued, longer ago than the retention period."""
+        cutoff = time.time() - self.retention_hours * 3600
+        with self._lock:
+            db = self._connection()
+            expired = [job_id for (job_id,) in db.execute(
+                "SELECT id FROM jobs WHERE finished < ? OR (finished IS NULL AND created < ? AND NOT EXISTS "
+                "(SELECT 1 FROM items WHERE job_id = jobs.id AND state IN ('queued', 'running')))", (cutoff, cutoff)
+            )]
+        for job_id in expired:
+            self.delete(job_id)
+        return len(expired)
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.db_path.exists():
+            counts, jobs = {}, 0
+        else:
+            with self._lock:
+                db = self._connection()
+                counts = dict(db.execute('SELECT state, COUNT(*) FROM items GROUP BY state'))
+                (jobs,) = db.execute('SELECT COUNT(*) FROM jobs WHERE finished IS NULL').fetchone()
+        return {
+            'directory': str(self.directory),
+            'unfinished_jobs': jobs,
+            'songs': {state: counts.get(state, 0) for state in self.ITEM_STATES}
+        }
+
+class JobRunner:
+    """
+    Classifies the songs uploaded to jobs in the background.
+
+    A thread claims up to ``batch_songs`` queued songs of any job at a time
+    and classifies them together, the way /batch_classify does, so the
+    extraction workers stay busy however the client's connection behaves.
+    The thread is started by the first upload a process receives (or at
+    startup when songs are queued). Every pre-forked server worker runs one;
+    they share the queue through the job store.
+
+    ``classify(songs, fit_to_window)`` classifies a group of (song_id,
+    content_key, audio, sample_rate) songs the way /batch_classify does,
+    ``failed(song_id, error)`` builds the result of a song that could not be
+    classified, and songs are only claimed while ``ready()`` is true.
+    """
+
+    # Seconds between checks of the queue for songs uploaded to other processes
+    IDLE_SECONDS = 1.0
+    EXPIRE_EVERY_SECONDS = 3600
+
+    def __init__(self, store: JobStore, batch_songs: int,
+                 classify: Callable[[List[tuple], bool], List[Dict[str, Any]]],
+                 failed: Callable[[str, str], Dict[str, Any]], ready: Callable[[], bool]):
+        self.store = store
+        self.batch_songs = max(batch_songs, 1)
+        self.classify = classify
+        self.failed = failed
+        self.ready = ready
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._stopping = False
+        self.rounds = 0
+        self.songs = 0
+        self.busy_seconds = 0.0
+
+    def wake(self):
+        """Start the runner if needed and have it check the queue now."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stopping = False
+                self._thread = threading.Thread(target=self._run, name='job-runner', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def resume(self):
+        """Start the runner if songs are waiting to be classified."""
+        try:
+            if self.store.has_queued():
+                self.wake()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not check the job queue: {e}")
+
+    def stop(self, timeout: float):
+        """Stop after the current round; songs it does not finish in ``timeout`` are queued again later."""
+        with self._lock:
+            thread = self._thread
+            self._stopping = True
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        next_expiry = 0.0
+        while not self._stopping:
+            if time.monotonic() >= next_expiry:
+                next_expiry = time.monotonic() + self.EXPIRE_EVERY_SECONDS
+                try:
+                    expired = self.store.expire()
+                    if expired:
+                        logger.info(f"Deleted {expired} expired classification jobs")
+                except (OSError, sqlite3.Error) as e:
+                    logger.warning(f"Job expiry failed: {e}")
+            try:
+                worked = self.run_once()
+            except Exception as e:
+                logger.error(f"Job runner error: {e}")
+                worked = False
+            if not worked:
+                self._wake.wait(self.IDLE_SECONDS)
+                self._wake.clear()
+
+    def run_once(self) -> bool:
+        """Classify one round of queued songs; False if there were none."""
+        if not self.ready():
+            return False
+        claimed = self.store.claim(self.batch_songs, os.getpid())
+        if not claimed:
+            return False
+        
+        started = time.perf_counter()
+        finished = []
+        groups = {True: [], False: []}
+        for job_id, index, song_id, mode, content_key, sample_rate in claimed:
+            try:
+                audio = self.store.load_audio(job_id, index)
+            except (OSError, ValueError) as e:
+                finished.append((job_id, index, self.failed(song_id, f'Uploaded audio is missing: {e}')))
+                continue
+            # PCM uploads are analysed like /classify, decoded files like /classify_audio_file
+            groups[mode == 'window'].append(((job_id, index), (song_id, content_key, audio, sample_rate)))
+        
+        try:
+            for fit_to_window, group in groups.items():
+                if group:
+                    results = self.classify([song for _, song in group], fit_to_window)
+                    finished += [(job_id, index, result) for ((job_id, index), _), result in zip(group, results)]
+        except Exception as e:
+            logger.error(f"Error classifying job songs: {e}")
+            done = {(job_id, index) for job_id, index, _ in finished}
+            finished += [
+                (job_id, index, self.failed(song_id, str(e)))
+                for job_id, index, song_id, *_ in claimed if (job_id, index) not in done
+            ]
+        self.store.finish(finished)
+        
+        with self._lock:
+            self.rounds += 1
+            self.songs += len(claimed)
+            self.busy_seconds += time.perf_counter() - started
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running = self._thread is not None and self._thread.is_alive()
+            rounds, songs, busy = self.rounds, self.songs, self.busy_seconds
+        return {
+            'runner_active': running,
+            'batch_songs': self.batch_songs,
+            'rounds': rounds,
+            'songs_classified': songs,
+            'songs_per_second': round(songs / busy, 2) if busy else 0.0,
+            **self.store.stats()
+        }
+
+class EventStreamLimit:
+    """
+    Bounds the job event streams a process serves at once. Each stream holds
+    a request thread until its job completes, and a pre-forked server worker
+    has only a few, so without a bound a handful of subscribers would leave
+    none for classification requests. A stream beyond the limit is turned
+    away with 429; the client can poll the job's results instead.
+    """
+
+    RETRY_AFTER = 15
+
+    def __init__(self, limit: int):
+        self.limit = max(limit, 0)
+        self._lock = threading.Lock()
+        self.open = 0
+        self.rejected = 0
+
+    def try_open(self) -> bool:
+        with self._lock:
+            if self.limit and self.open >= self.limit:
+                self.rejected += 1
+                return False
+            self.open += 1
+        return True
+
+    def close(self):
+        with self._lock:
+            self.open -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'open': self.open, 'limit': self.limit, 'rejected': self.rejected}
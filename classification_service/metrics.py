@@ -0,0 +1,539 @@
+"""
+Request metrics served on /metrics and /performance, per-request stage
+timings (X-Debug-Timing) and sampled request profiles.
+"""
+
+import bisect
+import cProfile
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class RequestTimings:
+    """
+    Per-request stage timers, reported when a client sends X-Debug-Timing.
+
+    Stages only record on a thread that called start(), i.e. while serving a
+    request that asked for timings. Time spent in one stage name adds up, so
+    a batch reports the sum over its songs. Extraction workers time their own
+    stages and send them back with the features.
+    """
+
+    # Stages measured inside feature extraction, reported under 'extraction'
+    EXTRACTION_STAGES = frozenset((
+        'resample', 'stft', 'spectral_shape', 'zcr', 'mfcc', 'flatness', 'chroma', 'tonnetz', 'beat_track',
+        'contrast', 'hpss', 'first_tier'
+    ))
+
+    def __init__(self):
+        self._local = threading.local()
+
+    @property
+    def active(self) -> bool:
+        return getattr(self._local, 'stages', None) is not None
+
+    def start(self):
+        self._local.stages = {}
+
+    def stop(self) -> Optional[Dict[str, float]]:
+        """End timing on this thread and return the seconds per stage."""
+        stages = getattr(self._local, 'stages', None)
+        self._local.stages = None
+        return stages
+
+    def record(self, stage: str, seconds: float):
+        stages = getattr(self._local, 'stages', None)
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    def add(self, stages: Dict[str, float]):
+        for stage, seconds in stages.items():
+            self.record(stage, seconds)
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - started)
+
+    @classmethod
+    def report(cls, stages: Dict[str, float], total_seconds: float) -> Dict[str, Any]:
+        """Milliseconds per stage, with the extraction stages nested under 'extraction'."""
+        timings = {'total_ms': round(total_seconds * 1000, 3)}
+        extraction = {}
+        for stage, seconds in stages.items():
+            (extraction if stage in cls.EXTRACTION_STAGES else timings)[f'{stage}_ms'] = round(seconds * 1000, 3)
+        if extraction:
+            timings['extraction'] = extraction
+        return timings
+
+request_timings = RequestTimings()
+
+class LatencyHistogram:
+    """
+    Durations in seconds, counted into fixed cumulative-style buckets like a
+    Prometheus histogram. Not locked; ServiceMetrics guards it.
+    """
+
+    # Upper bounds of the buckets, in seconds
+    BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q: float) -> float:
+        """Estimate the q-quantile by interpolating inside its bucket, as Prometheus' histogram_quantile does."""
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                if i == len(self.BUCKETS):
+                    return self.max
+                lower = self.BUCKETS[i - 1] if i else 0.0
+                return min(lower + (self.BUCKETS[i] - lower) * (rank - seen) / n, self.max)
+            seen += n
+        return 0.0
+
+    def state(self) -> Dict[str, Any]:
+        return {'counts': list(self.counts), 'count': self.count, 'total': self.total, 'max': self.max}
+
+    def merge(self, state: Dict[str, Any]):
+        """Add the observations of another histogram's state()."""
+        self.counts = [a + b for a, b in zip(self.counts, state['counts'])]
+        self.count += state['count']
+        self.total += state['total']
+        self.max = max(self.max, state['max'])
+
+    def summary(self) -> Dict[str, Any]:
+        """Count, average, p50/p95/p99 and maximum in milliseconds."""
+        return {
+            'count': self.count,
+            'average_ms': round(self.total / self.count * 1000, 3) if self.count else 0.0,
+            'p50_ms': round(self.quantile(0.5) * 1000, 3),
+            'p95_ms': round(self.quantile(0.95) * 1000, 3),
+            'p99_ms': round(self.quantile(0.99) * 1000, 3),
+            'max_ms': round(self.max * 1000, 3)
+        }
+
+    def prometheus(self, name: str, labels: str) -> List[str]:
+        """Exposition lines (buckets, sum, count) for this histogram under ``name``."""
+        separator = ',' if labels else ''
+        lines = []
+        cumulative = 0
+        for bound, n in zip(self.BUCKETS, self.counts):
+            cumulative += n
+            lines.append(f'{name}_bucket{{{labels}{separator}le="{bound:g}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels}{separator}le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+class ServiceMetrics:
+    """
+    Request and processing-stage metrics shared by all request threads.
+
+    Every update happens under one lock, so counts from concurrent requests
+    are never lost. Per endpoint (the Flask route, so song ids in paths do
+    not create new series) it keeps responses by status, requests in flight,
+    a latency histogram and bytes received and sent. Per stage it keeps a
+    histogram of the time each call took: ``decode`` (audio file, PCM frame
+    or JSON sample list to samples), ``extract`` (feature extraction,
+    including the wait for a worker) and ``inference`` (preprocessing and
+    model). prometheus() renders the text exposition format served on
+    /metrics, snapshot() the JSON view in /performance. state() and
+    merge() carry the raw counts between processes, so pre-forked server
+    workers can report their combined metrics.
+    """
+
+    STAGES = ('decode', 'extract', 'inference')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._stages = {stage: LatencyHistogram() for stage in self.STAGES}
+
+    def _endpoint(self, endpoint: str) -> Dict[str, Any]:
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints[endpoint] = {
+                'responses': {}, 'in_flight': 0, 'latency': LatencyHistogram(), 'bytes_in': 0, 'bytes_out': 0
+            }
+        return stats
+
+    def request_started(self, endpoint: str, bytes_in: int):
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats['in_flight'] += 1
+            stats['bytes_in'] += bytes_in
+
+    def request_finished(self, endpoint: str, status: int, seconds: float, bytes_out: int):
+        with self._lock:
+            stats = self._endpoint(endpoint)
+            stats['in_flight'] -= 1
+            stats['responses'][status] = stats['responses'].get(status, 0) + 1
+            stats['latency'].observe(seconds)
+            stats['bytes_out'] += bytes_out
+
+    def observe_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self._stages[stage].observe(seconds)
+
+    @contextmanager
+    def timed(self, stage: str):
+        """
+        Record the time spent in the ``with`` block under ``stage``, also when
+        it raises, and in the request's timings if it asked for them.
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self.observe_stage(stage, elapsed)
+            request_timings.record(stage, elapsed)
+
+    def clear(self):
+        with self._lock:
+            self._endpoints = {}
+            self._stages = {stage: LatencyHistogram() for stage in self.STAGES}
+
+    def state(self) -> Dict[str, Any]:
+        """Raw counts, JSON-serializable."""
+        with self._lock:
+            return {
+                'endpoints': {
+                    endpoint: {
+                        'responses': {str(status): n for status, n in stats['responses'].items()},
+                        'in_flight': stats['in_flight'],
+                        'latency': stats['latency'].state(),
+                        'bytes_in': stats['bytes_in'],
+                        'bytes_out': stats['bytes_out']
+                    }
+                    for endpoint, stats in self._endpoints.items()
+                },
+                'stages': {stage: histogram.state() for stage, histogram in self._stages.items()}
+            }
+
+    def merge(self, state: Dict[str, Any]):
+        """Add the counts of another process's state()."""
+        with self._lock:
+            for endpoint, other in state['endpoints'].items():
+                stats = self._endpoint(endpoint)
+                for status, n in other['responses'].items():
+                    stats['responses'][int(status)] = stats['responses'].get(int(status), 0) + n
+                stats['in_flight'] += other['in_flight']
+                stats['latency'].merge(other['latency'])
+                stats['bytes_in'] += other['bytes_in']
+                stats['bytes_out'] += other['bytes_out']
+            for stage, other in state['stages'].items():
+                self._stages[stage].merge(other)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self._endpoints.items()):
+                responses = stats['responses']
+                endpoints[endpoint] = {
+                    'requests': sum(responses.values()),
+                    'client_errors': sum(n for status, n in responses.items() if 400 <= status < 500),
+                    'errors': sum(n for status, n in responses.items() if status >= 500),
+                    'responses': {str(status): n for status, n in sorted(responses.items())},
+                    'in_flight': stats['in_flight'],
+                    'latency': stats['latency'].summary(),
+                    'bytes_in': stats['bytes_in'],
+                    'bytes_out': stats['bytes_out']
+                }
+            stages = {stage: histogram.summary() for stage, histogram in self._stages.items()}
+        return {
+            'total_requests': sum(stats['requests'] for stats in endpoints.values()),
+            'in_flight_requests': sum(stats['in_flight'] for stats in endpoints.values()),
+            'endpoints': endpoints,
+            'stages': stages
+        }
+
+    def prometheus(self) -> List[str]:
+        requests, in_flight, latency, bytes_in, bytes_out = [], [], [], [], []
+        with self._lock:
+            for endpoint, stats in sorted(self._endpoints.items()):
+                label = f'endpoint="{prometheus_escape(endpoint)}"'
+                for status, n in sorted(stats['responses'].items()):
+                    requests.append(f'classifier_http_requests_total{{{label},status="{status}"}} {n}')
+                in_flight.append(f'classifier_http_requests_in_flight{{{label}}} {stats["in_flight"]}')
+                latency.extend(stats['latency'].prometheus('classifier_http_request_duration_seconds', label))
+                bytes_in.append(f'classifier_http_request_bytes_total{{{label}}} {stats["bytes_in"]}')
+                bytes_out.append(f'classifier_http_response_bytes_total{{{label}}} {stats["bytes_out"]}')
+            stages = [
+                line for stage, histogram in self._stages.items()
+                for line in histogram.prometheus('classifier_stage_duration_seconds', f'stage="{stage}"')
+            ]
+        return [
+            '# HELP classifier_http_requests_total Requests answered, by endpoint and HTTP status.',
+            '# TYPE classifier_http_requests_total counter',
+            *requests,
+            '# HELP classifier_http_requests_in_flight Requests currently being handled.',
+            '# TYPE classifier_http_requests_in_flight gauge',
+            *in_flight,
+            '# HELP classifier_http_request_duration_seconds Time from receiving a request to sending the last byte.',
+            '# TYPE classifier_http_request_duration_seconds histogram',
+            *latency,
+            '# HELP classifier_http_request_bytes_total Request body bytes received.',
+            '# TYPE classifier_http_request_bytes_total counter',
+            *bytes_in,
+            '# HELP classifier_http_response_bytes_total Response body bytes sent.',
+            '# TYPE classifier_http_response_bytes_total counter',
+            *bytes_out,
+            '# HELP classifier_stage_duration_seconds Time per call spent decoding audio, extracting features and running the model.',
+            '# TYPE classifier_stage_duration_seconds histogram',
+            *stages
+        ]
+
+def prometheus_escape(value: str) -> str:
+    """Escape a Prometheus label value."""
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class WorkerMetrics:
+    """
+    Metrics of every pre-forked server worker, exchanged through files.
+
+    Each worker writes its raw counts (``http.state()`` of its ServiceMetrics
+    and what ``counters()`` returns) to ``<pid>.json`` in ``directory`` every
+    ``WRITE_SECONDS`` and when it exits; the worker that answers /metrics or
+    /performance adds the other workers' files to its own live counts, so
+    their numbers are at most that old. When a worker exits the server folds
+    its file into ``retired.json``, and counters never go backwards as
+    workers are recycled.
+    """
+
+    WRITE_SECONDS = 1.0
+    RETIRED = 'retired.json'
+
+    def __init__(self, directory: str, http: 'ServiceMetrics', counters: Callable[[], Dict[str, int]]):
+        self.directory = directory
+        self.http = http
+        self.counters = counters
+
+    def start_writing(self):
+        """Write this worker's counts periodically from a background thread."""
+        threading.Thread(target=self._write_periodically, name='metrics-writer', daemon=True).start()
+
+    def _write_periodically(self):
+        while True:
+            time.sleep(self.WRITE_SECONDS)
+            self.write()
+
+    def write(self):
+        self._save(f'{os.getpid()}.json', {'http': self.http.state(), 'counters': self.counters()})
+
+    def _save(self, name: str, state: Dict[str, Any]):
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.replace(path + '.tmp', path)
+        except OSError as e:
+            logger.warning(f"Could not write worker metrics: {e}")
+
+    def _load(self, name: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, name)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def others(self) -> List[Dict[str, Any]]:
+        """Saved counts of the other workers, running and retired."""
+        own = f'{os.getpid()}.json'
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return []
+        states = (self._load(name) for name in names if name.endswith('.json') and name != own)
+        return [state for state in states if state is not None]
+
+    def retire(self, pid: int):
+        """Fold the counts of the exited worker ``pid`` into the retired totals."""
+        state = self._load(f'{pid}.json')
+        if state is None:
+            return
+        for stats in state['http']['endpoints'].values():
+            stats['in_flight'] = 0
+        retired = self._load(self.RETIRED) or {'http': {'endpoints': {}, 'stages': {}}, 'counters': {}}
+        http = ServiceMetrics()
+        http.merge(retired['http'])
+        http.merge(state['http'])
+        counters = dict(retired['counters'])
+        for counter, n in state['counters'].items():
+            counters[counter] = counters.get(counter, 0) + n
+        self._save(self.RETIRED, {'http': http.state(), 'counters': counters})
+        try:
+            os.remove(os.path.join(self.directory, f'{pid}.json'))
+        except OSError:
+            pass
+
+class ProfileSampler:
+    """
+    cProfile captures of 1 in ``every`` POST requests, kept on disk as a ring
+    of the newest ``keep`` .prof files (pstats format) in ``directory``.
+
+    A sampled request is profiled on its request thread; extraction workers
+    profile their part of it and send the stats back, and both end up in one
+    file. One request is profiled at a time, so a sample that comes up while
+    another capture is running is skipped. Model calls made on the inference
+    batcher thread are not included.
+    """
+
+    FILE_PATTERN = re.compile(r'^(\d+)-(\d+)-(\d+)-(.+)-(\d+)ms\.prof$')
+
+    def __init__(self, every: int, directory: str, keep: int):
+        self.every = max(every, 0)
+        self.directory = directory
+        self.keep = max(keep, 1)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._capturing = threading.Lock()
+        self._requests = 0
+        self.captured = 0
+        self.skipped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.every > 0 and bool(self.directory)
+
+    @property
+    def active(self) -> bool:
+        """True while the current thread's request is being profiled."""
+        return getattr(self._local, 'profile', None) is not None
+
+    def begin(self) -> bool:
+        """Start profiling the current request if it is the sampled one."""
+        if not self.enabled:
+            return False
+        with self._lock:
+            self._requests += 1
+            if self._requests % self.every:
+                return False
+        if not self._capturing.acquire(blocking=False):
+            with self._lock:
+                self.skipped += 1
+            return False
+        
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (a debugger, or a capture on Python 3.12+) owns the hook
+            self._capturing.release()
+            with self._lock:
+                self.skipped += 1
+            return False
+        self._local.profile = profile
+        self._local.worker_stats = []
+        self._local.started = time.perf_counter()
+        return True
+
+    def add_stats(self, stats: Dict[tuple, tuple]):
+        """Add profile stats an extraction worker captured for the current request."""
+        worker_stats = getattr(self._local, 'worker_stats', None)
+        if worker_stats is not None:
+            worker_stats.append(stats)
+
+    def end(self, endpoint: str):
+        """Stop profiling the current request and write its profile into the ring."""
+        profile = getattr(self._local, 'profile', None)
+        if profile is None:
+            return
+        profile.disable()
+        seconds = time.perf_counter() - self._local.started
+        worker_stats = self._local.worker_stats
+        self._local.profile = self._local.worker_stats = None
+        self._capturing.release()
+        
+        try:
+            stats = pstats.Stats(profile)
+            for saved in worker_stats:
+                stats.add(SavedProfile(saved))
+            with self._lock:
+                self.captured += 1
+                sequence = self.captured
+            slug = re.sub(r'[^\w]+', '_', endpoint).strip('_') or 'root'
+            name = f'{int(time.time() * 1000)}-{os.getpid()}-{sequence:06d}-{slug}-{round(seconds * 1000)}ms.prof'
+            os.makedirs(self.directory, exist_ok=True)
+            stats.dump_stats(os.path.join(self.directory, name))
+            for old in self.profiles()[self.keep:]:
+                os.remove(os.path.join(self.directory, old['name']))
+        except Exception as e:
+            logger.warning(f"Could not save the request profile: {e}")
+
+    def profiles(self) -> List[Dict[str, Any]]:
+        """Saved profiles, newest first."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for name in os.listdir(self.directory):
+            match = self.FILE_PATTERN.match(name)
+            if match is None:
+                continue
+            created_ms, pid, _, endpoint, duration_ms = match.groups()
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            profiles.append({
+                'name': name,
+                'endpoint': endpoint,
+                'duration_ms': int(duration_ms),
+                'created': int(created_ms) / 1000,
+                'pid': int(pid),
+                'bytes': size
+            })
+        profiles.sort(key=lambda profile: (profile['created'], profile['name']), reverse=True)
+        return profiles
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'every': self.every,
+                'directory': self.directory,
+                'keep': self.keep,
+                'captured': self.captured,
+                'skipped': self.skipped
+            }
+
+class SavedProfile:
+    """pstats input for stats captured by cProfile in another process."""
+
+    def __init__(self, stats: Dict[tuple, tuple]):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def peak_memory_bytes() -> Optional[int]:
+    """Peak resident set size of this process, or None without the resource module (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
@@ -0,0 +1,324 @@
+"""
+Pre-fork production server: worker processes forked from a warmed-up server
+process, sharing one listening socket.
+"""
+
+import gc
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+logger = logging.getLogger(__name__)
+
+def limit_native_threads(threads: int, include_numba: bool = True):
+    """
+    Cap the BLAS/OpenMP thread pools of this process (through threadpoolctl,
+    which scikit-learn installs) and, with ``include_numba``, numba's at
+    ``threads``, so server workers sharing the cores do not oversubscribe
+    them. Starting numba's pool starts threads, so a process about to fork
+    leaves it out.
+    """
+    for variable in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'VECLIB_MAXIMUM_THREADS'):
+        os.environ[variable] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(limits=threads)
+    except ImportError:
+        logger.warning("threadpoolctl is not installed; BLAS thread pools are not capped")
+    if include_numba:
+        try:
+            import numba
+            numba.set_num_threads(min(threads, numba.config.NUMBA_NUM_THREADS))
+        except Exception as e:
+            logger.warning(f"Could not cap numba threads: {e}")
+
+class PreforkRequestHandler(WSGIRequestHandler):
+    # One request per connection, so a worker's request count is its connection count
+    protocol_version = 'HTTP/1.0'
+
+class PreforkWorkerServer(BaseWSGIServer):
+    """
+    The HTTP server inside one pre-forked server worker.
+
+    It accepts from the listening socket all workers share and hands each
+    connection to one of ``threads`` request threads. A connection is only
+    accepted while a thread is free, so busy workers leave new ones to idle
+    workers. After ``max_requests`` requests (0 = never), or on retire(), it
+    stops accepting; serve_forever() then returns and drain() waits for the
+    requests still running.
+    """
+
+    multithread = True
+
+    def __init__(self, listener: socket.socket, app, threads: int, max_requests: int):
+        host, port = listener.getsockname()[:2]
+        super().__init__(host, port, app, handler=PreforkRequestHandler, fd=listener.fileno())
+        self.max_requests = max_requests
+        self.handled = 0
+        self.retiring = False
+        self._free_threads = threading.Semaphore(threads)
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='request')
+        self._count_lock = threading.Lock()
+
+    def get_request(self):
+        if not self._free_threads.acquire(timeout=0.5):
+            # socketserver treats OSError as "no connection this time"
+            raise BlockingIOError("No free request thread")
+        try:
+            connection, address = super().get_request()
+        except BaseException:
+            self._free_threads.release()
+            raise
+        # The listening socket is non-blocking; the connection must not be (inherited on BSD/macOS)
+        connection.setblocking(True)
+        return connection, address
+
+    def process_request(self, request, client_address):
+        self._executor.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free_threads.release()
+            with self._count_lock:
+                self.handled += 1
+                recycle = self.max_requests and self.handled == self.max_requests
+            if recycle:
+                logger.info(f"Server worker {os.getpid()} handled {self.handled} requests, recycling it")
+                self.retire()
+
+    def retire(self):
+        """Stop accepting connections; safe to call from a signal handler."""
+        if not self.retiring:
+            self.retiring = True
+            # shutdown() waits for serve_forever(), which may be running on the calling thread
+            threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def drain(self):
+        self._executor.shutdown(wait=True)
+
+class PreforkServer:
+    """
+    Production server: pre-forked worker processes sharing one listening socket.
+
+    The model is loaded and warmed up once in this process; ``workers``
+    server workers are then forked from it and share its memory copy-on-write
+    (the compiled model arrays, numba's compiled code, resampling filters),
+    with the garbage collector's view of it frozen so the pages stay shared.
+    Each worker serves ``threads`` requests at a time with its BLAS/OpenMP
+    and numba pools capped at ``native_threads``, so throughput grows with
+    cores rather than being bound to one interpreter. A worker that has
+    handled about ``max_requests`` requests (plus up to 10%, so workers do
+    not restart together) finishes them and exits, and a fresh fork replaces
+    it; that contains librosa's memory growth. SIGTERM/SIGINT stop the
+    workers gracefully; SIGHUP (also sent by a worker after POST
+    /admin/reload_model) reloads the model here and replaces the workers
+    with forks that serve it, as does a model file change when
+    CLASSIFIER_MODEL_WATCH_SECONDS is set. POSIX only.
+
+    The service hooks in by overriding prepare(), which loads and warms up
+    what the workers inherit, reload_model() and check_model(), which return
+    the outcome of a model reload, and the worker_started(),
+    worker_stopping(), worker_exited() and stopped() notifications.
+    """
+
+    # Workers that exit within this many seconds of starting count as crashing; their restarts are delayed
+    CRASH_SECONDS = 5.0
+
+    def __init__(self, app, host: str, port: int, workers: int, threads: int, max_requests: int,
+                 native_threads: int, graceful_timeout: float, watch_seconds: float = 0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = max(workers, 1)
+        self.threads = max(threads, 1)
+        self.max_requests = max(max_requests, 0)
+        self.native_threads = native_threads
+        self.graceful_timeout = graceful_timeout
+        self.watch_seconds = watch_seconds
+        self.server_pid = os.getpid()
+        self.listener = None
+        self.children = {}
+        self.replacing = set()
+        self.restarts = 0
+        self._stopping = False
+        self._reload_requested = False
+        self._spawn_after = 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'mode': 'prefork',
+            'workers': self.workers,
+            'threads_per_worker': self.threads,
+            'max_requests_per_worker': self.max_requests,
+            'native_threads_per_worker': self.native_threads,
+            'server_pid': self.server_pid,
+            'pid': os.getpid()
+        }
+
+    def request_reload(self):
+        """Ask the server process to reload the model and replace its workers."""
+        os.kill(self.server_pid, signal.SIGHUP)
+
+    def prepare(self):
+        """Load what the workers inherit; runs before the socket is opened and any worker is forked."""
+
+    def reload_model(self) -> Optional[Dict[str, Any]]:
+        """Reload the model on SIGHUP; an outcome with 'changed' set replaces the workers."""
+        return None
+
+    def check_model(self) -> Optional[Dict[str, Any]]:
+        """Reload the model if its file changed; checked every ``watch_seconds``."""
+        return None
+
+    def worker_started(self):
+        """In a new worker, before it accepts its first connection."""
+
+    def worker_stopping(self):
+        """In a worker whose requests have finished, before it exits."""
+
+    def worker_exited(self, pid: int):
+        """In the server process, once worker ``pid`` has exited."""
+
+    def stopped(self):
+        """In the server process, once every worker has stopped."""
+
+    def serve(self):
+        self.prepare()
+        family = socket.AF_INET6 if ':' in self.host else socket.AF_INET
+        self.listener = socket.create_server((self.host, self.port), family=family, backlog=128)
+        # Every worker waits on the socket; the ones that lose the race for a connection must not block
+        self.listener.setblocking(False)
+        signal.signal(signal.SIGTERM, self._stop_signal)
+        signal.signal(signal.SIGINT, self._stop_signal)
+        signal.signal(signal.SIGHUP, self._reload_signal)
+        logger.info(f"Pre-fork server on {self.host}:{self.port}: {self.workers} workers x {self.threads} threads, "
+                    f"{self.native_threads} native threads each, recycled every ~{self.max_requests or 'unlimited'} requests")
+        
+        self._freeze()
+        next_model_check = time.monotonic() + self.watch_seconds
+        try:
+            while not self._stopping:
+                self._reap()
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._replace_workers(self.reload_model())
+                if self.watch_seconds > 0 and time.monotonic() >= next_model_check:
+                    next_model_check = time.monotonic() + self.watch_seconds
+                    self._replace_workers(self.check_model())
+                while (len(self.children) - len(self.replacing) < self.workers and not self._stopping
+                       and time.monotonic() >= self._spawn_after):
+                    self._spawn()
+                time.sleep(0.2)
+        finally:
+            self._stop_workers()
+            self.listener.close()
+            self.stopped()
+        logger.info("Pre-fork server stopped")
+
+    def _stop_signal(self, signum, frame):
+        self._stopping = True
+
+    def _reload_signal(self, signum, frame):
+        self._reload_requested = True
+
+    @staticmethod
+    def _freeze():
+        # Keep the collector from touching (and so copying) the objects the workers inherit
+        gc.collect()
+        gc.freeze()
+
+    def _replace_workers(self, outcome: Optional[Dict[str, Any]]):
+        if outcome is None or not outcome.get('changed'):
+            return
+        self._freeze()
+        self.replacing.update(self.children)
+        for pid in self.children:
+            self._signal(pid, signal.SIGTERM)
+        logger.info(f"Replacing {len(self.replacing)} server workers to serve model {outcome['model_version']}")
+
+    @staticmethod
+    def _signal(pid: int, signum: int):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                status = self._run_worker()
+            except BaseException:
+                logger.exception("Server worker failed")
+            finally:
+                os._exit(status)
+        self.children[pid] = time.monotonic()
+
+    def _reap(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            started = self.children.pop(pid, None)
+            self.replacing.discard(pid)
+            if started is None:
+                continue
+            self.worker_exited(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if self._stopping:
+                continue
+            self.restarts += 1
+            if code != 0:
+                logger.warning(f"Server worker {pid} exited with status {code}")
+                if time.monotonic() - started < self.CRASH_SECONDS:
+                    self._spawn_after = time.monotonic() + 1.0
+
+    def _stop_workers(self):
+        for pid in self.children:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self.children and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        for pid in list(self.children):
+            logger.warning(f"Server worker {pid} did not stop within {self.graceful_timeout:g}s, killing it")
+            self._signal(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self.children.pop(pid)
+
+    def _run_worker(self) -> int:
+        # Ctrl+C reaches the whole process group; the server process decides how workers stop
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        self.children, self.replacing = {}, set()
+        limit_native_threads(self.native_threads)
+        
+        jitter = random.Random(os.getpid()).randint(0, self.max_requests // 10)
+        max_requests = self.max_requests + jitter if self.max_requests else 0
+        server = PreforkWorkerServer(self.listener, self.app, self.threads, max_requests)
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.retire())
+        self.worker_started()
+        logger.info(f"Server worker {os.getpid()} started")
+        
+        server.serve_forever()
+        server.drain()
+        self.worker_stopping()
+        logger.info(f"Server worker {os.getpid()} stopped after {server.handled} requests")
+        return 0
@@ -0,0 +1,319 @@
+"""
+Stores of computed results: the content-addressed result cache and the
+feature store /rescore reads.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import struct
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+class ResultCache:
+    """
+    Content-addressed cache of feature vectors and predictions.
+
+    Entries are addressed by content key (a digest of the uploaded file bytes
+    or of the float32 PCM plus sample rate and analysis mode) and stored under
+    the current model version, so a new model never serves stale predictions. A bounded in-memory LRU sits in
+    front of a SQLite table that survives restarts; either tier can be
+    disabled by configuring it with zero entries / an empty path.
+    ``current_version`` returns the version of the model serving now.
+    """
+
+    def __init__(self, memory_entries: int, disk_path: str, disk_entries: int,
+                 current_version: Callable[[], Optional[str]]):
+        self.memory_entries = max(memory_entries, 0)
+        self.disk_path = disk_path
+        self.disk_entries = max(disk_entries, 0)
+        self.current_version = current_version
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._db = None
+        self._db_lock = threading.Lock()
+        self._disk_puts = 0
+        self.counters = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'disk_errors': 0
+        }
+
+    @property
+    def disk_enabled(self) -> bool:
+        return bool(self.disk_path) and self.disk_entries > 0
+
+    def _connection(self):
+        if self._db is None:
+            Path(self.disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results ('
+                'key TEXT PRIMARY KEY, features BLOB NOT NULL, result TEXT NOT NULL, accessed REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)')
+            self._db.commit()
+        return self._db
+
+    def _count(self, counter: str):
+        with self._memory_lock:
+            self.counters[counter] += 1
+
+    def _remember(self, key: str, entry: tuple):
+        if self.memory_entries == 0:
+            return
+        with self._memory_lock:
+            self._memory[key] = entry
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+                self.counters['memory_evictions'] += 1
+
+    def get(self, content_key: Optional[str]):
+        """Return (features, result) for ``content_key``, or None on a miss."""
+        if content_key is None:
+            return None
+        
+        version = self.current_version()
+        key = f'{version}:{content_key}'
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.counters['memory_hits'] += 1
+                return entry[0], {'model_version': version, **entry[1]}
+        
+        if self.disk_enabled:
+            try:
+                with self._db_lock:
+                    db = self._connection()
+                    row = db.execute('SELECT features, result FROM results WHERE key = ?', (key,)).fetchone()
+                    if row is not None:
+                        db.execute('UPDATE results SET accessed = ? WHERE key = ?', (time.time(), key))
+                        db.commit()
+                if row is not None:
+                    entry = (np.frombuffer(row[0], dtype=np.float32).copy(), json.loads(row[1]))
+                    self._remember(key, entry)
+                    self._count('disk_hits')
+                    # Entries stored before results carried their model version are keyed by it all the same
+                    return entry[0], {'model_version': version, **entry[1]}
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache read failed: {e}")
+                self._count('disk_errors')
+        
+        self._count('misses')
+        return None
+
+    def put(self, content_key: Optional[str], features: np.ndarray, result: Dict[str, Any]):
+        """Store a successful classification; request-specific fields are dropped."""
+        if content_key is None or not result.get('success'):
+            return
+        
+        # Keyed by the model that produced it, which may already have been replaced
+        key = f"{result.get('model_version', self.current_version())}:{content_key}"
+        stored = {name: value for name, value in result.items() if name in CACHED_RESULT_FIELDS}
+        entry = (np.array(features, dtype=np.float32), stored)
+        self._remember(key, entry)
+        self._count('stores')
+        
+        if self.disk_enabled:
+            try:
+                with self._db_lock:
+                    db = self._connection()
+                    db.execute(
+                        'INSERT OR REPLACE INTO results (key, features, result, accessed) VALUES (?, ?, ?, ?)',
+                        (key, entry[0].tobytes(), json.dumps(stored), time.time())
+                    )
+                    self._disk_puts += 1
+                    if self._disk_puts % 256 == 0:
+                        self._evict_disk(db)
+                    db.commit()
+            except sqlite3.Error as e:
+                logger.warning(f"Result cache write failed: {e}")
+                self._count('disk_errors')
+
+    def _evict_disk(self, db):
+        (rows,) = db.execute('SELECT COUNT(*) FROM results').fetchone()
+        excess = rows - self.disk_entries
+        if excess > 0:
+            db.execute(
+                'DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY accessed LIMIT ?)', (excess,)
+            )
+            with self._memory_lock:
+                self.counters['disk_evictions'] += excess
+
+    def stats(self) -> Dict[str, Any]:
+        with self._memory_lock:
+            counters = dict(self.counters)
+            memory_size = len(self._memory)
+        lookups = counters['memory_hits'] + counters['disk_hits'] + counters['misses']
+        hits = counters['memory_hits'] + counters['disk_hits']
+        return {
+            'memory_entries': memory_size,
+            'memory_capacity': self.memory_entries,
+            'disk_enabled': self.disk_enabled,
+            'disk_path': self.disk_path if self.disk_enabled else None,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            **counters
+        }
+
+# Result fields that are stored in the cache (song_id, file_name etc. are per request)
+CACHED_RESULT_FIELDS = ('success', 'prediction', 'confidence', 'probabilities', 'tier', 'model_version')
+
+def audio_content_key(mode: str, audio: np.ndarray, sample_rate: int) -> str:
+    """Content key for PCM audio analysed in ``mode`` ('window' or 'raw')."""
+    digest = hashlib.blake2b(np.ascontiguousarray(audio, dtype=np.float32).data, digest_size=20)
+    digest.update(struct.pack('<I', int(sample_rate)))
+    return f'pcm-{mode}:{digest.hexdigest()}'
+
+def file_content_key(data: bytes) -> str:
+    """Content key for an encoded audio file upload."""
+    return f'file:{hashlib.blake2b(data, digest_size=20).hexdigest()}'
+
+class FeatureStore:
+    """
+    Append-only store of every extracted feature vector, for re-scoring.
+
+    Vectors live in ``features.f32``, a raw float32 matrix with one row per
+    distinct input that is read back through ``np.memmap``; ``index.sqlite3``
+    maps each row to its content key and latest song id and remembers the
+    last prediction so re-scoring can report what changed. ``meta.json``
+    records the column order the rows were written in. Appends hold SQLite's
+    write lock, so pre-forked server workers can share one store. Results
+    that do not name their model are recorded under ``current_version()``.
+    """
+
+    def __init__(self, directory: str, feature_names: List[str], current_version: Callable[[], Optional[str]]):
+        self.directory = Path(directory)
+        self.feature_names = list(feature_names)
+        self.current_version = current_version
+        self.row_bytes = len(self.feature_names) * 4
+        self.features_path = self.directory / 'features.f32'
+        self._lock = threading.Lock()
+        self._db = None
+        self._rows = 0
+
+    def _open(self):
+        """Open the index and repair the matrix after an interrupted append."""
+        if self._db is not None:
+            return self._db
+        
+        self.directory.mkdir(parents=True, exist_ok=True)
+        meta_path = self.directory / 'meta.json'
+        if meta_path.exists():
+            stored_names = json.loads(meta_path.read_text())['feature_names']
+            if stored_names != self.feature_names:
+                raise ValueError(f"Feature store at {self.directory} was written with a different feature layout")
+        else:
+            meta_path.write_text(json.dumps({'feature_names': self.feature_names}))
+        
+        db = sqlite3.connect(str(self.directory / 'index.sqlite3'), check_same_thread=False)
+        db.execute('PRAGMA journal_mode=WAL')
+        db.execute(
+            'CREATE TABLE IF NOT EXISTS rows ('
+            'row INTEGER PRIMARY KEY, content_key TEXT NOT NULL UNIQUE, song_id TEXT, '
+            'prediction TEXT, confidence REAL, model_version TEXT, added REAL NOT NULL)'
+        )
+        db.commit()
+        
+        self.features_path.touch()
+        self._indexed_rows(db)
+        self._db = db
+        return db
+
+    def _indexed_rows(self, db) -> int:
+        """Rows in the index; other processes sharing the store may have added some."""
+        (self._rows,) = db.execute('SELECT COUNT(*) FROM rows').fetchone()
+        return self._rows
+
+    def append(self, entries: List[tuple]):
+        """
+        Store (content_key, song_id, features, result) entries. Inputs that are
+        already stored only get their song id and prediction refreshed.
+        """
+        with self._lock:
+            try:
+                db = self._open()
+                # SQLite's write lock, held until the commit, serializes appends across processes
+                db.execute('BEGIN IMMEDIATE')
+                rows = self._indexed_rows(db)
+                if self.features_path.stat().st_size != rows * self.row_bytes:
+                    # Rows written without an index entry (crash mid-append) are dropped
+                    with open(self.features_path, 'r+b') as f:
+                        f.truncate(rows * self.row_bytes)
+                now = time.time()
+                new_rows = []
+                for content_key, song_id, features, result in entries:
+                    known = db.execute('SELECT row FROM rows WHERE content_key = ?', (content_key,)).fetchone()
+                    if known is not None:
+                        db.execute(
+                            'UPDATE rows SET song_id = ?, prediction = ?, confidence = ?, model_version = ? WHERE row = ?',
+                            (song_id, result.get('prediction'), result.get('confidence'),
+                             result.get('model_version', self.current_version()), known[0])
+                        )
+                        continue
+                    db.execute(
+                        'INSERT INTO rows (row, content_key, song_id, prediction, confidence, model_version, added) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (rows + len(new_rows), content_key, song_id, result.get('prediction'),
+                         result.get('confidence'), result.get('model_version', self.current_version()), now)
+                    )
+                    new_rows.append(np.asarray(features, dtype=np.float32))
+                
+                if new_rows:
+                    with open(self.features_path, 'ab') as f:
+                        f.write(np.stack(new_rows).tobytes())
+                db.commit()
+                self._rows += len(new_rows)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                logger.warning(f"Feature store append failed: {e}")
+                if self._db is not None:
+                    self._db.rollback()
+
+    def matrix(self) -> np.ndarray:
+        """Read-only memory map over every stored row."""
+        with self._lock:
+            rows = self._indexed_rows(self._open())
+        if rows == 0:
+            return np.zeros((0, len(self.feature_names)), dtype=np.float32)
+        return np.memmap(self.features_path, dtype=np.float32, mode='r', shape=(rows, len(self.feature_names)))
+
+    def index(self, start: int, stop: int) -> List[tuple]:
+        """(row, song_id, content_key, prediction) for rows in [start, stop)."""
+        with self._lock:
+            return self._open().execute(
+                'SELECT row, song_id, content_key, prediction FROM rows WHERE row >= ? AND row < ? ORDER BY row',
+                (start, stop)
+            ).fetchall()
+
+    def update_predictions(self, updates: List[tuple], version: str):
+        """Record (prediction, confidence, row) after re-scoring with model ``version``."""
+        with self._lock:
+            db = self._open()
+            db.executemany(
+                'UPDATE rows SET prediction = ?, confidence = ?, model_version = ? WHERE row = ?',
+                [(prediction, confidence, version, row) for prediction, confidence, row in updates]
+            )
+            db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'directory': str(self.directory),
+                'rows': self._rows,
+                'bytes': self._rows * self.row_bytes
+            }
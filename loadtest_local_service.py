@@ -0,0 +1,364 @@
+# Load generator for the Local Music Classification Service
+# Replays the Android app's traffic against a local service and ramps the
+# number of requests in flight, reporting throughput, latency percentiles,
+# errors and the server's memory at every step.
+#
+#   python loadtest_local_service.py                          # start the service, ramp 1..16
+#   python loadtest_local_service.py --url http://pc:5000     # test a running service
+#   python loadtest_local_service.py --scenarios upload --concurrency 8 --duration 60
+#
+# Request shapes, as the app sends them:
+#   upload  AudioFileUploader.uploadAndClassifyFile: the raw audio file as the
+#           body of POST /classify_audio_file, Content-Type audio/ogg whatever
+#           the format, X-Song-ID "<id>_<title>" and X-File-Name headers.
+#           classifySongsParallel runs these 8 at a time, the step at
+#           concurrency 8 is one phone classifying its library.
+#   batch   classifySongsBatch: chunks of 10 songs as JSON to POST
+#           /batch_classify, each {"song_id", "audio_data", "sample_rate": 22050}
+#           with 10 seconds of samples.
+
+import argparse
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+SCENARIOS = ('upload', 'batch')
+FORMATS = ('wav', 'flac', 'ogg', 'mp3')
+BATCH_SIZE = 10            # MusicClassificationRepository.BATCH_SIZE
+BATCH_SAMPLE_RATE = 22050  # SongWithAudioData.sampleRate
+BATCH_SECONDS = 10         # AndroidAudioFeatureExtractor.DURATION_SECONDS
+SERVICE_URL = 'http://127.0.0.1:5000'
+
+def generate_song(index, sample_rate, seconds):
+    """A distinct, deterministic synthetic song: chord changes, a kick and noise, tempo varying with ``index``."""
+    rng = np.random.default_rng(index)
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    root = 110.0 * 2 ** (rng.integers(0, 24) / 12)
+    progression = root * 2 ** (rng.choice([0, 3, 5, 7, 8, 10], size=8) / 12)
+    roots = progression[(t // 2).astype(int) % len(progression)]
+    y = sum(0.12 * np.sin(2 * np.pi * roots * ratio * t) for ratio in (1.0, 1.26, 1.5, 2.0))
+
+    beat = int(sample_rate * 60 / rng.uniform(70, 160))
+    kicks = np.zeros(len(t))
+    kicks[::beat] = 1.0
+    kick = 0.5 * np.exp(-np.arange(2000) / 250.0) * np.sin(2 * np.pi * 55 * np.arange(2000) / sample_rate)
+    y += np.convolve(kicks, kick, mode='same')
+    y += 0.03 * rng.standard_normal(len(t))
+    return np.clip(y, -1, 1).astype(np.float32)
+
+def encode(samples, sample_rate, file_format):
+    import soundfile as sf
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format=file_format.upper())
+    return buffer.getvalue()
+
+def build_corpus(n_songs, seconds, formats):
+    """
+    ``n_songs`` generated songs, each encoded in one of ``formats`` in turn,
+    as (song_id, file_name, file bytes, first 10 s at 22050 Hz) tuples.
+    """
+    corpus = []
+    for index in range(n_songs):
+        sample_rate = (44100, 48000)[index % 2]
+        song = generate_song(index, sample_rate, seconds)
+        file_format = formats[index % len(formats)]
+        file_name = f'loadtest_song_{index:03d}.{file_format}'
+        clip = generate_song(index, BATCH_SAMPLE_RATE, BATCH_SECONDS)
+        corpus.append((f'{index}_Load Test Song {index}', file_name, encode(song, sample_rate, file_format), clip))
+    return corpus
+
+def upload_request(base_url, song):
+    song_id, file_name, data, _ = song
+    return urllib.request.Request(f'{base_url}/classify_audio_file', data=data, method='POST', headers={
+        'Content-Type': 'audio/ogg',
+        'X-Song-ID': song_id.encode('utf-8').decode('latin-1'),
+        'X-File-Name': file_name
+    }), 1
+
+def batch_body(songs):
+    return json.dumps({'songs': [
+        {'song_id': song_id, 'audio_data': clip.tolist(), 'sample_rate': BATCH_SAMPLE_RATE}
+        for song_id, _, _, clip in songs
+    ]}).encode('utf-8')
+
+def send(request, timeout):
+    """Send ``request``; return (seconds, error or None, songs that failed inside a 200 response)."""
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        e.read()
+        return time.perf_counter() - started, f'HTTP {e.code}', 0
+    except (urllib.error.URLError, OSError, ValueError) as e:
+        return time.perf_counter() - started, type(getattr(e, 'reason', e)).__name__, 0
+    elapsed = time.perf_counter() - started
+
+    if 'summary' in body:
+        return elapsed, None, body['summary'].get('failed', 0)
+    if not body.get('success', False):
+        return elapsed, 'success=false', 0
+    return elapsed, None, 0
+
+class MemorySampler:
+    """
+    Peak resident memory of the service and its extraction workers while a
+    step runs, read from /proc (Linux only; None elsewhere or without a pid).
+    """
+
+    def __init__(self, pid):
+        self.pid = pid
+        self.peak = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _tree(self, pid):
+        pids = [pid]
+        try:
+            for task in os.listdir(f'/proc/{pid}/task'):
+                with open(f'/proc/{pid}/task/{task}/children') as f:
+                    for child in f.read().split():
+                        pids.extend(self._tree(int(child)))
+        except OSError:
+            pass
+        return pids
+
+    def rss_bytes(self):
+        if self.pid is None:
+            return None
+        total = 0
+        for pid in self._tree(self.pid):
+            try:
+                with open(f'/proc/{pid}/status') as f:
+                    for line in f:
+                        if line.startswith('VmRSS:'):
+                            total += int(line.split()[1]) * 1024
+            except OSError:
+                continue
+        return total or None
+
+    def _run(self):
+        while not self._stop.wait(0.25):
+            rss = self.rss_bytes()
+            if rss is not None:
+                self.peak = max(self.peak or 0, rss)
+
+    def __enter__(self):
+        self.peak = self.rss_bytes()
+        if self.peak is not None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+def reported_peak_memory(base_url):
+    """The service's own peak RSS from /performance, for services this tool did not start."""
+    try:
+        with urllib.request.urlopen(f'{base_url}/performance', timeout=10) as response:
+            return json.loads(response.read())['local_specs'].get('peak_memory_mb')
+    except (urllib.error.URLError, OSError, ValueError, KeyError):
+        return None
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+def run_step(base_url, scenario, concurrency, duration, corpus, batch_bodies, timeout, server_pid):
+    """
+    Keep ``concurrency`` requests of ``scenario`` in flight for ``duration``
+    seconds, let the last ones finish, and summarize them.
+    """
+    lock = threading.Lock()
+    latencies, errors = [], {}
+    counters = {'requests': 0, 'songs': 0, 'failed_songs': 0, 'next': 0}
+    deadline = time.perf_counter() + duration
+
+    def client():
+        while time.perf_counter() < deadline:
+            with lock:
+                index = counters['next']
+                counters['next'] += 1
+            if scenario == 'upload':
+                request, n_songs = upload_request(base_url, corpus[index % len(corpus)])
+            else:
+                request = urllib.request.Request(
+                    f'{base_url}/batch_classify', data=batch_bodies[index % len(batch_bodies)],
+                    method='POST', headers={'Content-Type': 'application/json; charset=utf-8'}
+                )
+                n_songs = BATCH_SIZE
+            elapsed, error, failed_songs = send(request, timeout)
+            with lock:
+                counters['requests'] += 1
+                if error is None:
+                    latencies.append(elapsed)
+                    counters['songs'] += n_songs - failed_songs
+                    counters['failed_songs'] += failed_songs
+                else:
+                    errors[error] = errors.get(error, 0) + 1
+                    counters['failed_songs'] += n_songs
+
+    started = time.perf_counter()
+    with MemorySampler(server_pid) as sampler:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for _ in range(concurrency):
+                pool.submit(client)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    n_errors = sum(errors.values())
+    if sampler.peak is not None:
+        rss_mb = round(sampler.peak / 2**20, 1)
+    else:
+        rss_mb = reported_peak_memory(base_url)
+    return {
+        'scenario': scenario,
+        'concurrency': concurrency,
+        'seconds': round(elapsed, 2),
+        'requests': counters['requests'],
+        'errors': errors,
+        'error_rate': round(n_errors / counters['requests'], 4) if counters['requests'] else None,
+        'failed_songs': counters['failed_songs'],
+        'requests_per_second': round((counters['requests'] - n_errors) / elapsed, 3),
+        'songs_per_second': round(counters['songs'] / elapsed, 3),
+        'latency_ms': {
+            name: round(percentile(latencies, q) * 1000, 1) if latencies else None
+            for name, q in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99))
+        },
+        'peak_rss_mb': rss_mb
+    }
+
+def start_service(args):
+    """Start local_music_classification_service.py and wait until GET /ready answers 200."""
+    env = dict(os.environ)
+    if not args.keep_caches:
+        # Every request should do the work: repeated songs would otherwise be cache hits
+        env.update({'CLASSIFIER_CACHE_ENTRIES': '0', 'CLASSIFIER_CACHE_PATH': '', 'CLASSIFIER_FEATURE_STORE_DIR': ''})
+    if args.workers is not None:
+        env['CLASSIFIER_SERVER_WORKERS' if args.production else 'CLASSIFIER_WORKERS'] = str(args.workers)
+    service_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_music_classification_service.py')
+    log = open(args.service_log, 'w') if args.service_log else subprocess.DEVNULL
+    command = [sys.executable, service_path] + (['--production'] if args.production else [])
+    process = subprocess.Popen(command, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"The service exited with status {process.returncode}"
+                               + (f", see {args.service_log}" if args.service_log else ""))
+        try:
+            with urllib.request.urlopen(f'{SERVICE_URL}/ready', timeout=2) as response:
+                if response.status == 200:
+                    return process
+        except (urllib.error.URLError, OSError):
+            pass
+        time.sleep(0.5)
+    process.terminate()
+    raise RuntimeError(f"The service was not ready within {args.startup_timeout:g}s")
+
+def print_step(step):
+    latency = step['latency_ms']
+    errors = ', '.join(f'{count} {error}' for error, count in step['errors'].items()) or '-'
+    rss = f"{step['peak_rss_mb']:.0f}" if step['peak_rss_mb'] is not None else '?'
+    print(f"   {step['scenario']:<7} x{step['concurrency']:<3} {step['requests']:>6} req "
+          f"{step['requests_per_second']:>8.2f} req/s {step['songs_per_second']:>8.2f} songs/s  "
+          f"p50 {latency['p50'] or 0:>8.0f} p95 {latency['p95'] or 0:>8.0f} p99 {latency['p99'] or 0:>8.0f} ms  "
+          f"errors {step['error_rate'] or 0:>6.1%} ({errors})  rss {rss} MB")
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the Android app's traffic against the local service")
+    parser.add_argument('--url', help=f'service to test (default: start one at {SERVICE_URL})')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--concurrency', nargs='+', type=int, default=[1, 2, 4, 8, 16],
+                        help='requests in flight at each ramp step')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds per step')
+    parser.add_argument('--songs', type=int, default=24, help='distinct generated songs')
+    parser.add_argument('--song-seconds', type=float, default=60.0, help='length of each generated song')
+    parser.add_argument('--formats', nargs='+', choices=FORMATS, default=list(FORMATS))
+    parser.add_argument('--timeout', type=float, default=300.0, help='per-request timeout in seconds')
+    parser.add_argument('--max-error-rate', type=float, default=0.01,
+                        help='steps above this error rate do not count towards capacity')
+    parser.add_argument('--output', default='loadtest_results.json', help='where to write the results')
+    parser.add_argument('--production', action='store_true',
+                        help='start the service in production mode (pre-forked server workers)')
+    parser.add_argument('--workers', type=int,
+                        help='CLASSIFIER_WORKERS for a started service (server workers with --production)')
+    parser.add_argument('--keep-caches', action='store_true',
+                        help='leave the result cache and feature store of a started service on')
+    parser.add_argument('--service-log', help='file for the started service output')
+    parser.add_argument('--startup-timeout', type=float, default=300.0)
+    args = parser.parse_args()
+
+    print(f"🎵 Generating {args.songs} songs ({', '.join(args.formats)})...")
+    corpus = build_corpus(args.songs, args.song_seconds, args.formats)
+    batch_bodies = []
+    if 'batch' in args.scenarios:
+        chunks = [corpus[i:i + BATCH_SIZE] for i in range(0, len(corpus), BATCH_SIZE)]
+        batch_bodies = [batch_body(chunk) for chunk in chunks if len(chunk) == BATCH_SIZE] or [batch_body(corpus)]
+
+    process = None
+    base_url = (args.url or SERVICE_URL).rstrip('/')
+    if args.url is None:
+        print("🚀 Starting the service...")
+        process = start_service(args)
+
+    steps = []
+    try:
+        print(f"📈 Ramping {args.concurrency} for {args.duration:g}s per step")
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                step = run_step(base_url, scenario, concurrency, args.duration, corpus, batch_bodies,
+                                args.timeout, process.pid if process is not None else None)
+                print_step(step)
+                steps.append(step)
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    capacity = {}
+    for scenario in args.scenarios:
+        healthy = [step for step in steps if step['scenario'] == scenario
+                   and step['error_rate'] is not None and step['error_rate'] <= args.max_error_rate]
+        if healthy:
+            best = max(healthy, key=lambda step: step['songs_per_second'])
+            capacity[scenario] = {key: best[key] for key in ('concurrency', 'songs_per_second', 'latency_ms')}
+
+    report = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'url': base_url,
+        'cpu_count': os.cpu_count(),
+        'settings': {key: getattr(args, key) for key in
+                     ('scenarios', 'concurrency', 'duration', 'songs', 'song_seconds', 'formats',
+                      'production', 'workers')},
+        'steps': steps,
+        'capacity': capacity
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    print()
+    for scenario, best in capacity.items():
+        print(f"✅ {scenario}: {best['songs_per_second']:.2f} songs/s at {best['concurrency']} in flight "
+              f"(p95 {best['latency_ms']['p95']:.0f} ms)")
+    print(f"📊 Results written to {args.output}")
+
+if __name__ == "__main__":
+    main()
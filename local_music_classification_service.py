@@ -2,7 +2,7 @@
 # Run this on your PC for reliable hosting
 
 # Install dependencies first:
-# pip install flask flask-cors librosa soundfile scikit-learn joblib pandas numpy
+# pip install flask flask-cors librosa soundfile soxr scikit-learn joblib numpy
 
 import os
 import sys
@@ -12,20 +12,46 @@ import traceback
 import time
 from pathlib import Path
 from typing import Dict, List, Any, Optional
+# Measured from here so /health can report how long startup took
+STARTUP_STARTED = time.perf_counter()
 import numpy as np
 import joblib
-import librosa
-import soundfile as sf
-import pandas as pd
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 from werkzeug.exceptions import BadRequest
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from werkzeug.wsgi import ClosingIterator
 import threading
-from queue import Queue
+import bisect
+from queue import Queue, Empty
+from concurrent.futures import Future
 import multiprocessing as mp
+from multiprocessing import shared_memory
+import atexit
 import tempfile
 import base64
+import io
+import shutil
+import subprocess
+import struct
+from numpy.lib.stride_tricks import sliding_window_view
+import hashlib
+import cProfile
+import pstats
+import hmac
+import uuid
+import argparse
+import math
+import socket
+from collections import deque
+from contextlib import contextmanager
+
+from classification_service.jobs import EventStreamLimit, JobRunner, JobStore
+from classification_service.metrics import (
+    LatencyHistogram, ProfileSampler, RequestTimings, ServiceMetrics, WorkerMetrics, peak_memory_bytes,
+    prometheus_escape, request_timings
+)
+from classification_service.prefork import PreforkServer, limit_native_threads
+from classification_service.storage import FeatureStore, ResultCache, audio_content_key, file_content_key
 
 # Setup logging
 logging.basicConfig(
@@ -40,367 +66,2820 @@ CORS(app)
 
 # Global variables
 model_data = None
+model_version = None
 feature_extractor = None
-MAX_WORKERS = min(4, mp.cpu_count())
-thread_pool = ThreadPoolExecutor(max_workers=MAX_WORKERS)
-request_count = 0
+extraction_pool = None
+feature_store = None
+
+def parse_server_options(argv: List[str]) -> argparse.Namespace:
+    """How to serve: command line flags, falling back to CLASSIFIER_* environment variables."""
+    parser = argparse.ArgumentParser(description='Local Music Classification Service')
+    parser.add_argument('--production', action='store_true',
+                        default=os.environ.get('CLASSIFIER_SERVER', 'development') == 'prefork',
+                        help='serve from pre-forked worker processes (CLASSIFIER_SERVER=prefork) '
+                             'instead of the Flask development server')
+    parser.add_argument('--host', default=os.environ.get('CLASSIFIER_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('CLASSIFIER_PORT', 5000)))
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('CLASSIFIER_SERVER_WORKERS', mp.cpu_count())),
+                        help='server worker processes in production mode')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('CLASSIFIER_SERVER_THREADS', 4)),
+                        help='request threads per server worker')
+    parser.add_argument('--max-requests', type=int, default=int(os.environ.get('CLASSIFIER_SERVER_MAX_REQUESTS', 1000)),
+                        help='requests a server worker handles before it is replaced (0 = never)')
+    parser.add_argument('--native-threads', type=int, default=int(os.environ.get('CLASSIFIER_NATIVE_THREADS', 0)),
+                        help='BLAS/OpenMP/numba threads per server worker (0 = cores / workers)')
+    parser.add_argument('--graceful-timeout', type=float,
+                        default=float(os.environ.get('CLASSIFIER_SERVER_GRACEFUL_TIMEOUT', 30)),
+                        help='seconds a stopping worker gets to finish its requests')
+    return parser.parse_args(argv)
+
+# Serving options; flags only apply when this file is run, not when it is imported
+SERVER_OPTIONS = parse_server_options(sys.argv[1:] if __name__ == '__main__' else [])
+PREFORK = __name__ == '__main__' and SERVER_OPTIONS.production
+if PREFORK and not hasattr(os, 'fork'):
+    logger.warning("Production mode needs os.fork, which this platform lacks; using the development server")
+    PREFORK = False
+# BLAS/OpenMP/numba threads per server worker; by default the workers split the cores between them
+NATIVE_THREADS = SERVER_OPTIONS.native_threads or max(1, mp.cpu_count() // max(SERVER_OPTIONS.workers, 1))
+# Feature extraction worker processes (0 = extract inline on the request thread). Pre-forked
+# server workers always extract inline: each of them is already a process of its own
+MAX_WORKERS = 0 if PREFORK else int(os.environ.get('CLASSIFIER_WORKERS', mp.cpu_count()))
+TASK_TIMEOUT = float(os.environ.get('CLASSIFIER_TASK_TIMEOUT', 120))
+WORKER_MAX_TASKS = int(os.environ.get('CLASSIFIER_WORKER_MAX_TASKS', 500))
+WORKER_START_METHOD = os.environ.get('CLASSIFIER_WORKER_START_METHOD', 'spawn')
+# Micro-batching of single-song inference (window 0 = predict each row immediately)
+BATCH_WINDOW_MS = float(os.environ.get('CLASSIFIER_BATCH_WINDOW_MS', 5))
+MAX_BATCH_ROWS = int(os.environ.get('CLASSIFIER_MAX_BATCH_ROWS', 64))
+# Warm-up of every extraction and inference path before /ready reports ready (0 = skip), and its sample rates
+WARMUP = os.environ.get('CLASSIFIER_WARMUP', '1') != '0'
+WARMUP_SAMPLE_RATES = [
+    int(rate) for rate in os.environ.get('CLASSIFIER_WARMUP_SAMPLE_RATES', '16000,22050,44100,48000').split(',') if rate
+]
+# Resampling filter tier for PCM that is not at 22050 Hz ('vhq', 'hq' or 'mq')
+RESAMPLE_QUALITY = os.environ.get('CLASSIFIER_RESAMPLE_QUALITY', 'hq')
+# Two-tier cascade: first-tier confidence needed to skip the expensive features (0 = off) and its model file
+CASCADE_THRESHOLD = float(os.environ.get('CLASSIFIER_CASCADE_THRESHOLD', 0.9))
+CASCADE_MODEL_PATH = os.environ.get(
+    'CLASSIFIER_CASCADE_MODEL',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'cascade_first_tier.joblib')
+)
+# Result cache: in-memory LRU entries, SQLite file (empty = no disk tier) and its row limit
+CACHE_MEMORY_ENTRIES = int(os.environ.get('CLASSIFIER_CACHE_ENTRIES', 4096))
+CACHE_PATH = os.environ.get(
+    'CLASSIFIER_CACHE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache', 'classification_cache.sqlite3')
+)
+CACHE_DISK_ENTRIES = int(os.environ.get('CLASSIFIER_CACHE_DISK_ENTRIES', 200000))
+# Decoder for uploads libsndfile cannot read (empty = none) and its time limit
+FFMPEG_PATH = os.environ.get('CLASSIFIER_FFMPEG', shutil.which('ffmpeg') or '')
+DECODE_TIMEOUT = float(os.environ.get('CLASSIFIER_DECODE_TIMEOUT', 60))
+# Decode /classify_audio_file bodies as they arrive, keeping at most this many leading bytes
+STREAM_UPLOADS = os.environ.get('CLASSIFIER_STREAM_UPLOADS', '1') != '0'
+STREAM_HEAD_BYTES = int(os.environ.get('CLASSIFIER_STREAM_HEAD_BYTES', 16 * 1024 * 1024))
+# Only extract the features the model (and cascade first tier) reads; stored rows then need re-extraction
+SKIP_UNUSED_FEATURES = os.environ.get('CLASSIFIER_SKIP_UNUSED_FEATURES', '0') == '1'
+# Compiled models, memory-mapped at startup instead of unpickling scikit-learn (empty = disabled)
+COMPILED_MODEL_DIR = os.environ.get(
+    'CLASSIFIER_COMPILED_MODEL_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models', 'compiled')
+)
+# Seconds between checks of the model file for a new version to hot-reload (0 = only POST /admin/reload_model)
+MODEL_WATCH_SECONDS = float(os.environ.get('CLASSIFIER_MODEL_WATCH_SECONDS', 0))
+# Token admin endpoints require in X-Admin-Token (empty = only accept requests from localhost)
+ADMIN_TOKEN = os.environ.get('CLASSIFIER_ADMIN_TOKEN', '')
+# cProfile 1 in N POST requests (0 = off), where the profiles go and how many are kept
+PROFILE_EVERY = int(os.environ.get('CLASSIFIER_PROFILE_EVERY', 0))
+PROFILE_DIR = os.environ.get(
+    'CLASSIFIER_PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'profiles')
+)
+PROFILE_KEEP = int(os.environ.get('CLASSIFIER_PROFILE_KEEP', 50))
+# Admission control: requests admitted per traffic class before new ones are turned away with 429
+# (0 = unlimited), concurrent units of work (0 = twice the extraction workers) and how many
+# interactive units get a free slot for every bulk one
+ADMIT_INTERACTIVE = int(os.environ.get('CLASSIFIER_ADMIT_INTERACTIVE', 32))
+ADMIT_BULK = int(os.environ.get('CLASSIFIER_ADMIT_BULK', 2))
+WORK_SLOTS = int(os.environ.get('CLASSIFIER_WORK_SLOTS', 0)) or 2 * max(MAX_WORKERS, 1)
+INTERACTIVE_WEIGHT = int(os.environ.get('CLASSIFIER_INTERACTIVE_WEIGHT', 4))
+# Persistent feature store used by /rescore (empty = disabled)
+FEATURE_STORE_DIR = os.environ.get(
+    'CLASSIFIER_FEATURE_STORE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'feature_store')
+)
+# Asynchronous classification jobs: where their state and uploaded audio are kept (empty = disabled),
+# songs per job manifest, songs classified per scheduling round (0 = four per extraction worker)
+# and hours finished jobs are kept
+JOBS_DIR = os.environ.get(
+    'CLASSIFIER_JOBS_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'jobs')
+)
+JOB_MAX_SONGS = int(os.environ.get('CLASSIFIER_JOB_MAX_SONGS', 50000))
+JOB_BATCH_SONGS = int(os.environ.get('CLASSIFIER_JOB_BATCH_SONGS', 0)) or 4 * max(MAX_WORKERS, 1)
+JOB_RETENTION_HOURS = float(os.environ.get('CLASSIFIER_JOB_RETENTION_HOURS', 72))
+# Each job event stream holds a request thread until its job completes
+JOB_EVENT_STREAMS = int(os.environ.get('CLASSIFIER_JOB_EVENT_STREAMS', max(SERVER_OPTIONS.threads // 2, 1)))
 start_time = time.time()
+startup_info = {}
+warm_up_state = {'ready': False, 'stage': 'loading model'}
+
+# Canonical feature order produced by the extractor (matches the training script)
+FEATURE_NAMES = [
+    'signal_length_ratio', 'rms_energy_ratio', 'spectral_centroid_mean', 'spectral_centroid_std',
+    'spectral_centroid_skew', 'spectral_rolloff_mean', 'spectral_rolloff_std', 'spectral_bandwidth_mean',
+    'spectral_bandwidth_std', 'zcr_mean', 'zcr_std', 'mfcc_1_mean', 'mfcc_1_std', 'mfcc_2_mean',
+    'mfcc_2_std', 'mfcc_3_mean', 'mfcc_3_std', 'mfcc_4_mean', 'mfcc_4_std', 'mfcc_5_mean', 'mfcc_5_std',
+    'mfcc_6_mean', 'mfcc_6_std', 'mfcc_7_mean', 'mfcc_7_std', 'mfcc_8_mean', 'mfcc_8_std', 'mfcc_9_mean',
+    'mfcc_9_std', 'mfcc_10_mean', 'mfcc_10_std', 'mfcc_11_mean', 'mfcc_11_std', 'mfcc_12_mean', 'mfcc_12_std',
+    'mfcc_13_mean', 'mfcc_13_std', 'chroma_mean', 'chroma_std', 'chroma_bin_0', 'chroma_bin_1', 'chroma_bin_2',
+    'chroma_bin_3', 'chroma_bin_4', 'chroma_bin_5', 'chroma_bin_6', 'chroma_bin_7', 'chroma_bin_8', 'chroma_bin_9',
+    'chroma_bin_10', 'chroma_bin_11', 'tonnetz_mean', 'tonnetz_std', 'tempo', 'beat_strength',
+    'spectral_contrast_mean', 'spectral_contrast_std', 'spectral_flatness_mean', 'spectral_flatness_std',
+    'dynamic_range', 'peak_to_rms_ratio', 'harmonic_ratio', 'percussive_ratio', 'spectral_centroid_normalized',
+    'silence_ratio'
+]
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+# Features behind the expensive extractors (HPSS, beat tracking, chroma/tonnetz,
+# spectral contrast); the cascade's first tier classifies without them
+DEFERRED_FEATURES = [
+    'chroma_mean', 'chroma_std', 'chroma_bin_0', 'chroma_bin_1', 'chroma_bin_2', 'chroma_bin_3', 'chroma_bin_4',
+    'chroma_bin_5', 'chroma_bin_6', 'chroma_bin_7', 'chroma_bin_8', 'chroma_bin_9', 'chroma_bin_10',
+    'chroma_bin_11', 'tonnetz_mean', 'tonnetz_std', 'tempo', 'beat_strength', 'spectral_contrast_mean',
+    'spectral_contrast_std', 'harmonic_ratio', 'percussive_ratio'
+]
+DEFERRED_SLOTS = np.array([FEATURE_INDEX[name] for name in DEFERRED_FEATURES], dtype=np.intp)
+
+def skewness(data):
+    """Calculate skewness of data."""
+    mean = np.mean(data)
+    std = np.std(data)
+    if std == 0:
+        return 0.0
+    return np.mean(((data - mean) / std) ** 3)
+
+def median_filter_axis(S: np.ndarray, width: int, axis: int, block: int = 64) -> np.ndarray:
+    """
+    Running median of a 2-D array along one axis, with the edges mirrored like
+    scipy.ndimage.median_filter(mode='reflect'); the output is identical.
+
+    The windows are strided views partitioned ``block`` columns at a time,
+    which keeps the temporary copy small enough to stay in cache. Axes no
+    longer than half the window (clips of a few frames) mirror differently
+    under np.pad, so those go to scipy directly.
+    """
+    half = width // 2
+    if S.shape[axis] <= half:
+        from scipy.ndimage import median_filter
+        return median_filter(S, size=(width, 1) if axis == 0 else (1, width), mode='reflect')
+    if axis == 1:
+        return median_filter_axis(np.ascontiguousarray(S.T), width, 0, block).T
+    padded = np.pad(S, [(half, half), (0, 0)], mode='symmetric')
+    out = np.empty_like(S)
+    for start in range(0, S.shape[1], block):
+        windows = sliding_window_view(padded[:, start:start + block], width, axis=0)
+        out[:, start:start + block] = np.partition(windows, half, axis=-1)[..., half]
+    return out
+
+def features_to_dict(vector: np.ndarray, feature_names: List[str]) -> Dict[str, float]:
+    """
+    Build named features for a JSON response from a feature vector in model
+    column order. Features the cascade never computed (NaN) are left out.
+    """
+    return {name: float(value) for name, value in zip(feature_names, vector) if not np.isnan(value)}
+
+class SpectralFeatureEngine:
+    """
+    Computes all 65 features from a single STFT per clip.
+
+    The complex STFT is taken once; the magnitude spectrogram feeds centroid,
+    rolloff, bandwidth, contrast and flatness, the power spectrogram feeds
+    chroma and the mel spectrogram, and the log-mel spectrogram is shared by
+    the MFCCs and the onset envelope used for beat tracking. The HPSS energy
+    ratios come straight from the magnitude spectrogram (see hpss_energy).
+
+    extract_cheap_into and extract_deferred_into split the work for the
+    classification cascade: the deferred half holds the expensive extractors
+    and reuses the spectrograms of the cheap half.
+
+    Extractors listed in SKIPPABLE_GROUPS can be left out with ``skip``; their
+    columns are set to NaN.
+
+    Parity with the previous per-feature librosa calls (checked by
+    tests/test_feature_parity.py): every feature agrees within rtol=1e-4 /
+    atol=1e-6, except tonnetz_mean and tonnetz_std, which are now derived
+    from the STFT chroma instead of a separate CQT chroma (both columns are
+    removed by the model's variance selector), and harmonic_ratio /
+    percussive_ratio, see hpss_energy.
+    """
+
+    # Extractors that can be skipped and the columns each one fills
+    SKIPPABLE_GROUPS = {
+        'zcr': ('zcr_mean', 'zcr_std'),
+        'flatness': ('spectral_flatness_mean', 'spectral_flatness_std'),
+        'chroma': ('chroma_mean', 'chroma_std') + tuple(f'chroma_bin_{i}' for i in range(12)),
+        'tonnetz': ('tonnetz_mean', 'tonnetz_std'),
+        'rhythm': ('tempo', 'beat_strength'),
+        'contrast': ('spectral_contrast_mean', 'spectral_contrast_std'),
+        'hpss': ('harmonic_ratio', 'percussive_ratio'),
+    }
+
+    def __init__(self, n_fft: int = 2048, hop_length: int = 512, n_mels: int = 128):
+        self.n_fft = n_fft
+        self.hop_length = hop_length
+        self.n_mels = n_mels
+        self._mel_basis = {}
+        self._lock = threading.Lock()
+
+    def _get_mel_basis(self, sr: int) -> np.ndarray:
+        mel_basis = self._mel_basis.get(sr)
+        if mel_basis is None:
+            with self._lock:
+                mel_basis = self._mel_basis.get(sr)
+                if mel_basis is None:
+                    import librosa
+                    mel_basis = librosa.filters.mel(sr=sr, n_fft=self.n_fft, n_mels=self.n_mels)
+                    self._mel_basis[sr] = mel_basis
+        return mel_basis
+
+    @classmethod
+    def unused_groups(cls, feature_names) -> frozenset:
+        """The SKIPPABLE_GROUPS that fill none of ``feature_names``."""
+        needed = set(feature_names)
+        return frozenset(group for group, names in cls.SKIPPABLE_GROUPS.items() if needed.isdisjoint(names))
+
+    def _skip_group(self, group: str, out: np.ndarray) -> None:
+        for name in self.SKIPPABLE_GROUPS[group]:
+            out[FEATURE_INDEX[name]] = np.nan
+
+    def extract_into(self, y: np.ndarray, sr: int, out: np.ndarray, duration: int = 10,
+                     skip: frozenset = frozenset()) -> None:
+        """Write all features of ``y`` into ``out`` in FEATURE_NAMES order."""
+        spectra = self.extract_cheap_into(y, sr, out, duration, skip)
+        self.extract_deferred_into(y, sr, spectra, out, skip)
+
+    def extract_cheap_into(self, y: np.ndarray, sr: int, out: np.ndarray, duration: int = 10,
+                           skip: frozenset = frozenset()) -> tuple:
+        """
+        Write every feature except DEFERRED_FEATURES into ``out`` and return the
+        shared spectrograms for extract_deferred_into.
+        """
+        import librosa
+        F = FEATURE_INDEX
+        abs_y = np.abs(y)
+        rms = np.sqrt(np.mean(y**2))
+        
+        # Basic properties (normalized/relative features instead of absolute)
+        out[F['signal_length_ratio']] = len(y) / (sr * duration)
+        out[F['rms_energy_ratio']] = rms / (np.max(abs_y) + 1e-8)
+        
+        # Shared spectrograms: one STFT for the whole clip
+        with request_timings.stage('stft'):
+            D = librosa.stft(y, n_fft=self.n_fft, hop_length=self.hop_length)
+            magnitude = np.abs(D)
+            power = magnitude**2
+            log_mel = librosa.power_to_db(
+                np.einsum('...ft,mf->...mt', power, self._get_mel_basis(sr), optimize=True)
+            )
+        
+        # 1. Spectral features
+        with request_timings.stage('spectral_shape'):
+            spectral_centroids = librosa.feature.spectral_centroid(S=magnitude, sr=sr)
+            out[F['spectral_centroid_mean']] = np.mean(spectral_centroids[0])
+            out[F['spectral_centroid_std']] = np.std(spectral_centroids[0])
+            out[F['spectral_centroid_skew']] = skewness(spectral_centroids[0])
+            
+            spectral_rolloff = librosa.feature.spectral_rolloff(S=magnitude, sr=sr)[0]
+            out[F['spectral_rolloff_mean']] = np.mean(spectral_rolloff)
+            out[F['spectral_rolloff_std']] = np.std(spectral_rolloff)
+            
+            spectral_bandwidth = librosa.feature.spectral_bandwidth(S=magnitude, sr=sr, centroid=spectral_centroids)[0]
+            out[F['spectral_bandwidth_mean']] = np.mean(spectral_bandwidth)
+            out[F['spectral_bandwidth_std']] = np.std(spectral_bandwidth)
+        
+        # 2. Zero crossing rate (time domain, no spectrogram needed)
+        if 'zcr' in skip:
+            self._skip_group('zcr', out)
+        else:
+            with request_timings.stage('zcr'):
+                zcr = librosa.feature.zero_crossing_rate(y)[0]
+                out[F['zcr_mean']] = np.mean(zcr)
+                out[F['zcr_std']] = np.std(zcr)
+        
+        # 3. MFCC features (first 13 coefficients), interleaved mean/std columns
+        with request_timings.stage('mfcc'):
+            mfccs = librosa.feature.mfcc(S=log_mel, n_mfcc=13)
+            mfcc_start = F['mfcc_1_mean']
+            out[mfcc_start:mfcc_start + 26:2] = np.mean(mfccs, axis=1)
+            out[mfcc_start + 1:mfcc_start + 26:2] = np.std(mfccs, axis=1)
+        
+        # 8. Spectral flatness (measure of noisiness)
+        if 'flatness' in skip:
+            self._skip_group('flatness', out)
+        else:
+            with request_timings.stage('flatness'):
+                flatness = librosa.feature.spectral_flatness(S=magnitude)
+                out[F['spectral_flatness_mean']] = np.mean(flatness)
+                out[F['spectral_flatness_std']] = np.std(flatness)
+        
+        # 9. Dynamic features
+        p5, p95 = np.percentile(abs_y, [5, 95])
+        out[F['dynamic_range']] = p95 - p5
+        out[F['peak_to_rms_ratio']] = np.max(abs_y) / (rms + 1e-8)
+        
+        # 11. Additional spectral features
+        out[F['spectral_centroid_normalized']] = np.mean(spectral_centroids) / (sr / 2)
+        
+        # 12. Zero-padding and windowing artifacts detection
+        out[F['silence_ratio']] = np.sum(abs_y < 0.01) / len(y)
+        
+        return D, magnitude, power, log_mel
+
+    def extract_deferred_into(self, y: np.ndarray, sr: int, spectra: tuple, out: np.ndarray,
+                              skip: frozenset = frozenset()) -> None:
+        """Write DEFERRED_FEATURES into ``out`` from the spectrograms of extract_cheap_into."""
+        import librosa
+        F = FEATURE_INDEX
+        D, magnitude, power, log_mel = spectra
+        
+        # 4. Chroma features (key-related); tonnetz is computed from the chroma
+        if 'chroma' not in skip or 'tonnetz' not in skip:
+            with request_timings.stage('chroma'):
+                chroma = librosa.feature.chroma_stft(S=power, sr=sr)
+        if 'chroma' in skip:
+            self._skip_group('chroma', out)
+        else:
+            out[F['chroma_mean']] = np.mean(chroma)
+            out[F['chroma_std']] = np.std(chroma)
+            
+            # Individual chroma bins (12 semitones)
+            out[F['chroma_bin_0']:F['chroma_bin_0'] + 12] = np.mean(chroma, axis=1)
+        
+        # 5. Tonnetz features (harmonic network), from the STFT chroma
+        if 'tonnetz' in skip:
+            self._skip_group('tonnetz', out)
+        else:
+            with request_timings.stage('tonnetz'):
+                tonnetz = librosa.feature.tonnetz(sr=sr, chroma=chroma)
+                out[F['tonnetz_mean']] = np.mean(tonnetz)
+                out[F['tonnetz_std']] = np.std(tonnetz)
+        
+        # 6. Rhythm and tempo features, from the log-mel onset envelope
+        if 'rhythm' in skip:
+            self._skip_group('rhythm', out)
+        else:
+            with request_timings.stage('beat_track'):
+                onset_envelope = librosa.onset.onset_strength(
+                    S=log_mel, sr=sr, n_fft=self.n_fft, hop_length=self.hop_length, aggregate=np.median
+                )
+                tempo, beats = librosa.beat.beat_track(
+                    onset_envelope=onset_envelope, sr=sr, hop_length=self.hop_length
+                )
+            tempo = float(np.atleast_1d(tempo)[0])
+            out[F['tempo']] = tempo if np.isfinite(tempo) else 120.0
+            out[F['beat_strength']] = len(beats) / (len(y) / sr) if len(y) > 0 else 0.0
+        
+        # 7. Spectral contrast
+        if 'contrast' in skip:
+            self._skip_group('contrast', out)
+        else:
+            with request_timings.stage('contrast'):
+                contrast = librosa.feature.spectral_contrast(S=magnitude, sr=sr)
+                out[F['spectral_contrast_mean']] = np.mean(contrast)
+                out[F['spectral_contrast_std']] = np.std(contrast)
+        
+        # 10. Harmonic-percussive separation features, on the shared magnitude
+        if 'hpss' in skip:
+            self._skip_group('hpss', out)
+            return
+        try:
+            with request_timings.stage('hpss'):
+                harmonic_energy, percussive_energy = self.hpss_energy(D, magnitude, power, len(y))
+            total_energy = harmonic_energy + percussive_energy
+            
+            out[F['harmonic_ratio']] = harmonic_energy / (total_energy + 1e-8)
+            out[F['percussive_ratio']] = percussive_energy / (total_energy + 1e-8)
+        except:
+            out[F['harmonic_ratio']] = 0.5
+            out[F['percussive_ratio']] = 0.5
+
+    # Clips with at most this many frames of sound (about 1.5 s) are inverted like librosa.effects.hpss
+    EXACT_HPSS_FRAMES = 64
+
+    def hpss_energy(self, D: np.ndarray, magnitude: np.ndarray, power: np.ndarray, length: int,
+                    kernel_size: int = 31) -> tuple:
+        """
+        Harmonic and percussive energy of the STFT ``D`` of a ``length``-sample
+        clip, with the soft masks of librosa.decompose.hpss (kernel_size=31,
+        power=2, margin=1).
+
+        The energies are summed over the masked spectrogram instead of the
+        inverse-transformed components, which only changes them by the common
+        STFT scale factor plus the energy the ISTFT drops from an inconsistent
+        spectrogram: the ratios stay within 0.003 of librosa's on the reference
+        clips. The fewer frames carry the sound, the larger that drift (over
+        0.01 for a 0.1 s clip), so when at most EXACT_HPSS_FRAMES frames do,
+        which also keeps the inversion cheap for raw clips, both components
+        are inverse-transformed and the ratios match librosa's.
+        """
+        harmonic = median_filter_axis(magnitude, kernel_size, axis=1)
+        percussive = median_filter_axis(magnitude, kernel_size, axis=0)
+        harmonic **= 2
+        percussive **= 2
+        total = harmonic + percussive
+        valid = total > np.finfo(magnitude.dtype).tiny
+        np.divide(harmonic, total, out=harmonic, where=valid)
+        np.divide(percussive, total, out=percussive, where=valid)
+        harmonic[~valid] = 0.0
+        percussive[~valid] = 0.0
+
+        if np.count_nonzero(power.any(axis=0)) <= self.EXACT_HPSS_FRAMES:
+            import librosa
+            components = (
+                librosa.istft(D * mask, n_fft=self.n_fft, hop_length=self.hop_length, length=length,
+                              dtype=magnitude.dtype)
+                for mask in (harmonic, percussive)
+            )
+            return tuple(float(np.sum(component**2)) for component in components)
+        return float(np.sum(harmonic**2 * power)), float(np.sum(percussive**2 * power))
+
+spectral_engine = SpectralFeatureEngine()
+
+class Resampler:
+    """
+    Sample-rate conversion for the feature extractor, built on soxr.
+
+    ``quality`` picks the filter tier: 'hq' is what librosa.resample uses by
+    default and what the model was trained on, 'vhq' is sharper and 'mq'
+    trades stopband attenuation for speed. Both alternatives shift the
+    spectral contrast features by up to ~25%, so they are opt-in.
+
+    Each thread keeps one converter per (source rate, target rate), so the
+    polyphase filter for common phone rates (44100 -> 22050 is 2:1,
+    48000 -> 22050 is 320:147) is designed once and reused across requests.
+
+    When only the first ``max_output`` samples are needed the input is cut to
+    that window plus ``MARGIN`` source samples, past the reach of the longest
+    filter, which gives the same output as converting everything. With 'hq'
+    the output is sample for sample that of librosa.resample (checked by
+    tests/test_feature_parity.py).
+    """
+
+    QUALITIES = {'vhq': 'VHQ', 'hq': 'HQ', 'mq': 'MQ'}
+    MARGIN = 4096
+
+    def __init__(self, quality: str = 'hq'):
+        if quality not in self.QUALITIES:
+            raise ValueError(f"Unknown resampling quality {quality!r}, expected one of {sorted(self.QUALITIES)}")
+        self.quality = quality
+        self._local = threading.local()
+
+    def _converter(self, orig_sr: int, target_sr: int):
+        converters = getattr(self._local, 'converters', None)
+        if converters is None:
+            converters = self._local.converters = {}
+        converter = converters.get((orig_sr, target_sr))
+        if converter is None:
+            import soxr
+            converter = converters[(orig_sr, target_sr)] = soxr.ResampleStream(
+                orig_sr, target_sr, 1, dtype='float32', quality=self.QUALITIES[self.quality]
+            )
+        else:
+            converter.clear()
+        return converter
+
+    def resample(self, y: np.ndarray, orig_sr: int, target_sr: int,
+                 max_output: Optional[int] = None) -> np.ndarray:
+        """Convert mono ``y`` from ``orig_sr`` to ``target_sr``, optionally keeping only ``max_output`` samples."""
+        n_output = int(np.ceil(len(y) * target_sr / orig_sr))
+        if max_output is not None and max_output < n_output:
+            n_output = max_output
+            y = y[:int(np.ceil(max_output * orig_sr / target_sr)) + self.MARGIN]
+        y_hat = self._converter(orig_sr, target_sr).resample_chunk(
+            np.ascontiguousarray(y, dtype=np.float32), last=True
+        )
+        if len(y_hat) < n_output:
+            # soxr can come up a sample short; librosa.resample pads to the same length
+            y_hat = np.pad(y_hat, (0, n_output - len(y_hat)))
+        return y_hat[:n_output]
+
+resampler = Resampler(RESAMPLE_QUALITY)
 
 class LocalAudioFeatureExtractor:
-    def __init__(self, sample_rate: int = 22050, duration: int = 10):
+    """
+    Single feature extractor for every endpoint.
+
+    Features are written straight into a float32 vector (or a row of an
+    (N, n_features) matrix) laid out in the model's ``feature_names`` column
+    order, so endpoints can hand the result to the model without building
+    per-song dicts or lists.
+    """
+
+    def __init__(self, feature_names: Optional[List[str]] = None, sample_rate: int = 22050, duration: int = 10):
         self.sample_rate = sample_rate
         self.duration = duration
         self.target_length = sample_rate * duration
-        
-    def extract_features_from_array(self, audio_data: np.ndarray, sample_rate: int) -> Optional[Dict[str, float]]:
+        self.feature_names = list(feature_names) if feature_names is not None else list(FEATURE_NAMES)
+        self.n_features = len(self.feature_names)
+        
+        # Map model columns to engine slots; columns the engine does not produce stay 0.0
+        self._identity_layout = self.feature_names == FEATURE_NAMES
+        self._model_columns = np.array(
+            [i for i, name in enumerate(self.feature_names) if name in FEATURE_INDEX], dtype=np.intp
+        )
+        self._engine_slots = np.array(
+            [FEATURE_INDEX[name] for name in self.feature_names if name in FEATURE_INDEX], dtype=np.intp
+        )
+        self._local = threading.local()
+        self.first_tier = None
+        self.cascade_threshold = 1.0
+        self._first_tier_columns = None
+        self._first_tier_forest = None
+        self.required_features = None
+        self._skip = frozenset()
+    
+    def set_required_features(self, feature_names: Optional[List[str]]):
+        """
+        Only compute the extractors that fill ``feature_names`` (plus the cascade
+        first tier's inputs); None computes every feature. Skipped columns are NaN.
+        """
+        self.required_features = list(feature_names) if feature_names is not None else None
+        self._update_skip()
+    
+    def _update_skip(self):
+        if self.required_features is None:
+            self._skip = frozenset()
+            return
+        needed = set(self.required_features)
+        if self.first_tier is not None:
+            needed.update(self.first_tier['feature_names'])
+        self._skip = spectral_engine.unused_groups(needed)
+    
+    def set_first_tier(self, first_tier: Optional[Dict[str, Any]], threshold: float):
+        """Use ``first_tier`` (see ClassificationCascade) in extract_tiered_into, or nothing if None."""
+        if first_tier is not None:
+            self._first_tier_columns = np.array(
+                [self.feature_names.index(name) for name in first_tier['feature_names']], dtype=np.intp
+            )
+            self._first_tier_forest = CompiledForest(first_tier['model'])
+        else:
+            self._first_tier_forest = None
+        self.first_tier = first_tier
+        self.cascade_threshold = threshold
+        self._update_skip()
+    
+    def new_matrix(self, n_rows: int) -> np.ndarray:
+        """Allocate a zeroed (n_rows, n_features) float32 feature matrix."""
+        return np.zeros((n_rows, self.n_features), dtype=np.float32)
+    
+    def _scratch(self) -> np.ndarray:
+        scratch = getattr(self._local, 'scratch', None)
+        if scratch is None:
+            scratch = self._local.scratch = np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+        return scratch
+    
+    def extract_into(self, audio_data: np.ndarray, sample_rate: int, out: np.ndarray,
+                     fit_to_window: bool = True) -> bool:
+        """
+        Extract features of ``audio_data`` into ``out`` in model column order.
+
+        With ``fit_to_window`` the audio is resampled to the extractor's rate and
+        padded/truncated to ``duration`` seconds (raw PCM endpoints). Without it
+        the audio is analysed as-is at ``sample_rate``, which is how decoded
+        files were analysed at training time.
+
+        Returns False if no features could be extracted.
+        """
         try:
-            if sample_rate != self.sample_rate:
-                y = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=self.sample_rate)
-            else:
-                y = audio_data
+            y, sr = self._prepare(audio_data, sample_rate, fit_to_window)
+            if len(y) == 0:
+                return False
             
-            if len(y) > self.target_length:
-                y = y[:self.target_length]
-            elif len(y) < self.target_length:
-                y = np.pad(y, (0, self.target_length - len(y)), mode='constant')
+            if self._identity_layout:
+                spectral_engine.extract_into(y, sr, out, self.duration, self._skip)
+            else:
+                scratch = self._scratch()
+                spectral_engine.extract_into(y, sr, scratch, self.duration, self._skip)
+                out[:] = 0.0
+                out[self._model_columns] = scratch[self._engine_slots]
+            return True
             
+        except Exception as e:
+            logger.error(f"Error extracting features: {e}")
+            return False
+    
+    def extract_tiered_into(self, audio_data: np.ndarray, sample_rate: int, out: np.ndarray,
+                            fit_to_window: bool = True) -> Optional[Dict[str, Any]]:
+        """
+        Cascade extraction into ``out``: compute everything but DEFERRED_FEATURES
+        and let the first-tier model answer if its confidence reaches
+        ``cascade_threshold``; only otherwise compute the deferred features.
+
+        Returns {'tier': 1, 'prediction', 'probabilities', 'model_version'} or
+        {'tier': 2}, with the
+        CPU seconds spent on each half, or None if no features could be
+        extracted. A first-tier answer leaves the deferred columns NaN.
+        """
+        try:
+            y, sr = self._prepare(audio_data, sample_rate, fit_to_window)
             if len(y) == 0:
                 return None
             
-            features = {}
+            engine_out = out if self._identity_layout else self._scratch()
+            started = time.thread_time()
+            spectra = spectral_engine.extract_cheap_into(y, sr, engine_out, self.duration, self._skip)
+            engine_out[DEFERRED_SLOTS] = np.nan
+            if not self._identity_layout:
+                out[:] = 0.0
+                out[self._model_columns] = engine_out[self._engine_slots]
+            cheap_seconds = time.thread_time() - started
             
-            # Basic properties
-            features['signal_length_ratio'] = float(len(y) / self.target_length)
-            features['rms_energy_ratio'] = float(np.sqrt(np.mean(y**2)) / (np.max(np.abs(y)) + 1e-8))
+            if self.first_tier is not None:
+                with request_timings.stage('first_tier'):
+                    predictions, probabilities = self._first_tier_forest.predict(
+                        out[self._first_tier_columns].reshape(1, -1)
+                    )
+                probabilities = probabilities[0]
+                if probabilities.max() >= self.cascade_threshold:
+                    return {
+                        'tier': 1,
+                        'prediction': predictions[0].item(),
+                        'probabilities': probabilities,
+                        'model_version': self.first_tier['trained_for'],
+                        'cheap_seconds': cheap_seconds,
+                        'deferred_seconds': 0.0
+                    }
             
-            # Spectral features
-            spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=self.sample_rate)[0]
-            features['spectral_centroid_mean'] = float(np.mean(spectral_centroids))
-            features['spectral_centroid_std'] = float(np.std(spectral_centroids))
-            features['spectral_centroid_skew'] = float(self._skewness(spectral_centroids))
+            started = time.thread_time()
+            spectral_engine.extract_deferred_into(y, sr, spectra, engine_out, self._skip)
+            if not self._identity_layout:
+                out[self._model_columns] = engine_out[self._engine_slots]
+            return {'tier': 2, 'cheap_seconds': cheap_seconds, 'deferred_seconds': time.thread_time() - started}
             
-            spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=self.sample_rate)[0]
-            features['spectral_rolloff_mean'] = float(np.mean(spectral_rolloff))
-            features['spectral_rolloff_std'] = float(np.std(spectral_rolloff))
-            
-            spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=self.sample_rate)[0]
-            features['spectral_bandwidth_mean'] = float(np.mean(spectral_bandwidth))
-            features['spectral_bandwidth_std'] = float(np.std(spectral_bandwidth))
-            
-            # Zero crossing rate
-            zcr = librosa.feature.zero_crossing_rate(y)[0]
-            features['zcr_mean'] = float(np.mean(zcr))
-            features['zcr_std'] = float(np.std(zcr))
-            
-            # MFCC features
-            mfccs = librosa.feature.mfcc(y=y, sr=self.sample_rate, n_mfcc=13)
-            for i in range(13):
-                features[f'mfcc_{i+1}_mean'] = float(np.mean(mfccs[i]))
-                features[f'mfcc_{i+1}_std'] = float(np.std(mfccs[i]))
-            
-            # Chroma features
-            chroma = librosa.feature.chroma_stft(y=y, sr=self.sample_rate)
-            features['chroma_mean'] = float(np.mean(chroma))
-            features['chroma_std'] = float(np.std(chroma))
-            
-            # Individual chroma bins
-            chroma_bins = np.mean(chroma, axis=1)
-            for i in range(12):
-                features[f'chroma_bin_{i}'] = float(chroma_bins[i])
-            
-            # Tonnetz features
-            tonnetz = librosa.feature.tonnetz(y=y, sr=self.sample_rate)
-            features['tonnetz_mean'] = float(np.mean(tonnetz))
-            features['tonnetz_std'] = float(np.std(tonnetz))
-            
-            # Tempo and rhythm features
-            tempo, beats = librosa.beat.beat_track(y=y, sr=self.sample_rate)
-            features['tempo'] = float(tempo) if np.isfinite(tempo) else 120.0
-            features['beat_strength'] = float(len(beats) / (len(y) / self.sample_rate)) if len(y) > 0 else 0.0
-            
-            # Spectral contrast
-            contrast = librosa.feature.spectral_contrast(y=y, sr=self.sample_rate)
-            features['spectral_contrast_mean'] = float(np.mean(contrast))
-            features['spectral_contrast_std'] = float(np.std(contrast))
-            
-            # Spectral flatness
-            flatness = librosa.feature.spectral_flatness(y=y)
-            features['spectral_flatness_mean'] = float(np.mean(flatness))
-            features['spectral_flatness_std'] = float(np.std(flatness))
-            
-            # Dynamic features
-            features['dynamic_range'] = float(np.percentile(np.abs(y), 95) - np.percentile(np.abs(y), 5))
-            features['peak_to_rms_ratio'] = float(np.max(np.abs(y)) / (np.sqrt(np.mean(y**2)) + 1e-8))
+        except Exception as e:
+            logger.error(f"Error extracting features: {e}")
+            return None
+    
+    def _prepare(self, audio_data: np.ndarray, sample_rate: int, fit_to_window: bool):
+        """Return the (audio, sample_rate) to analyse, see extract_into."""
+        if not fit_to_window:
+            return audio_data, sample_rate
+        
+        if sample_rate != self.sample_rate:
+            with request_timings.stage('resample'):
+                y = resampler.resample(audio_data, sample_rate, self.sample_rate, max_output=self.target_length)
+        else:
+            y = audio_data
+        
+        if len(y) > self.target_length:
+            y = y[:self.target_length]
+        elif len(y) < self.target_length:
+            y = np.pad(y, (0, self.target_length - len(y)), mode='constant')
+        return y, self.sample_rate
+    
+    def extract_vector(self, audio_data: np.ndarray, sample_rate: int,
+                       fit_to_window: bool = True) -> Optional[np.ndarray]:
+        """Extract features into a new float32 vector, or return None on failure."""
+        vector = np.zeros(self.n_features, dtype=np.float32)
+        if not self.extract_into(audio_data, sample_rate, vector, fit_to_window):
+            return None
+        return vector
+
+# Per-process extractor used by extraction pool workers
+_worker_extractor = None
+
+def warm_up_audio(sample_rate: int, seconds: float = 3.0) -> np.ndarray:
+    """Deterministic synthetic music (chord, clicks, noise) for warm-up passes."""
+    t = np.arange(int(sample_rate * seconds)) / sample_rate
+    chord = sum(0.2 * np.sin(2 * np.pi * frequency * t) for frequency in (220.0, 277.2, 329.6))
+    clicks = np.zeros_like(t)
+    clicks[::sample_rate // 2] = 1.0
+    clicks = np.convolve(clicks, np.exp(-np.arange(400) / 40.0), mode='same')
+    noise = 0.02 * np.random.default_rng(0).standard_normal(len(t))
+    return (chord + 0.5 * clicks + noise).astype(np.float32)
+
+def warm_up_extractor(extractor: LocalAudioFeatureExtractor, sample_rates: List[int]):
+    """
+    Run every extraction path of ``extractor`` once per sample rate, so librosa's
+    numba compilation, the resampling filters and the mel bases are ready
+    before the first real request.
+    """
+    out = np.zeros(extractor.n_features, dtype=np.float32)
+    for sample_rate in sample_rates:
+        audio = warm_up_audio(sample_rate)
+        extractor.extract_into(audio, sample_rate, out)
+        extractor.extract_into(audio, sample_rate, out, fit_to_window=False)
+        if extractor.first_tier is not None:
+            extractor.extract_tiered_into(audio, sample_rate, out)
+
+def _init_extraction_worker(feature_names: List[str], first_tier: Optional[Dict[str, Any]] = None,
+                            cascade_threshold: float = 1.0, required_features: Optional[List[str]] = None,
+                            warm_up_rates: tuple = (), warmed_workers=None):
+    """
+    Pool initializer: build the extractor once per worker process and warm it
+    up before the worker takes its first task, then count it in ``warmed_workers``.
+    """
+    global _worker_extractor
+    _worker_extractor = LocalAudioFeatureExtractor(feature_names)
+    _worker_extractor.set_first_tier(first_tier, cascade_threshold)
+    _worker_extractor.set_required_features(required_features)
+    # Import librosa and touch its lazily loaded submodules before the first task arrives
+    import librosa
+    librosa.filters.mel(sr=_worker_extractor.sample_rate, n_fft=spectral_engine.n_fft)
+    warm_up_extractor(_worker_extractor, warm_up_rates)
+    if warmed_workers is not None:
+        with warmed_workers.get_lock():
+            warmed_workers.value += 1
+
+def _extract_in_worker(shm_name: str, n_samples: int, sample_rate: int, fit_to_window: bool,
+                       tiered: bool = False, timed: bool = False, profiled: bool = False):
+    """
+    Pool task: read audio from shared memory and write the feature vector
+    back into the head of the same block. Returns (what extract_into, or
+    extract_tiered_into with ``tiered``, returns, diagnostics), where
+    diagnostics holds the stage timings and profile stats the request asked
+    for, or is None.
+    """
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        n_features = _worker_extractor.n_features
+        features = np.ndarray((n_features,), dtype=np.float32, buffer=shm.buf)
+        audio = np.ndarray((n_samples,), dtype=np.float32, buffer=shm.buf, offset=n_features * 4)
+        profile = cProfile.Profile() if profiled else None
+        if timed:
+            request_timings.start()
+        if profile is not None:
+            profile.enable()
+        try:
+            if tiered:
+                result = _worker_extractor.extract_tiered_into(audio, sample_rate, features, fit_to_window)
+            else:
+                result = _worker_extractor.extract_into(audio, sample_rate, features, fit_to_window)
+        finally:
+            if profile is not None:
+                profile.disable()
+            stages = request_timings.stop()
+            del features, audio
+        
+        if not (timed or profiled):
+            return result, None
+        if profile is not None:
+            profile.create_stats()
+        return result, {'timings': stages, 'profile': profile.stats if profile is not None else None}
+    finally:
+        shm.close()
+
+class ExtractionPool:
+    """
+    Runs feature extraction in a pool of worker processes.
+
+    Audio is handed to workers through a shared memory block instead of being
+    pickled: the block holds the output feature vector followed by the float32
+    samples, so the worker reads the audio in place and writes the features
+    back without any serialization. Workers are recycled after
+    ``max_tasks_per_worker`` tasks to contain librosa memory growth. Every
+    worker, including replacements, warms up on ``warm_up_rates`` before it
+    takes a task. With ``workers=0`` extraction runs inline on the calling
+    thread.
+
+    A task that outlives ``task_timeout`` fails with TimeoutError and its pool
+    is replaced: new tasks go to fresh workers, and the old pool is terminated,
+    killing the stuck worker, once the tasks still running on it have had
+    ``task_timeout`` to finish. Without that, every hung extraction would take
+    a worker out of service for good.
+    """
+
+    def __init__(self, extractor: LocalAudioFeatureExtractor, workers: int,
+                 task_timeout: float, max_tasks_per_worker: int, start_method: str = 'spawn',
+                 warm_up_rates: List[int] = ()):
+        self.extractor = extractor
+        self.workers = max(0, workers)
+        self.task_timeout = task_timeout
+        self.max_tasks_per_worker = max_tasks_per_worker or None
+        self.start_method = start_method
+        self.warm_up_rates = tuple(warm_up_rates)
+        self._pool = None
+        self._warmed_workers = None
+        self._lock = threading.Lock()
+        self.timeouts = 0
+
+    def _new_pool(self):
+        """Start workers with the extractor's current settings; returns (pool, warmed worker counter)."""
+        context = mp.get_context(self.start_method)
+        warmed_workers = context.Value('i', 0)
+        pool = context.Pool(
+            processes=self.workers,
+            initializer=_init_extraction_worker,
+            initargs=(
+                self.extractor.feature_names, self.extractor.first_tier, self.extractor.cascade_threshold,
+                self.extractor.required_features, self.warm_up_rates, warmed_workers
+            ),
+            maxtasksperchild=self.max_tasks_per_worker
+        )
+        logger.info(f"Started extraction pool: {self.workers} workers ({self.start_method}), "
+                    f"recycled every {self.max_tasks_per_worker} tasks")
+        return pool, warmed_workers
+
+    def _wait_warmed(self, warmed_workers, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while warmed_workers.value < self.workers:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _get_pool(self):
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool, self._warmed_workers = self._new_pool()
+        return self._pool
+
+    def _replace_hung_pool(self, pool):
+        """
+        Swap ``pool``, whose worker is stuck on a timed-out task, for a new one
+        and terminate it once the tasks submitted to it have timed out too.
+        """
+        with self._lock:
+            if self._pool is pool:
+                self._pool, self._warmed_workers = self._new_pool()
+                logger.error(f"Extraction worker hung for over {self.task_timeout:g}s; replaced the pool")
+        # Everything queued on it was submitted before now, so has had its full timeout by then
+        terminate = threading.Timer(self.task_timeout, pool.terminate)
+        terminate.daemon = True
+        terminate.start()
+
+    def _submit(self, audio_data: np.ndarray, sample_rate: int, fit_to_window: bool, tiered: bool = False):
+        """Copy audio into a new shared memory block and queue its extraction task."""
+        audio_data = np.ascontiguousarray(audio_data, dtype=np.float32)
+        feature_bytes = self.extractor.n_features * 4
+        shm = shared_memory.SharedMemory(create=True, size=feature_bytes + max(audio_data.nbytes, 4))
+        try:
+            shared_audio = np.ndarray(audio_data.shape, dtype=np.float32, buffer=shm.buf, offset=feature_bytes)
+            shared_audio[:] = audio_data
+            del shared_audio
             
-            # Harmonic-percussive separation
+            pool = self._get_pool()
+            task = pool.apply_async(
+                _extract_in_worker, (shm.name, len(audio_data), int(sample_rate), fit_to_window, tiered,
+                                     request_timings.active, profile_sampler.active)
+            )
+            return shm, pool, task
+        except BaseException:
+            shm.close()
+            shm.unlink()
+            raise
+
+    def _collect(self, shm, pool, task, out: np.ndarray, timeout: float):
+        """Wait for a submitted task, copy its features into ``out`` and free the block."""
+        try:
             try:
-                y_harmonic, y_percussive = librosa.effects.hpss(y)
-                harmonic_energy = np.sum(y_harmonic**2)
-                percussive_energy = np.sum(y_percussive**2)
-                total_energy = harmonic_energy + percussive_energy
-                
-                features['harmonic_ratio'] = float(harmonic_energy / (total_energy + 1e-8))
-                features['percussive_ratio'] = float(percussive_energy / (total_energy + 1e-8))
-            except:
-                features['harmonic_ratio'] = 0.5
-                features['percussive_ratio'] = 0.5
+                ok, diagnostics = task.get(timeout=max(timeout, 0.0))
+            except mp.TimeoutError:
+                self.timeouts += 1
+                self._replace_hung_pool(pool)
+                raise TimeoutError(f"Feature extraction timed out after {self.task_timeout:g}s")
             
-            # Additional spectral features
-            features['spectral_centroid_normalized'] = float(np.mean(spectral_centroids) / (self.sample_rate / 2))
-            features['silence_ratio'] = float(np.sum(np.abs(y) < 0.01) / len(y))
+            if diagnostics is not None:
+                if diagnostics['timings'] is not None:
+                    request_timings.add(diagnostics['timings'])
+                if diagnostics['profile'] is not None:
+                    profile_sampler.add_stats(diagnostics['profile'])
+            if ok:
+                out[:] = np.ndarray((self.extractor.n_features,), dtype=np.float32, buffer=shm.buf)
+            return ok
+        finally:
+            shm.close()
+            shm.unlink()
+
+    def _extract_inline(self, audio_data: np.ndarray, sample_rate: int, out: np.ndarray,
+                        fit_to_window: bool, tiered: bool):
+        if tiered:
+            return self.extractor.extract_tiered_into(audio_data, sample_rate, out, fit_to_window)
+        return self.extractor.extract_into(audio_data, sample_rate, out, fit_to_window)
+
+    def extract_into(self, audio_data: np.ndarray, sample_rate: int, out: np.ndarray,
+                     fit_to_window: bool = True, tiered: bool = False):
+        """
+        Same contract as LocalAudioFeatureExtractor.extract_into (or
+        extract_tiered_into with ``tiered``), executed in a worker.
+        """
+        with service_metrics.timed('extract'), admission.slot():
+            if self.workers == 0:
+                return self._extract_inline(audio_data, sample_rate, out, fit_to_window, tiered)
             
-            return features
+            shm, pool, task = self._submit(audio_data, sample_rate, fit_to_window, tiered)
+            return self._collect(shm, pool, task, out, self.task_timeout)
+
+    def extract_rows(self, jobs: List[tuple], out: np.ndarray, fit_to_window: bool = True,
+                     tiered: bool = False) -> List[Any]:
+        """
+        Extract features for many (audio_data, sample_rate) jobs across all
+        workers, writing job i into row i of ``out``.
+
+        Returns one entry per job: what extract_into returns for it, or the
+        exception raised for that job. At most ``4 * workers`` jobs are in
+        shared memory at once.
+        """
+        with service_metrics.timed('extract'):
+            return self._extract_rows(jobs, out, fit_to_window, tiered)
+
+    def _extract_rows(self, jobs: List[tuple], out: np.ndarray, fit_to_window: bool, tiered: bool) -> List[Any]:
+        outcomes = [None] * len(jobs)
+        if self.workers == 0:
+            for i, (audio_data, sample_rate) in enumerate(jobs):
+                with admission.slot():
+                    outcomes[i] = self._extract_inline(audio_data, sample_rate, out[i], fit_to_window, tiered)
+            return outcomes
+        
+        # Every job in flight holds a work slot; with some in flight only slots that are free now are taken,
+        # since the ones held are only given back as this thread collects them
+        window = 4 * self.workers
+        in_flight = []
+        next_job = 0
+        while next_job < len(jobs) or in_flight:
+            while next_job < len(jobs) and len(in_flight) < window and admission.acquire(block=not in_flight):
+                audio_data, sample_rate = jobs[next_job]
+                try:
+                    shm, pool, task = self._submit(audio_data, sample_rate, fit_to_window, tiered)
+                    in_flight.append((next_job, shm, pool, task, time.monotonic() + self.task_timeout))
+                except Exception as e:
+                    admission.release()
+                    outcomes[next_job] = e
+                next_job += 1
             
+            if in_flight:
+                i, shm, pool, task, deadline = in_flight.pop(0)
+                try:
+                    outcomes[i] = self._collect(shm, pool, task, out[i], deadline - time.monotonic())
+                except Exception as e:
+                    outcomes[i] = e
+                finally:
+                    admission.release()
+        return outcomes
+
+    def extract_vector(self, audio_data: np.ndarray, sample_rate: int,
+                       fit_to_window: bool = True) -> Optional[np.ndarray]:
+        """Extract features into a new float32 vector, or return None on failure."""
+        vector = np.zeros(self.extractor.n_features, dtype=np.float32)
+        if not self.extract_into(audio_data, sample_rate, vector, fit_to_window):
+            return None
+        return vector
+
+    def extract_tiered(self, audio_data: np.ndarray, sample_rate: int, fit_to_window: bool = True):
+        """Cascade extraction into a new vector; returns (vector, outcome), or (None, None) on failure."""
+        vector = np.zeros(self.extractor.n_features, dtype=np.float32)
+        outcome = self.extract_into(audio_data, sample_rate, vector, fit_to_window, tiered=True)
+        if not outcome:
+            return None, None
+        return vector, outcome
+
+    def warm_up(self, timeout: float) -> bool:
+        """
+        Start the workers now and wait until all of them have warmed up (inline:
+        warm up the extractor). Returns False if that takes over ``timeout`` seconds.
+        """
+        if self.workers == 0:
+            warm_up_extractor(self.extractor, self.warm_up_rates)
+            return True
+        
+        self._get_pool()
+        return self._wait_warmed(self._warmed_workers, timeout)
+
+    def restart(self):
+        """
+        Replace the workers so they pick up new extractor settings. The new
+        workers warm up before they take tasks; until then, and for tasks
+        already queued, the old ones keep serving.
+        """
+        if self.workers == 0:
+            return
+        pool, warmed_workers = self._new_pool()
+        if not self._wait_warmed(warmed_workers, self.task_timeout):
+            logger.warning(f"Replacement extraction workers did not finish warming up within {self.task_timeout:g}s")
+        with self._lock:
+            old_pool, self._pool, self._warmed_workers = self._pool, pool, warmed_workers
+        if old_pool is not None:
+            old_pool.close()
+            threading.Thread(target=old_pool.join, daemon=True).start()
+
+    def shutdown(self):
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool.join()
+                self._pool = None
+
+def model_file_version(path: str) -> str:
+    """Short content hash of a model file, used to version cached results."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+MODEL_PATHS = [
+    "models/improved_audio_classifier_random_forest.joblib",
+    "improved_audio_classifier_random_forest.joblib",
+    os.path.join(os.path.dirname(__file__), "models", "improved_audio_classifier_random_forest.joblib"),
+    os.path.join(os.path.dirname(__file__), "improved_audio_classifier_random_forest.joblib")
+]
+
+def find_model_path() -> Optional[str]:
+    """The first model file that exists, or None."""
+    for path in MODEL_PATHS:
+        if os.path.exists(path):
+            return path
+    return None
+
+def read_model(model_path: Optional[str]):
+    """
+    Load and compile the model at ``model_path`` (a dummy model if None), from
+    its compiled copy when there is one. Returns (model dict, source); the
+    dict's 'version' is the model file's content hash.
+    """
+    if model_path is None:
+        logger.warning("Model not found, creating dummy model for testing")
+        loaded = compile_model(create_dummy_model())
+        loaded['version'] = f'dummy-{uuid.uuid4().hex[:8]}'
+        return loaded, 'dummy'
+    
+    version = model_file_version(model_path)
+    loaded = compiled_models.load(version)
+    source = 'compiled'
+    if loaded is None:
+        logger.info(f"Loading model from: {model_path}")
+        loaded = compile_model(joblib.load(model_path))
+        compiled_models.save(version, loaded)
+        source = 'joblib'
+    else:
+        logger.info(f"Loaded compiled model {version} from {compiled_models.directory}")
+    loaded['version'] = version
+    return loaded, source
+
+def current_model_version() -> Optional[str]:
+    """Version of the model serving now; the result cache and feature store key results by it."""
+    return model_version
+
+def load_model():
+    global model_data, model_version, feature_extractor, extraction_pool, feature_store
+    
+    try:
+        load_started = time.perf_counter()
+        model_data, model_source = read_model(find_model_path())
+        model_version = model_data['version']
+        
+        feature_extractor = LocalAudioFeatureExtractor(model_data['feature_names'])
+        if SKIP_UNUSED_FEATURES and model_data['projection'] is not None:
+            feature_extractor.set_required_features(model_data['projection'].feature_names)
+        if extraction_pool is not None:
+            extraction_pool.shutdown()
+        extraction_pool = ExtractionPool(
+            feature_extractor, MAX_WORKERS, TASK_TIMEOUT, WORKER_MAX_TASKS, WORKER_START_METHOD,
+            WARMUP_SAMPLE_RATES if WARMUP else ()
+        )
+        if FEATURE_STORE_DIR:
+            feature_store = FeatureStore(FEATURE_STORE_DIR, model_data['feature_names'], current_model_version)
+        try:
+            cascade.load(feature_extractor)
         except Exception as e:
-            logger.error(f"Error extracting features: {e}")
+            logger.warning(f"Cascade first tier could not be loaded, running without it: {e}")
+        startup_info.update({
+            'model_source': model_source,
+            'model_load_seconds': round(time.perf_counter() - load_started, 3)
+        })
+        logger.info("✅ Model loaded successfully!")
+        return True
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to load model: {e}")
+        return False
+
+def compile_model(loaded: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the folded preprocessing and the compiled forest to a loaded model dict."""
+    loaded['projection'] = FeatureProjection.compile(loaded)
+    loaded['compiled_model'] = CompiledForest.compile(loaded['model'])
+    return loaded
+
+class CompiledModelCache:
+    """
+    Compiled models saved next to the model file, one per model version.
+
+    A compiled model holds the FeatureProjection and CompiledForest arrays and
+    the metadata the endpoints read, but no scikit-learn objects, so loading
+    one neither unpickles the forest nor imports scikit-learn. The arrays are
+    memory-mapped read-only, so every process serving the same model shares
+    one copy of them in the page cache.
+    """
+
+    # Bumped whenever FeatureProjection or CompiledForest change their attributes
+    FORMAT = 1
+    # Model dict entries the endpoints read besides the compiled parts
+    METADATA_KEYS = ('model_type', 'feature_names', 'selected_feature_names', 'label_map', 'class_weights')
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def path(self, version: str) -> str:
+        return os.path.join(self.directory, f'{version}.joblib')
+
+    def load(self, version: str) -> Optional[Dict[str, Any]]:
+        """The compiled model for ``version``, or None if there is none."""
+        if not self.directory or not os.path.exists(self.path(version)):
             return None
+        try:
+            saved = joblib.load(self.path(version), mmap_mode='r')
+            if saved.get('format') != self.FORMAT:
+                return None
+            compiled = {key: saved[key] for key in self.METADATA_KEYS if key in saved}
+            compiled['projection'] = restore_state(FeatureProjection, saved['projection'])
+            compiled['compiled_model'] = restore_state(CompiledForest, saved['compiled_model'])
+            return compiled
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable compiled model {self.path(version)}: {e}")
+            return None
+
+    def save(self, version: str, loaded: Dict[str, Any]):
+        """Save the compiled parts of ``loaded``; models that did not fully compile are skipped."""
+        if not self.directory or loaded.get('projection') is None or loaded.get('compiled_model') is None:
+            return
+        saved = {key: loaded[key] for key in self.METADATA_KEYS if key in loaded}
+        saved['format'] = self.FORMAT
+        # Plain attribute dicts, so the file does not depend on the module name the classes were pickled under
+        saved['projection'] = vars(loaded['projection'])
+        saved['compiled_model'] = vars(loaded['compiled_model'])
+        temp_path = f'{self.path(version)}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            joblib.dump(saved, temp_path)
+            os.replace(temp_path, self.path(version))
+        except Exception as e:
+            logger.warning(f"Could not save the compiled model to {self.directory}: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+def restore_state(cls, state: Dict[str, Any]):
+    """Rebuild an instance of ``cls`` from its saved attribute dict."""
+    instance = cls.__new__(cls)
+    # Plain ndarray views over the memory-mapped buffers
+    instance.__dict__.update({
+        key: np.asarray(value) if isinstance(value, np.ndarray) else value for key, value in state.items()
+    })
+    return instance
+
+compiled_models = CompiledModelCache(COMPILED_MODEL_DIR)
+
+def create_dummy_model():
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+    from sklearn.feature_selection import VarianceThreshold, SelectKBest, f_classif
+    
+    feature_names = list(FEATURE_NAMES)
+    
+    variance_selector = VarianceThreshold(threshold=0.01)
+    scaler = StandardScaler()
+    feature_selector = SelectKBest(f_classif, k=30)
+    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    
+    X_dummy = np.random.randn(100, len(feature_names))
+    y_dummy = np.random.randint(0, 2, 100)
+    
+    X_var = variance_selector.fit_transform(X_dummy)
+    X_scaled = scaler.fit_transform(X_var)
+    X_selected = feature_selector.fit_transform(X_scaled, y_dummy)
+    
+    model.fit(X_selected, y_dummy)
+    
+    selected_indices = feature_selector.get_support(indices=True)
+    selected_feature_names = [feature_names[i] for i in selected_indices]
+    
+    return {
+        'model': model,
+        'variance_selector': variance_selector,
+        'scaler': scaler,
+        'feature_selector': feature_selector,
+        'model_type': 'random_forest',
+        'feature_names': feature_names,
+        'selected_feature_names': selected_feature_names,
+        'label_map': {0: 'Christian', 1: 'Secular'},
+        'class_weights': {}
+    }
+
+class FeatureProjection:
+    """
+    The model's preprocessing pipeline folded into a single step.
+
+    VarianceThreshold and SelectKBest only drop columns and StandardScaler
+    subtracts a mean and divides by a scale per column, so the three
+    transforms reduce to one gather of the selected input columns followed by
+    the scaler's offset and scale for those columns. The arithmetic is the
+    scaler's own, column for column, so the output is identical
+    (tests/test_compiled_model.py checks it on the shipped model).
+    """
+
+    def __init__(self, model_data: Dict[str, Any]):
+        variance_columns = model_data['variance_selector'].get_support(indices=True)
+        selected = model_data['feature_selector'].get_support(indices=True)
+        scaler = model_data['scaler']
+        self.columns = variance_columns[selected]
+        self.offset = scaler.mean_[selected] if scaler.with_mean else None
+        self.scale = scaler.scale_[selected] if scaler.with_std else None
+        self.feature_names = [model_data['feature_names'][i] for i in self.columns]
+
+    @classmethod
+    def compile(cls, model_data: Dict[str, Any]) -> Optional['FeatureProjection']:
+        """
+        Fold the pipeline of ``model_data``; None if it cannot be folded. A few
+        rows are run both ways as a guard: a difference means the pipeline is
+        not the one the fold assumes, which is logged as an error.
+        """
+        try:
+            projection = cls(model_data)
+            guard = np.logspace(-3, 4, len(model_data['feature_names'])) * np.array([[1.0], [-1.0], [0.5]])
+            if np.array_equal(projection.transform(guard), transform_stepwise(model_data, guard)):
+                return projection
+            logger.error("Folded preprocessing differs from the model's pipeline, using the three transforms")
+        except Exception as e:
+            logger.error(f"Could not fold the preprocessing pipeline, using the three transforms: {e}")
+        return None
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Model input for the float64 rows of X, as the three pipeline transforms produce it."""
+        X_processed = X[:, self.columns]
+        if self.offset is not None:
+            X_processed -= self.offset
+        if self.scale is not None:
+            X_processed /= self.scale
+        return X_processed
+
+def transform_stepwise(model_data: Dict[str, Any], X: np.ndarray) -> np.ndarray:
+    """Run the variance selector, scaler and feature selector of ``model_data`` in turn."""
+    X_variance_filtered = model_data['variance_selector'].transform(X)
+    X_scaled = model_data['scaler'].transform(X_variance_filtered)
+    return model_data['feature_selector'].transform(X_scaled)
+
+class CompiledForest:
+    """
+    A fitted RandomForestClassifier flattened into contiguous node arrays.
+
+    Every tree's nodes are concatenated into one set of arrays (feature,
+    threshold, children, missing-value direction and leaf class
+    probabilities); leaves point at themselves, so all trees are walked
+    together, one level per step, for every row at once. The probabilities
+    are averaged in tree order and the label is taken from them, exactly as
+    scikit-learn does, so predict() returns the same labels and the same
+    probabilities bit for bit, without the per-call overhead of the two
+    scikit-learn calls.
+    """
+
+    # Rows walked together; keeps the (trees, rows) working arrays cache-sized
+    BLOCK_ROWS = 256
+
+    def __init__(self, model):
+        from sklearn import __version__ as sklearn_version
+        
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        if model.n_outputs_ != 1:
+            raise ValueError("Only single-output forests can be compiled")
+        
+        n_classes = len(model.classes_)
+        # scikit-learn < 1.4 stores class counts in the leaves and normalizes them per prediction
+        normalize = tuple(int(part) for part in sklearn_version.split('.')[:2]) < (1, 4)
+        offsets = np.cumsum([0] + [tree.node_count for tree in trees])
+        features, thresholds, lefts, rights, missing_left, values = [], [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            node_ids = np.arange(tree.node_count)
+            leaf = tree.children_left == -1
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            lefts.append(np.where(leaf, node_ids, tree.children_left) + offset)
+            rights.append(np.where(leaf, node_ids, tree.children_right) + offset)
+            missing_left.append(
+                np.asarray(getattr(tree, 'missing_go_to_left', np.zeros(tree.node_count)), dtype=bool)
+            )
+            value = tree.value[:, 0, :n_classes].astype(np.float64)
+            if normalize:
+                normalizer = value.sum(axis=1)[:, np.newaxis]
+                normalizer[normalizer == 0.0] = 1.0
+                value /= normalizer
+            values.append(value)
+        
+        self.classes = model.classes_
+        self.n_trees = len(trees)
+        self.depth = max(tree.max_depth for tree in trees)
+        self.roots = offsets[:-1].astype(np.intp)
+        self.feature = np.concatenate(features).astype(np.intp)
+        self.threshold = np.concatenate(thresholds)
+        # children[2 * node] is the left child, children[2 * node + 1] the right one
+        self.children = np.stack([np.concatenate(lefts), np.concatenate(rights)], axis=1).ravel().astype(np.intp)
+        self.missing_left = np.concatenate(missing_left)
+        self.value = np.concatenate(values)
+
+    @classmethod
+    def compile(cls, model) -> Optional['CompiledForest']:
+        """Compile ``model`` if it is a random-forest classifier, else return None."""
+        try:
+            from sklearn.ensemble import RandomForestClassifier
+            if isinstance(model, RandomForestClassifier):
+                return cls(model)
+        except Exception as e:
+            logger.warning(f"Could not compile the model, using scikit-learn inference: {e}")
+        return None
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """Class probabilities of the rows of X, as RandomForestClassifier.predict_proba."""
+        # The trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if np.isinf(X).any():
+            raise ValueError("Input X contains infinity or a value too large for dtype('float32').")
+        X = X.astype(np.float64)
+        
+        probabilities = np.empty((len(X), len(self.classes)))
+        for start in range(0, len(X), self.BLOCK_ROWS):
+            leaves = self._leaves(X[start:start + self.BLOCK_ROWS])
+            # Summed tree after tree, like scikit-learn's accumulation
+            block = probabilities[start:start + self.BLOCK_ROWS]
+            np.add.reduce(self.value[leaves], axis=0, out=block)
+            block /= self.n_trees
+        return probabilities
+
+    def _leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf reached by each row of X in each tree, as a (trees, rows) array of node ids."""
+        flat_X = X.ravel()
+        row_offsets = np.arange(len(X)) * X.shape[1]
+        has_missing = np.isnan(flat_X).any()
+        nodes = np.repeat(self.roots[:, np.newaxis], len(X), axis=1)
+        for _ in range(self.depth):
+            values = flat_X[self.feature[nodes] + row_offsets]
+            go_right = values > self.threshold[nodes]
+            if has_missing:
+                missing = np.isnan(values)
+                go_right[missing] = ~self.missing_left[nodes[missing]]
+            nodes = self.children[2 * nodes + go_right]
+        return nodes
+
+    def predict(self, X: np.ndarray):
+        """Returns (predicted labels, class probabilities), with the labels derived from the probabilities."""
+        probabilities = self.predict_proba(X)
+        return self.classes.take(np.argmax(probabilities, axis=1), axis=0), probabilities
+
+def predict_matrix(X: np.ndarray, model: Optional[Dict[str, Any]] = None):
+    """
+    Run the preprocessing pipeline and model (default: the serving model) on an
+    (N, n_features) matrix in model column order. Returns (predicted labels,
+    class probabilities).
+    """
+    model = model or model_data
+    if model is None:
+        raise ValueError("Model not loaded")
+    
+    with service_metrics.timed('inference'):
+        X = np.asarray(X, dtype=np.float64)
+        projection = model.get('projection')
+        if projection is not None:
+            X_processed = projection.transform(X)
+        else:
+            X_processed = transform_stepwise(model, X)
+        
+        compiled_model = model.get('compiled_model')
+        if compiled_model is not None:
+            return compiled_model.predict(X_processed)
+        
+        predictions = model['model'].predict(X_processed)
+        probabilities = model['model'].predict_proba(X_processed)
+        return predictions, probabilities
+
+class InferenceBatcher:
+    """
+    Coalesces single-row predictions from concurrent requests into one model call.
+
+    The first queued row opens a batch; rows arriving within ``window_ms`` of
+    it (up to ``max_rows``) join it, then the pipeline runs once and each
+    waiting request receives its own row of the output. If that call fails,
+    the rows are predicted one at a time, so a row the model rejects only
+    fails its own request. With ``window_ms=0`` rows are predicted directly
+    on the calling thread.
+    """
+
+    # Upper bounds of the batch-size histogram buckets
+    SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+    def __init__(self, window_ms: float, max_rows: int):
+        self.window = max(window_ms, 0.0) / 1000
+        self.max_rows = max(max_rows, 1)
+        self._queue = Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._rows = 0
+        self._max_batch = 0
+        self._size_histogram = [0] * (len(self.SIZE_BUCKETS) + 1)
+        self._queue_wait_total = 0.0
+        self._queue_wait_max = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_rows > 1
+
+    def predict(self, features: np.ndarray):
+        """
+        Predict one feature vector; returns (label, probabilities, model dict
+        that produced them) or raises the model error.
+        """
+        if not self.enabled:
+            model = model_data
+            predictions, probabilities = predict_matrix(features.reshape(1, -1), model)
+            self._record(1, 0.0, 0.0)
+            return predictions[0], probabilities[0], model
+        
+        self._ensure_started()
+        future = Future()
+        self._queue.put((features, time.perf_counter(), future))
+        # The model runs on the batcher thread; the request's inference time is its wait
+        with request_timings.stage('inference'):
+            return future.result()
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name='inference-batcher', daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            deadline = first[1] + self.window
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.perf_counter()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except Empty:
+                    break
+            
+            started = time.perf_counter()
+            waits = [started - enqueued for _, enqueued, _ in batch]
+            model = model_data
+            try:
+                predictions, probabilities = predict_matrix(np.stack([features for features, _, _ in batch]), model)
+            except Exception as e:
+                if len(batch) == 1:
+                    batch[0][2].set_exception(e)
+                else:
+                    self._predict_rows(batch, model)
+            else:
+                for i, (_, _, future) in enumerate(batch):
+                    future.set_result((predictions[i], probabilities[i], model))
+            self._record(len(batch), sum(waits), max(waits))
+
+    @staticmethod
+    def _predict_rows(batch: List[tuple], model: Optional[Dict[str, Any]]):
+        for features, _, future in batch:
+            try:
+                predictions, probabilities = predict_matrix(features.reshape(1, -1), model)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result((predictions[0], probabilities[0], model))
+
+    def _record(self, size: int, total_wait: float, max_wait: float):
+        with self._stats_lock:
+            self._batches += 1
+            self._rows += size
+            self._max_batch = max(self._max_batch, size)
+            self._size_histogram[bisect.bisect_left(self.SIZE_BUCKETS, size)] += 1
+            self._queue_wait_total += total_wait
+            self._queue_wait_max = max(self._queue_wait_max, max_wait)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            labels = [f'<={bound}' for bound in self.SIZE_BUCKETS] + [f'>{self.SIZE_BUCKETS[-1]}']
+            return {
+                'enabled': self.enabled,
+                'window_ms': self.window * 1000,
+                'max_rows': self.max_rows,
+                'queued_rows': self._queue.qsize(),
+                'batches': self._batches,
+                'rows': self._rows,
+                'average_batch_size': round(self._rows / self._batches, 3) if self._batches else 0.0,
+                'max_batch_size': self._max_batch,
+                'batch_size_histogram': dict(zip(labels, self._size_histogram)),
+                'average_queue_wait_ms': round(self._queue_wait_total / self._rows * 1000, 3) if self._rows else 0.0,
+                'max_queue_wait_ms': round(self._queue_wait_max * 1000, 3)
+            }
+
+inference_batcher = InferenceBatcher(BATCH_WINDOW_MS, MAX_BATCH_ROWS)
+
+service_metrics = ServiceMetrics()
+
+# Set in production mode; None when this process is the only one serving
+worker_metrics = None
+
+def process_counters() -> Dict[str, int]:
+    """This process's cache, batching, cascade, extraction and admission counters."""
+    cache = result_cache.stats()
+    batching = inference_batcher.stats()
+    cascade_stats = cascade.stats()
+    return {
+        'cache_memory_hits': cache['memory_hits'],
+        'cache_disk_hits': cache['disk_hits'],
+        'cache_misses': cache['misses'],
+        'inference_batches': batching['batches'],
+        'inference_batch_rows': batching['rows'],
+        'cascade_tier1_answers': cascade_stats['tier1_answers'],
+        'cascade_tier2_answers': cascade_stats['tier2_answers'],
+        'extraction_timeouts': extraction_pool.timeouts if extraction_pool is not None else 0,
+        'admission_rejected_interactive': admission.rejected['interactive'],
+        'admission_rejected_bulk': admission.rejected['bulk']
+    }
+
+def combined_metrics():
+    """
+    Request metrics and process_counters() of this process, together with
+    those of every other server worker in production mode.
+    """
+    counters = process_counters()
+    if worker_metrics is None:
+        return service_metrics, counters
+    combined = ServiceMetrics()
+    combined.merge(service_metrics.state())
+    for state in worker_metrics.others():
+        combined.merge(state['http'])
+        for counter, n in state['counters'].items():
+            counters[counter] = counters.get(counter, 0) + n
+    return combined, counters
+
+class AdmissionController:
+    """
+    Admission and scheduling of classification work by traffic class.
+
+    Requests are 'interactive' (one song) or 'bulk' (batches, re-scoring,
+    training). Each class admits at most ``limits[class]`` requests at a
+    time, running or waiting; a request beyond that is turned away at once
+    (429 with a Retry-After estimate) rather than joining a queue it would
+    time out in, which also bounds the audio held in memory. Admitted
+    requests then take one of ``slots`` work slots per unit of work: the
+    extraction of a single-song request, or of one song of a batch. A freed
+    slot goes straight to a waiting unit, picked by weighted round-robin
+    (``weights[class]`` units per turn), so a song from one phone waits for
+    a song or two of another phone's 1000-song batch, not for all of it.
+    Work outside an admitted request (warm-up, reloads) does not take slots.
+    """
+
+    CLASSES = ('interactive', 'bulk')
+    # Smoothing of the request durations Retry-After is estimated from
+    DURATION_ALPHA = 0.2
+    MAX_RETRY_AFTER = 600
+
+    def __init__(self, slots: int, limits: Dict[str, int], weights: Dict[str, int]):
+        self.slots = max(slots, 1)
+        self.limits = limits
+        self.weights = {cls: max(weights[cls], 1) for cls in self.CLASSES}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._free = self.slots
+        self._waiting = {cls: deque() for cls in self.CLASSES}
+        self._credits = dict(self.weights)
+        self._admitted = {cls: {} for cls in self.CLASSES}
+        self._durations = {cls: None for cls in self.CLASSES}
+        self._waits = {cls: LatencyHistogram() for cls in self.CLASSES}
+        self.rejected = {cls: 0 for cls in self.CLASSES}
+
+    @property
+    def current_class(self) -> Optional[str]:
+        return getattr(self._local, 'traffic_class', None)
+
+    def admit(self, traffic_class: str) -> bool:
+        """Admit the current thread's request, or return False if its class is full."""
+        with self._lock:
+            admitted = self._admitted[traffic_class]
+            if self.limits[traffic_class] and len(admitted) >= self.limits[traffic_class]:
+                self.rejected[traffic_class] += 1
+                return False
+            admitted[threading.get_ident()] = time.monotonic()
+        self._local.traffic_class = traffic_class
+        return True
+
+    def finish(self):
+        """End the current thread's admitted request, if it has one."""
+        traffic_class = self.current_class
+        if traffic_class is None:
+            return
+        while getattr(self._local, 'held', 0):
+            self.release()
+        self._local.traffic_class = None
+        with self._lock:
+            started = self._admitted[traffic_class].pop(threading.get_ident(), None)
+            if started is not None:
+                seconds = time.monotonic() - started
+                average = self._durations[traffic_class]
+                self._durations[traffic_class] = seconds if average is None else (
+                    average + self.DURATION_ALPHA * (seconds - average)
+                )
+
+    def retry_after(self, traffic_class: str) -> int:
+        """Seconds until the oldest admitted request of the class is expected to finish."""
+        with self._lock:
+            average = self._durations[traffic_class]
+            started = min(self._admitted[traffic_class].values(), default=None)
+        if average is None or started is None:
+            return 1
+        remaining = average - (time.monotonic() - started)
+        return min(max(math.ceil(remaining), 1), self.MAX_RETRY_AFTER)
+
+    def acquire(self, block: bool = True) -> bool:
+        """
+        Take a work slot for the current request's class. Without ``block``
+        only a slot that is free right now is taken. Threads outside an
+        admitted request always get one; they are not counted.
+        """
+        traffic_class = self.current_class
+        if traffic_class is None:
+            return True
+        with self._lock:
+            if self._free > 0:
+                self._free -= 1
+                granted = None
+            elif not block:
+                return False
+            else:
+                granted = threading.Event()
+                self._waiting[traffic_class].append(granted)
+        if granted is not None:
+            started = time.perf_counter()
+            granted.wait()
+            waited = time.perf_counter() - started
+            with self._lock:
+                self._waits[traffic_class].observe(waited)
+        self._local.held = getattr(self._local, 'held', 0) + 1
+        return True
+
+    def release(self):
+        """Hand a slot the current thread holds to the next waiting unit, or free it."""
+        if not getattr(self._local, 'held', 0):
+            return
+        self._local.held -= 1
+        with self._lock:
+            waiting = [cls for cls in self.CLASSES if self._waiting[cls]]
+            if not waiting:
+                self._free += 1
+                return
+            if not any(self._credits[cls] for cls in waiting):
+                self._credits = dict(self.weights)
+            traffic_class = next(cls for cls in waiting if self._credits[cls])
+            self._credits[traffic_class] -= 1
+            self._waiting[traffic_class].popleft().set()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    @contextmanager
+    def scheduled_as(self, traffic_class: str):
+        """Have background work on this thread take slots as ``traffic_class``, without admitting a request."""
+        self._local.traffic_class = traffic_class
+        try:
+            yield
+        finally:
+            self.finish()
+
+    def stats(self) -> Dict[str, Any]:
+        classes = {}
+        with self._lock:
+            for cls in self.CLASSES:
+                average = self._durations[cls]
+                classes[cls] = {
+                    'admitted': len(self._admitted[cls]),
+                    'limit': self.limits[cls],
+                    'waiting_for_slot': len(self._waiting[cls]),
+                    'rejected': self.rejected[cls],
+                    'slot_wait': self._waits[cls].summary(),
+                    'average_request_ms': round(average * 1000, 3) if average is not None else None
+                }
+            free = self._free
+        for cls in self.CLASSES:
+            classes[cls]['retry_after_seconds'] = self.retry_after(cls)
+        return {'slots': self.slots, 'free_slots': free, 'weights': self.weights, 'classes': classes}
+
+admission = AdmissionController(
+    WORK_SLOTS, {'interactive': ADMIT_INTERACTIVE, 'bulk': ADMIT_BULK}, {'interactive': INTERACTIVE_WEIGHT, 'bulk': 1}
+)
+
+# Traffic class of each classification endpoint; other endpoints are not admission-controlled
+ENDPOINT_TRAFFIC_CLASSES = {
+    '/classify': 'interactive',
+    '/classify_features': 'interactive',
+    '/classify_audio_data': 'interactive',
+    '/classify_audio_file': 'interactive',
+    '/classify_file': 'interactive',
+    '/batch_classify': 'bulk',
+    '/rescore': 'bulk',
+    '/cascade/train': 'bulk',
+    '/jobs': 'bulk',
+    '/jobs/<job_id>/items/<int:index>': 'bulk'
+}
+
+profile_sampler = ProfileSampler(PROFILE_EVERY, PROFILE_DIR, PROFILE_KEEP)
+
+def build_result(prediction, probabilities: np.ndarray, model: Optional[Dict[str, Any]] = None,
+                 version: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Format one output row of ``model`` (default: the serving model) as the JSON
+    result the app expects; ``version`` overrides the reported model version.
+    """
+    model = model or model_data
+    return {
+        'success': True,
+        'prediction': model['label_map'].get(prediction, str(prediction)),
+        'confidence': float(max(probabilities)),
+        'probabilities': {
+            'christian': float(probabilities[0]),
+            'secular': float(probabilities[1])
+        },
+        'model_version': version or model['version']
+    }
+
+def classify_vector(features: np.ndarray, outcome: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Classify one feature vector through the micro-batcher; raises on model
+    errors. With a cascade ``outcome`` the answering tier is reported, and a
+    first-tier answer is used as is.
+    """
+    if outcome is not None:
+        cascade.record(outcome)
+        if outcome['tier'] == 1:
+            return first_tier_result(outcome)
     
-    def _skewness(self, data):
-        mean = np.mean(data)
-        std = np.std(data)
-        if std == 0:
-            return 0.0
-        return np.mean(((data - mean) / std) ** 3)
+    prediction, probabilities, model = inference_batcher.predict(features)
+    result = build_result(prediction, probabilities, model)
+    if outcome is not None:
+        result['tier'] = 2
+    return result
+
+def classify_matrix(X: np.ndarray) -> List[Dict[str, Any]]:
+    """Classify every row of X with a single model call; never raises."""
+    try:
+        model = model_data
+        predictions, probabilities = predict_matrix(X, model)
+        return [build_result(prediction, row, model) for prediction, row in zip(predictions, probabilities)]
+        
+    except Exception as e:
+        logger.error(f"Classification error: {e}")
+        return [classification_error_result(e) for _ in range(len(X))]
+
+def classification_error_result(error: Exception) -> Dict[str, Any]:
+    return {
+        'prediction': 'unknown',
+        'confidence': 0.0,
+        'probabilities': {
+            'christian': 0.5,
+            'secular': 0.5
+        },
+        'success': False,
+        'error': str(error)
+    }
+
+def failed_song_result(song_id: str, error: str) -> Dict[str, Any]:
+    """Per-song error entry used in batch responses."""
+    return {
+        'song_id': song_id,
+        'prediction': 'unknown',
+        'confidence': 0.0,
+        'probabilities': {'christian': 0.5, 'secular': 0.5},
+        'success': False,
+        'error': error
+    }
+
+def classify_features(features: np.ndarray, outcome: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    try:
+        return classify_vector(features, outcome)
+        
+    except Exception as e:
+        logger.error(f"Classification error: {e}")
+        return classification_error_result(e)
+
+class ClassificationCascade:
+    """
+    Confidence-gated two-tier classification.
+
+    The first tier is a small random forest over every feature except
+    DEFERRED_FEATURES, trained to reproduce the full model's predictions on
+    the rows of the feature store. Extraction computes the cheap features,
+    asks the first tier, and runs the expensive extractors and the full
+    pipeline only when its confidence is below ``threshold``. A first tier is
+    tied to the model version it was trained against.
+    """
+
+    THRESHOLD_REPORT = (0.6, 0.7, 0.8, 0.9, 0.95, 0.99)
+
+    def __init__(self, path: str, threshold: float):
+        self.path = path
+        self.threshold = threshold
+        self.first_tier = None
+        self._lock = threading.Lock()
+        self._answers = [0, 0]
+        self._cheap_seconds = 0.0
+        self._deferred_seconds = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.first_tier is not None and self.threshold > 0
+
+    def load(self, extractor: LocalAudioFeatureExtractor):
+        """Attach the saved first tier to ``extractor`` if it matches the current model."""
+        self.first_tier = None
+        extractor.set_first_tier(None, self.threshold)
+        if self.threshold <= 0 or not self.path or not os.path.exists(self.path):
+            return
+        
+        first_tier = joblib.load(self.path)
+        if first_tier['trained_for'] != model_version:
+            logger.warning(f"Ignoring cascade first tier at {self.path}: trained for model "
+                           f"{first_tier['trained_for']}, loaded model is {model_version}")
+            return
+        self.first_tier = first_tier
+        extractor.set_first_tier(first_tier, self.threshold)
+        logger.info(f"Cascade enabled: first tier on {len(first_tier['feature_names'])} features, "
+                    f"threshold {self.threshold:g}")
+
+    def train(self, extractor: LocalAudioFeatureExtractor, X: np.ndarray, holdout: float = 0.2,
+              n_estimators: int = 100, max_depth: int = 12) -> Dict[str, Any]:
+        """
+        Fit a first tier on the cheap columns of ``X`` (rows in model column
+        order) against the current model's predictions, save it and attach it
+        to ``extractor``. Returns coverage/agreement on the held-out rows.
+        """
+        from sklearn.ensemble import RandomForestClassifier
+        
+        serving_model = model_data
+        labels = np.concatenate([
+            predict_matrix(X[start:start + 8192], serving_model)[0] for start in range(0, len(X), 8192)
+        ])
+        if len(np.unique(labels)) < 2:
+            raise ValueError("Stored rows are all predicted as one class; nothing to learn")
+        
+        deferred = set(DEFERRED_FEATURES)
+        feature_names = [name for name in extractor.feature_names if name not in deferred]
+        X_cheap = np.asarray(X, dtype=np.float64)[:, [extractor.feature_names.index(name) for name in feature_names]]
+        
+        order = np.random.default_rng(42).permutation(len(X_cheap))
+        n_holdout = int(len(order) * holdout)
+        held_out, training = order[:n_holdout], order[n_holdout:]
+        
+        model = RandomForestClassifier(
+            n_estimators=n_estimators, max_depth=max_depth, min_samples_leaf=2, n_jobs=1, random_state=42
+        )
+        model.fit(X_cheap[training], labels[training])
+        
+        report = {}
+        if n_holdout:
+            probabilities = model.predict_proba(X_cheap[held_out])
+            confidence = probabilities.max(axis=1)
+            agrees = model.classes_[probabilities.argmax(axis=1)] == labels[held_out]
+            for threshold in sorted(set(self.THRESHOLD_REPORT) | {self.threshold}):
+                answered = confidence >= threshold
+                report[f'{threshold:g}'] = {
+                    'tier1_coverage': round(float(answered.mean()), 4),
+                    'agreement_with_full_model': round(float(agrees[answered].mean()), 4) if answered.any() else None
+                }
+        
+        first_tier = {
+            'model': model,
+            'feature_names': feature_names,
+            'trained_for': serving_model['version'],
+            'trained_at': time.time(),
+            'rows': len(training),
+            'holdout': report
+        }
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        temp_path = f'{self.path}.tmp'
+        joblib.dump(first_tier, temp_path)
+        os.replace(temp_path, self.path)
+        
+        self.first_tier = first_tier
+        extractor.set_first_tier(first_tier, self.threshold)
+        return report
+
+    def record(self, outcome: Dict[str, Any]):
+        with self._lock:
+            self._answers[outcome['tier'] - 1] += 1
+            self._cheap_seconds += outcome['cheap_seconds']
+            self._deferred_seconds += outcome['deferred_seconds']
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tier1, tier2 = self._answers
+            cheap_seconds, deferred_seconds = self._cheap_seconds, self._deferred_seconds
+        total = tier1 + tier2
+        # Deferred extraction cost is only observed on tier-2 answers; each tier-1 answer saved one of those
+        average_deferred = deferred_seconds / tier2 if tier2 else 0.0
+        first_tier = self.first_tier
+        return {
+            'active': self.active,
+            'threshold': self.threshold,
+            'first_tier': {
+                'trained_for': first_tier['trained_for'],
+                'trained_at': first_tier['trained_at'],
+                'rows': first_tier['rows'],
+                'features': len(first_tier['feature_names'])
+            } if first_tier is not None else None,
+            'tier1_answers': tier1,
+            'tier2_answers': tier2,
+            'tier1_hit_rate': round(tier1 / total, 4) if total else 0.0,
+            'average_cheap_cpu_ms': round(cheap_seconds / total * 1000, 3) if total else 0.0,
+            'average_deferred_cpu_ms': round(average_deferred * 1000, 3),
+            'average_cpu_saved_ms': round(tier1 * average_deferred / total * 1000, 3) if total else 0.0
+        }
+
+cascade = ClassificationCascade(CASCADE_MODEL_PATH, CASCADE_THRESHOLD)
+
+def extract_for_classification(audio_data: np.ndarray, sample_rate: int, fit_to_window: bool = True):
+    """
+    Extract features, through the cascade when it is active. Returns
+    (features, cascade outcome or None); features is None on failure.
+    """
+    if not cascade.active:
+        return extraction_pool.extract_vector(audio_data, sample_rate, fit_to_window), None
+    return extraction_pool.extract_tiered(audio_data, sample_rate, fit_to_window)
+
+def first_tier_result(outcome: Dict[str, Any]) -> Dict[str, Any]:
+    # Reported as the model version the first tier was trained to reproduce
+    result = build_result(outcome['prediction'], outcome['probabilities'], version=outcome['model_version'])
+    result['tier'] = 1
+    return result
+
+def classify_audio_batch(songs: List[tuple], fit_to_window: bool = True,
+                         include_features: bool = False) -> List[Dict[str, Any]]:
+    """
+    Classify (song_id, content_key, audio, sample_rate) songs together and
+    return one result per song, failures included. Extraction is fanned out
+    across the worker pool, one matrix row per song, and every song the
+    cascade's first tier did not answer goes into a single model call.
+    """
+    results = [None] * len(songs)
+    feature_matrix = feature_extractor.new_matrix(len(songs))
+    outcomes = extraction_pool.extract_rows(
+        [(audio, sample_rate) for _, _, audio, sample_rate in songs], feature_matrix, fit_to_window,
+        tiered=cascade.active
+    )
+    
+    extracted_rows = []
+    extracted = []
+    for row, ((song_id, content_key, _, _), outcome) in enumerate(zip(songs, outcomes)):
+        if outcome is True or isinstance(outcome, dict):
+            extracted_rows.append(row)
+            extracted.append((row, song_id, content_key, outcome if outcome is not True else None))
+            continue
+        if isinstance(outcome, Exception):
+            logger.error(f"Error processing song {song_id}: {outcome}")
+            results[row] = failed_song_result(song_id, str(outcome))
+        else:
+            results[row] = failed_song_result(song_id, 'Failed to extract features')
+    
+    if extracted:
+        X = feature_matrix[extracted_rows]
+        full_rows = [n for n, (_, _, _, outcome) in enumerate(extracted) if outcome is None or outcome['tier'] == 2]
+        full_results = iter(classify_matrix(X[full_rows]) if full_rows else [])
+        stored = []
+        for (row, song_id, content_key, outcome), features in zip(extracted, X):
+            if outcome is not None:
+                cascade.record(outcome)
+            if outcome is not None and outcome['tier'] == 1:
+                result = first_tier_result(outcome)
+            else:
+                result = next(full_results)
+                if outcome is not None:
+                    result['tier'] = 2
+            result_cache.put(content_key, features, result)
+            if storable(features, result):
+                stored.append((content_key, song_id, features, result))
+            result['song_id'] = song_id
+            result['cached'] = False
+            if include_features:
+                result['features'] = features_to_dict(features, feature_extractor.feature_names)
+            results[row] = result
+        if feature_store is not None and stored:
+            feature_store.append(stored)
+    return results
+
+def wants_named_features() -> bool:
+    """True when the caller asked for the named feature values in the response."""
+    return request.args.get('include_features', '').lower() in ('1', 'true', 'yes')
+
+result_cache = ResultCache(CACHE_MEMORY_ENTRIES, CACHE_PATH, CACHE_DISK_ENTRIES, current_model_version)
+
+def storable(features: np.ndarray, result: Dict[str, Any]) -> bool:
+    """
+    True if a classification can be kept for re-scoring. Rows with features that
+    were never computed (first-tier answers, skipped extractors) cannot be.
+    """
+    return bool(result.get('success')) and not np.isnan(features).any()
 
-def skewness(data):
-    """Calculate skewness of data."""
-    mean = np.mean(data)
-    std = np.std(data)
-    if std == 0:
-        return 0.0
-    return np.mean(((data - mean) / std) ** 3)
+def record_classification(content_key: str, song_id: str, features: np.ndarray, result: Dict[str, Any]):
+    """Cache a freshly computed classification and keep its features for re-scoring."""
+    result_cache.put(content_key, features, result)
+    if feature_store is not None and storable(features, result):
+        feature_store.append([(content_key, song_id, features, result)])
 
-def extract_features_from_audio_data(audio_data: np.ndarray, sample_rate: int = 22050) -> Optional[Dict[str, float]]:
+class UploadStream(io.RawIOBase):
     """
-    Extract features from raw audio data using the same method as the original training.
-    This replicates the feature extraction from improved_audio_classifier.py
+    Seekable view of a request body that is read from the socket on demand.
+
+    Decoders get random access to the first ``head_bytes`` of the upload and
+    to a sliding window behind the furthest byte received. Containers that
+    peek at their end (Ogg, MP3 tags) still open, but bytes between the two
+    are dropped, so memory stays bounded however large the file is. Every
+    byte is hashed as it arrives, so once the upload has been read to its
+    end it has the same content key as the buffered file.
     """
-    try:
-        y = audio_data
-        sr = sample_rate
-        
-        if len(y) == 0:
+
+    CHUNK_BYTES = 64 * 1024
+    TAIL_BYTES = 1024 * 1024
+
+    def __init__(self, stream, length: int, head_bytes: int):
+        self._stream = stream
+        self.length = length
+        self.head_bytes = head_bytes
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._tail_start = 0
+        self._position = 0
+        self.received = 0
+        self._digest = hashlib.blake2b(digest_size=20)
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.length
+        self._position = max(offset, 0)
+        return self._position
+
+    def _receive(self) -> bool:
+        """Read the next chunk of the body into the head or the tail window."""
+        chunk = self._stream.read(min(self.CHUNK_BYTES, self.length - self.received))
+        if not chunk:
+            # The client sent less than its Content-Length
+            self.length = self.received
+            return False
+        
+        self._digest.update(chunk)
+        if self._tail_start == len(self._head) == self.received:
+            room = max(self.head_bytes - len(self._head), 0)
+            self._head += chunk[:room]
+            chunk = chunk[room:]
+            self.received = self._tail_start = len(self._head)
+        self._tail += chunk
+        self.received += len(chunk)
+        excess = len(self._tail) - self.TAIL_BYTES
+        if excess > 0:
+            del self._tail[:excess]
+            self._tail_start += excess
+        return True
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        filled = 0
+        while filled < len(view) and self._position < self.length:
+            if self._position >= self.received:
+                if not self._receive():
+                    break
+                continue
+            wanted = len(view) - filled
+            if self._position < len(self._head):
+                piece = self._head[self._position:self._position + wanted]
+            elif self._position >= self._tail_start:
+                start = self._position - self._tail_start
+                piece = self._tail[start:start + wanted]
+            else:
+                raise OSError(f"upload bytes at offset {self._position} are no longer buffered")
+            view[filled:filled + len(piece)] = piece
+            filled += len(piece)
+            self._position += len(piece)
+        return filled
+
+    @property
+    def replayable(self) -> bool:
+        """True while no byte of the upload has been dropped."""
+        return self._tail_start == len(self._head)
+
+    def chunks(self):
+        """Yield the whole upload from the start."""
+        if not self.replayable:
+            raise ValueError("upload is too large to be replayed from the stream")
+        self.seek(0)
+        while True:
+            chunk = self.read(self.CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+
+    def drain(self) -> int:
+        """Discard the unread rest of the body, returning how many bytes that was."""
+        drained = 0
+        while self.received < self.length:
+            chunk = self._stream.read(min(self.CHUNK_BYTES, self.length - self.received))
+            if not chunk:
+                break
+            self._digest.update(chunk)
+            self.received += len(chunk)
+            drained += len(chunk)
+        self._head = bytearray()
+        self._tail = bytearray()
+        return drained
+
+    @property
+    def content_key(self) -> Optional[str]:
+        """file_content_key of the upload, once all of it has been received."""
+        if self.received < self.length:
             return None
+        return f'file:{self._digest.hexdigest()}'
+
+class AudioDecoder:
+    """
+    Decodes uploaded audio files from memory instead of a temporary file.
+
+    The upload is either the body bytes or an UploadStream still being read
+    from the socket, in which case decoding stops as soon as the analysis
+    window is available.
+
+    1. soundfile reading the upload (WAV, FLAC, OGG/Vorbis/Opus, MP3 with a
+       recent libsndfile); identical to librosa.load on a path.
+    2. ffmpeg reading the upload on stdin and writing 16-bit WAV to stdout,
+       for containers libsndfile cannot read (AAC/M4A, WMA, ...). The PCM is
+       converted, downmixed and resampled the way librosa's audioread path did.
+    3. A temporary file, only when both fail (e.g. an MP4 whose index sits at
+       the end of the file, which ffmpeg cannot read from a pipe). It is
+       decoded by ffmpeg when available, else librosa.load. These fallbacks
+       are counted and timed so they can be spotted on /performance.
+    """
+
+    # libsndfile reads these to their end when it opens them, so streaming them saves nothing
+    READ_TO_END = ('.mp3', '.ogg', '.oga', '.opus')
+
+    def __init__(self, ffmpeg_path: Optional[str], timeout: float):
+        self.ffmpeg_path = ffmpeg_path
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self.counters = {
+            'soundfile': 0,
+            'ffmpeg_pipe': 0,
+            'tempfile': 0,
+            'failed': 0,
+            'tempfile_seconds': 0.0,
+            'streamed': 0,
+            'stream_bytes_read': 0,
+            'stream_bytes_drained': 0
+        }
+
+    def _count(self, counter: str, amount: float = 1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def decode(self, upload, file_name: str = '', sr: int = 22050, duration: float = 10):
+        """Decode the first ``duration`` seconds of ``upload`` as mono float32 at ``sr``."""
+        with service_metrics.timed('decode'):
+            return self._decode(upload, file_name, sr, duration)
+
+    def _decode(self, upload, file_name: str, sr: int, duration: float):
+        import librosa
+        streamed = isinstance(upload, UploadStream)
+        if streamed:
+            upload.seek(0)
+            chunks = upload.chunks
+        else:
+            chunks = lambda: iter((upload,))
         
-        features = {}
-        
-        # Basic properties (normalized/relative features instead of absolute)
-        features['signal_length_ratio'] = float(len(y) / (sr * 10))  # Assuming 10 second duration
-        features['rms_energy_ratio'] = float(np.sqrt(np.mean(y**2)) / (np.max(np.abs(y)) + 1e-8))
-        
-        # 1. Spectral features
-        spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
-        features['spectral_centroid_mean'] = float(np.mean(spectral_centroids))
-        features['spectral_centroid_std'] = float(np.std(spectral_centroids))
-        features['spectral_centroid_skew'] = float(skewness(spectral_centroids))
-        
-        spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
-        features['spectral_rolloff_mean'] = float(np.mean(spectral_rolloff))
-        features['spectral_rolloff_std'] = float(np.std(spectral_rolloff))
-        
-        spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
-        features['spectral_bandwidth_mean'] = float(np.mean(spectral_bandwidth))
-        features['spectral_bandwidth_std'] = float(np.std(spectral_bandwidth))
-        
-        # 2. Zero crossing rate
-        zcr = librosa.feature.zero_crossing_rate(y)[0]
-        features['zcr_mean'] = float(np.mean(zcr))
-        features['zcr_std'] = float(np.std(zcr))
-        
-        # 3. MFCC features (first 13 coefficients)
-        mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
-        for i in range(13):
-            features[f'mfcc_{i+1}_mean'] = float(np.mean(mfccs[i]))
-            features[f'mfcc_{i+1}_std'] = float(np.std(mfccs[i]))
-        
-        # 4. Chroma features (key-related)
-        chroma = librosa.feature.chroma_stft(y=y, sr=sr)
-        features['chroma_mean'] = float(np.mean(chroma))
-        features['chroma_std'] = float(np.std(chroma))
-        
-        # Individual chroma bins (12 semitones)
-        chroma_bins = np.mean(chroma, axis=1)
-        for i in range(12):
-            features[f'chroma_bin_{i}'] = float(chroma_bins[i])
-        
-        # 5. Tonnetz features (harmonic network)
-        tonnetz = librosa.feature.tonnetz(y=y, sr=sr)
-        features['tonnetz_mean'] = float(np.mean(tonnetz))
-        features['tonnetz_std'] = float(np.std(tonnetz))
-        
-        # 6. Rhythm and tempo features
-        tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
-        features['tempo'] = float(tempo) if np.isfinite(tempo) else 120.0
-        features['beat_strength'] = float(len(beats) / (len(y) / sr)) if len(y) > 0 else 0.0
-        
-        # 7. Spectral contrast
-        contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
-        features['spectral_contrast_mean'] = float(np.mean(contrast))
-        features['spectral_contrast_std'] = float(np.std(contrast))
-        
-        # 8. Spectral flatness (measure of noisiness)
-        flatness = librosa.feature.spectral_flatness(y=y)
-        features['spectral_flatness_mean'] = float(np.mean(flatness))
-        features['spectral_flatness_std'] = float(np.std(flatness))
-        
-        # 9. Dynamic features
-        features['dynamic_range'] = float(np.percentile(np.abs(y), 95) - np.percentile(np.abs(y), 5))
-        features['peak_to_rms_ratio'] = float(np.max(np.abs(y)) / (np.sqrt(np.mean(y**2)) + 1e-8))
-        
-        # 10. Harmonic-percussive separation features
         try:
-            y_harmonic, y_percussive = librosa.effects.hpss(y)
-            harmonic_energy = np.sum(y_harmonic**2)
-            percussive_energy = np.sum(y_percussive**2)
-            total_energy = harmonic_energy + percussive_energy
-            
-            features['harmonic_ratio'] = float(harmonic_energy / (total_energy + 1e-8))
-            features['percussive_ratio'] = float(percussive_energy / (total_energy + 1e-8))
-        except:
-            features['harmonic_ratio'] = 0.5
-            features['percussive_ratio'] = 0.5
-        
-        # 11. Additional spectral features
-        features['spectral_centroid_normalized'] = float(np.mean(spectral_centroids) / (sr / 2))
-        
-        # 12. Zero-padding and windowing artifacts detection
-        features['silence_ratio'] = float(np.sum(np.abs(y) < 0.01) / len(y))
+            y, sr = librosa.load(upload if streamed else io.BytesIO(upload), sr=sr, duration=duration)
+            self._count('soundfile')
+            return y, sr
+        except Exception as e:
+            logger.debug(f"soundfile could not decode {file_name or 'upload'}: {e}")
         
-        return features
+        if self.ffmpeg_path:
+            try:
+                y = self._decode_with_ffmpeg(chunks(), sr, duration)
+                self._count('ffmpeg_pipe')
+                return y, sr
+            except Exception as e:
+                logger.debug(f"ffmpeg could not decode {file_name or 'upload'}: {e}")
         
-    except Exception as e:
-        logger.error(f"Error extracting features from audio data: {e}")
-        return None
+        started = time.perf_counter()
+        suffix = os.path.splitext(file_name)[1] or '.tmp'
+        temp_file_path = None
+        try:
+            with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as temp_file:
+                temp_file_path = temp_file.name
+                for chunk in chunks():
+                    temp_file.write(chunk)
+            if self.ffmpeg_path:
+                y = self._decode_with_ffmpeg(None, sr, duration, source=temp_file_path)
+            else:
+                y, sr = librosa.load(temp_file_path, sr=sr, duration=duration)
+            self._count('tempfile')
+            logger.warning(f"Decoded {file_name or 'upload'} through a temporary file")
+            return y, sr
+        except Exception:
+            self._count('failed')
+            raise
+        finally:
+            self._count('tempfile_seconds', time.perf_counter() - started)
+            if temp_file_path is not None:
+                try:
+                    os.unlink(temp_file_path)
+                except OSError:
+                    pass
 
-def load_model():
-    global model_data, feature_extractor
-    
-    try:
-        # Try to find the model file
-        model_paths = [
-            "models/improved_audio_classifier_random_forest.joblib",
-            "improved_audio_classifier_random_forest.joblib",
-            os.path.join(os.path.dirname(__file__), "models", "improved_audio_classifier_random_forest.joblib"),
-            os.path.join(os.path.dirname(__file__), "improved_audio_classifier_random_forest.joblib")
-        ]
-        
-        model_path = None
-        for path in model_paths:
-            if os.path.exists(path):
-                model_path = path
+    def can_stop_early(self, file_name: str) -> bool:
+        """
+        True if decoding ``file_name`` from a stream can stop at the analysis
+        window. Other uploads are better received whole: their content key is
+        then known, and looked up, before anything is decoded.
+        """
+        return os.path.splitext(file_name)[1].lower() not in self.READ_TO_END
+
+    def decode_stream(self, upload: UploadStream, file_name: str = '', sr: int = 22050, duration: float = 10):
+        """
+        Decode straight from a request body that is still arriving, reading
+        only as much as the first ``duration`` seconds need. The rest is left
+        for finish_stream(), once the response has been sent.
+        """
+        self._count('streamed')
+        return self.decode(upload, file_name, sr=sr, duration=duration)
+
+    def finish_stream(self, upload: UploadStream) -> Optional[str]:
+        """Read the rest of a streamed upload; returns its file content key, or None if the client went away."""
+        self._count('stream_bytes_read', upload.received)
+        try:
+            self._count('stream_bytes_drained', upload.drain())
+        except (OSError, BadRequest) as e:
+            logger.debug(f"Streamed upload ended early: {e}")
+            return None
+        return upload.content_key
+
+    def _decode_with_ffmpeg(self, chunks, sr: int, duration: float, source: str = 'pipe:0') -> np.ndarray:
+        """Run ffmpeg on the piped ``chunks`` (or the file at ``source``) and read 16-bit WAV from its stdout."""
+        process = subprocess.Popen(
+            [self.ffmpeg_path, '-v', 'quiet', '-i', source, '-t', str(duration),
+             '-vn', '-f', 'wav', '-acodec', 'pcm_s16le', 'pipe:1'],
+            stdin=subprocess.PIPE if chunks is not None else subprocess.DEVNULL,
+            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL
+        )
+        
+        def feed():
+            try:
+                for chunk in chunks:
+                    process.stdin.write(chunk)
+            except (BrokenPipeError, ValueError):
+                pass  # ffmpeg stops reading once it has decoded the requested duration
+            finally:
+                try:
+                    process.stdin.close()
+                except OSError:
+                    pass
+        
+        feeder = threading.Thread(target=feed, daemon=True) if chunks is not None else None
+        watchdog = threading.Timer(self.timeout, process.kill)
+        if feeder is not None:
+            feeder.start()
+        watchdog.start()
+        try:
+            wav = process.stdout.read()
+            returncode = process.wait()
+        finally:
+            watchdog.cancel()
+            process.stdout.close()
+            if feeder is not None:
+                feeder.join()
+        if returncode != 0:
+            raise RuntimeError(f"ffmpeg exited with status {returncode}")
+        
+        native_sr, channels, pcm = parse_streamed_wav(wav)
+        if not pcm:
+            # ffmpeg exits cleanly on some demuxing errors, leaving only a header
+            raise ValueError("ffmpeg decoded no audio")
+        y = np.frombuffer(pcm, dtype='<i2', count=len(pcm) // (2 * channels) * channels)
+        y = (y.astype(np.float32) * np.float32(1 / 32768)).reshape(-1, channels).T
+        import librosa
+        return librosa.resample(librosa.to_mono(y), orig_sr=native_sr, target_sr=sr)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self.counters)
+        counters['tempfile_seconds'] = round(counters['tempfile_seconds'], 3)
+        counters['ffmpeg_available'] = bool(self.ffmpeg_path)
+        return counters
+
+def parse_streamed_wav(wav: bytes):
+    """
+    Return (sample_rate, channels, pcm bytes) from a WAV written to a pipe,
+    whose RIFF/data sizes are placeholders; the data chunk runs to the end.
+    """
+    if len(wav) < 12 or wav[:4] != b'RIFF' or wav[8:12] != b'WAVE':
+        raise ValueError("decoder did not produce WAV output")
+    offset = 12
+    sample_rate = channels = None
+    while offset + 8 <= len(wav):
+        chunk_id, chunk_size = struct.unpack_from('<4sI', wav, offset)
+        offset += 8
+        if chunk_id == b'fmt ':
+            channels, sample_rate = struct.unpack_from('<HI', wav, offset + 2)
+        elif chunk_id == b'data':
+            if sample_rate is None:
                 break
-        
-        if model_path is None:
-            logger.warning("Model not found, creating dummy model for testing")
-            model_data = create_dummy_model()
-        else:
-            logger.info(f"Loading model from: {model_path}")
-            model_data = joblib.load(model_path)
-        
-        feature_extractor = LocalAudioFeatureExtractor()
-        logger.info("✅ Model loaded successfully!")
-        return True
-        
-    except Exception as e:
-        logger.error(f"❌ Failed to load model: {e}")
-        return False
+            return sample_rate, channels, wav[offset:]
+        offset += chunk_size + (chunk_size & 1)
+    raise ValueError("decoder output has no audio data")
 
-def create_dummy_model():
-    from sklearn.ensemble import RandomForestClassifier
-    from sklearn.preprocessing import StandardScaler
-    from sklearn.feature_selection import VarianceThreshold, SelectKBest, f_classif
-    
-    feature_names = [
-        'signal_length_ratio', 'rms_energy_ratio', 'spectral_centroid_mean', 'spectral_centroid_std',
-        'spectral_centroid_skew', 'spectral_rolloff_mean', 'spectral_rolloff_std', 'spectral_bandwidth_mean',
-        'spectral_bandwidth_std', 'zcr_mean', 'zcr_std', 'mfcc_1_mean', 'mfcc_1_std', 'mfcc_2_mean',
-        'mfcc_2_std', 'mfcc_3_mean', 'mfcc_3_std', 'mfcc_4_mean', 'mfcc_4_std', 'mfcc_5_mean', 'mfcc_5_std',
-        'mfcc_6_mean', 'mfcc_6_std', 'mfcc_7_mean', 'mfcc_7_std', 'mfcc_8_mean', 'mfcc_8_std', 'mfcc_9_mean',
-        'mfcc_9_std', 'mfcc_10_mean', 'mfcc_10_std', 'mfcc_11_mean', 'mfcc_11_std', 'mfcc_12_mean', 'mfcc_12_std',
-        'mfcc_13_mean', 'mfcc_13_std', 'chroma_mean', 'chroma_std', 'chroma_bin_0', 'chroma_bin_1', 'chroma_bin_2',
-        'chroma_bin_3', 'chroma_bin_4', 'chroma_bin_5', 'chroma_bin_6', 'chroma_bin_7', 'chroma_bin_8', 'chroma_bin_9',
-        'chroma_bin_10', 'chroma_bin_11', 'tonnetz_mean', 'tonnetz_std', 'tempo', 'beat_strength',
-        'spectral_contrast_mean', 'spectral_contrast_std', 'spectral_flatness_mean', 'spectral_flatness_std',
-        'dynamic_range', 'peak_to_rms_ratio', 'harmonic_ratio', 'percussive_ratio', 'spectral_centroid_normalized',
-        'silence_ratio'
-    ]
-    
-    variance_selector = VarianceThreshold(threshold=0.01)
-    scaler = StandardScaler()
-    feature_selector = SelectKBest(f_classif, k=30)
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
-    
-    X_dummy = np.random.randn(100, len(feature_names))
-    y_dummy = np.random.randint(0, 2, 100)
-    
-    X_var = variance_selector.fit_transform(X_dummy)
-    X_scaled = scaler.fit_transform(X_var)
-    X_selected = feature_selector.fit_transform(X_scaled, y_dummy)
+audio_decoder = AudioDecoder(FFMPEG_PATH, DECODE_TIMEOUT)
+
+# Binary PCM payloads (alternative to JSON audio_data lists)
+#
+# A frame is a 16-byte little-endian header followed by the song id and the samples:
+#   magic 'XPCM' | version u8 (1) | encoding u8 (1 = float32, 2 = int16) |
+#   song_id length u16 | sample_rate u32 | sample count u32
+# The UTF-8 song id is zero-padded to a 4-byte boundary, then the samples
+# follow, zero-padded to a 4-byte boundary. Batch bodies are a sequence of
+# frames, each preceded by its u32 byte length.
+PCM_CONTENT_TYPES = ('application/x-audio-pcm', 'application/octet-stream')
+PCM_MAGIC = b'XPCM'
+PCM_HEADER = struct.Struct('<4sBBHII')
+PCM_LENGTH_PREFIX = struct.Struct('<I')
+PCM_ENCODINGS = {1: np.dtype('<f4'), 2: np.dtype('<i2')}
+
+def is_pcm_request() -> bool:
+    return request.mimetype in PCM_CONTENT_TYPES
+
+def _align4(n: int) -> int:
+    return (n + 3) & ~3
+
+def parse_pcm_frame(frame: memoryview):
+    """
+    Parse one PCM frame into (song_id, sample_rate, float32 samples).
+
+    float32 samples are a zero-copy view of the request body; int16 samples
+    are scaled to [-1, 1). Raises BadRequest on malformed frames.
+    """
+    if len(frame) < PCM_HEADER.size:
+        raise BadRequest("PCM frame is shorter than its header")
     
-    model.fit(X_selected, y_dummy)
+    magic, version, encoding, id_length, sample_rate, n_samples = PCM_HEADER.unpack_from(frame)
+    if magic != PCM_MAGIC or version != 1:
+        raise BadRequest("Not a version 1 XPCM frame")
+    if encoding not in PCM_ENCODINGS:
+        raise BadRequest(f"Unsupported PCM encoding {encoding}")
+    if sample_rate == 0:
+        raise BadRequest("PCM sample rate must be positive")
     
-    selected_indices = feature_selector.get_support(indices=True)
-    selected_feature_names = [feature_names[i] for i in selected_indices]
+    dtype = PCM_ENCODINGS[encoding]
+    samples_offset = PCM_HEADER.size + _align4(id_length)
+    samples_end = samples_offset + n_samples * dtype.itemsize
+    if samples_end > len(frame):
+        raise BadRequest("PCM frame is truncated")
     
-    return {
-        'model': model,
-        'variance_selector': variance_selector,
-        'scaler': scaler,
-        'feature_selector': feature_selector,
-        'model_type': 'random_forest',
-        'feature_names': feature_names,
-        'selected_feature_names': selected_feature_names,
-        'label_map': {0: 'Christian', 1: 'Secular'},
-        'class_weights': {}
-    }
+    try:
+        song_id = bytes(frame[PCM_HEADER.size:PCM_HEADER.size + id_length]).decode('utf-8') or 'unknown'
+    except UnicodeDecodeError:
+        raise BadRequest("PCM song id is not valid UTF-8")
+    with service_metrics.timed('decode'):
+        audio = np.frombuffer(frame, dtype=dtype, count=n_samples, offset=samples_offset)
+        if encoding == 2:
+            audio = audio.astype(np.float32) * np.float32(1 / 32768)
+        elif dtype != np.float32:
+            audio = audio.astype(np.float32)  # big-endian host
+    return song_id, sample_rate, audio
+
+def json_samples(audio_data: list) -> np.ndarray:
+    """float32 samples from a JSON list of numbers."""
+    with service_metrics.timed('decode'):
+        return np.asarray(audio_data, dtype=np.float32)
+
+def parse_sample_rate(value) -> int:
+    """
+    A JSON sample_rate as an int. Raises BadRequest unless it is a whole
+    number of Hz that fits the u32 the cache key (and an XPCM header) holds.
+    """
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if isinstance(value, bool) or not isinstance(value, int) or not 0 < value < 2**32:
+        raise BadRequest("sample_rate must be a positive integer")
+    return value
 
-def classify_features(features: Dict[str, float]) -> Dict[str, Any]:
+def parse_pcm_batch(body: bytes) -> List[tuple]:
+    """Split a batch body into length-prefixed frames and parse each one."""
+    view = memoryview(body)
+    frames = []
+    offset = 0
+    while offset < len(view):
+        if offset + PCM_LENGTH_PREFIX.size > len(view):
+            raise BadRequest("PCM batch ends inside a length prefix")
+        (length,) = PCM_LENGTH_PREFIX.unpack_from(view, offset)
+        offset += PCM_LENGTH_PREFIX.size
+        if offset + length > len(view):
+            raise BadRequest("PCM batch frame is truncated")
+        frames.append(parse_pcm_frame(view[offset:offset + length]))
+        offset += _align4(length)
+    return frames
+
+def classify_job_songs(songs: List[tuple], fit_to_window: bool) -> List[Dict[str, Any]]:
+    """JobRunner's classifier: songs of a round are bulk traffic, so interactive requests keep priority."""
+    with admission.scheduled_as('bulk'):
+        return classify_audio_batch(songs, fit_to_window)
+
+def model_loaded() -> bool:
+    return model_data is not None
+
+job_store = JobStore(JOBS_DIR, JOB_RETENTION_HOURS) if JOBS_DIR else None
+job_runner = (
+    JobRunner(job_store, JOB_BATCH_SONGS, classify_job_songs, failed_song_result, model_loaded)
+    if job_store is not None else None
+)
+job_event_streams = EventStreamLimit(JOB_EVENT_STREAMS)
+
+def run_warm_up():
+    """
+    Warm every extraction worker on WARMUP_SAMPLE_RATES, then audio file
+    decoding and the inference path, and mark the service ready.
+    """
+    started = time.perf_counter()
     try:
-        if model_data is None:
-            raise ValueError("Model not loaded")
-        
-        feature_names = model_data['feature_names']
-        X = np.array([[features.get(name, 0.0) for name in feature_names]])
-        
-        X_variance_filtered = model_data['variance_selector'].transform(X)
-        X_scaled = model_data['scaler'].transform(X_variance_filtered)
-        X_processed = model_data['feature_selector'].transform(X_scaled)
-        
-        pred_numeric = model_data['model'].predict(X_processed)[0]
-        pred_proba = model_data['model'].predict_proba(X_processed)[0]
-        
-        pred_label = model_data['label_map'][pred_numeric]
-        confidence = float(max(pred_proba))
-        
-        christian_prob = float(pred_proba[0])
-        secular_prob = float(pred_proba[1])
-        
-        return {
-            'prediction': pred_label,
-            'confidence': confidence,
-            'probabilities': {
-                'christian': christian_prob,
-                'secular': secular_prob
-            },
-            'success': True
-        }
-        
+        warm_up_state['stage'] = 'extraction'
+        if not extraction_pool.warm_up(TASK_TIMEOUT):
+            logger.warning(f"Extraction workers did not finish warming up within {TASK_TIMEOUT:g}s")
+        
+        # librosa.load is slow on first use too (lazy imports, numba); uploads go through it
+        warm_up_state['stage'] = 'decoding'
+        import soundfile as sf
+        wav = io.BytesIO()
+        sf.write(wav, warm_up_audio(feature_extractor.sample_rate), feature_extractor.sample_rate, format='WAV')
+        audio_decoder.decode(wav.getvalue(), 'warm-up.wav', sr=feature_extractor.sample_rate)
+        
+        warm_up_state['stage'] = 'inference'
+        features = extraction_pool.extract_vector(warm_up_audio(feature_extractor.sample_rate),
+                                                  feature_extractor.sample_rate)
+        if features is not None:
+            predict_matrix(features.reshape(1, -1))
+            predict_matrix(np.repeat(features.reshape(1, -1), 8, axis=0))
     except Exception as e:
-        logger.error(f"Classification error: {e}")
+        logger.warning(f"Warm-up failed, serving cold: {e}")
+    warm_up_state.update({
+        'ready': True,
+        'stage': 'ready',
+        'warmup_seconds': round(time.perf_counter() - started, 3)
+    })
+    logger.info(f"Warm-up finished in {warm_up_state['warmup_seconds']}s, service ready")
+
+class ModelReloader:
+    """
+    Replaces the serving model without a restart.
+
+    reload() reads the model file on the calling thread while the current
+    model keeps serving, checks the new one against the extractor's
+    feature_names contract, warms it on extracted features and only then
+    swaps it in with one assignment. Requests that already picked up the old
+    model finish on it, and every result names the version that produced it,
+    so cached results and stored predictions stay keyed by the right model.
+    When the new model needs other extractor settings (skipped feature
+    groups, cascade first tier), replacement extraction workers warm up
+    before they take over.
+
+    With ``watch_seconds`` > 0 a thread checks the model file that often and
+    reloads once a changed file has stopped changing.
+    """
+
+    def __init__(self, watch_seconds: float):
+        self.watch_seconds = watch_seconds
+        self._lock = threading.Lock()
+        self._watcher = None
+        self._seen = self._pending = None
+        self.reloads = 0
+        self.failures = 0
+        self.last = None
+
+    def reload(self, reason: str) -> Dict[str, Any]:
+        """
+        Swap in the model file on disk if it holds a new version. Returns the
+        outcome; on failure the previous model is still serving.
+        """
+        if not self._lock.acquire(blocking=False):
+            return {'success': False, 'busy': True, 'error': 'A model reload is already running'}
+        try:
+            return self._reload(reason)
+        finally:
+            self._lock.release()
+
+    def _reload(self, reason: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        previous_version = model_version
+        outcome = {'reason': reason, 'previous_version': previous_version}
+        try:
+            model_path = find_model_path()
+            if model_path is None:
+                raise ValueError("No model file found")
+            candidate, source = read_model(model_path)
+            outcome['model_version'] = candidate['version']
+            if candidate['version'] == previous_version:
+                outcome.update({'success': True, 'changed': False})
+            else:
+                self._check(candidate)
+                self._swap(candidate)
+                self.reloads += 1
+                outcome.update({'success': True, 'changed': True, 'source': source})
+                logger.info(f"Model reloaded ({reason}): {previous_version} -> {candidate['version']}")
+        except Exception as e:
+            self.failures += 1
+            outcome.update({'success': False, 'changed': False, 'error': str(e)})
+            logger.error(f"Model reload ({reason}) rejected, still serving {previous_version}: {e}")
+        outcome.update({'seconds': round(time.perf_counter() - started, 3), 'finished_at': time.time()})
+        self.last = outcome
+        return outcome
+
+    def _check(self, candidate: Dict[str, Any]):
+        """Raise ValueError unless ``candidate`` can serve the current extractor; warms its inference path."""
+        if list(candidate['feature_names']) != feature_extractor.feature_names:
+            raise ValueError("Model expects a different feature layout than the extractor produces")
+        if candidate['label_map'] != model_data['label_map']:
+            raise ValueError(f"Model labels {candidate['label_map']} differ from {model_data['label_map']}")
+        
+        features = extraction_pool.extract_vector(warm_up_audio(feature_extractor.sample_rate),
+                                                  feature_extractor.sample_rate)
+        if features is None:
+            raise ValueError("Could not extract probe features")
+        # Skipped groups are NaN here; the probe only has to exercise the pipeline
+        features = np.nan_to_num(features).reshape(1, -1)
+        for rows in (1, 8):
+            predictions, probabilities = predict_matrix(np.repeat(features, rows, axis=0), candidate)
+            if probabilities.shape != (rows, 2) or not np.allclose(probabilities.sum(axis=1), 1.0):
+                raise ValueError(f"Model returned probabilities of shape {probabilities.shape}")
+        build_result(predictions[0], probabilities[0], candidate)
+
+    def _swap(self, candidate: Dict[str, Any]):
+        global model_data, model_version
+        required = None
+        if SKIP_UNUSED_FEATURES and candidate.get('projection') is not None:
+            required = candidate['projection'].feature_names
+        
+        # Until the swap both models must get their features
+        if SKIP_UNUSED_FEATURES:
+            before = self._worker_settings()
+            current = feature_extractor.required_features
+            feature_extractor.set_required_features(
+                None if current is None or required is None else list(dict.fromkeys(current + list(required)))
+            )
+            self._restart_workers_if_changed(before)
+        
+        before = self._worker_settings()
+        model_data = candidate
+        model_version = candidate['version']
+        if SKIP_UNUSED_FEATURES:
+            feature_extractor.set_required_features(required)
+        try:
+            cascade.load(feature_extractor)
+        except Exception as e:
+            logger.warning(f"Cascade first tier could not be loaded, running without it: {e}")
+        self._restart_workers_if_changed(before)
+
+    @staticmethod
+    def _worker_settings() -> tuple:
+        """The extractor settings extraction workers copy when they start."""
+        return feature_extractor._skip, feature_extractor.first_tier
+
+    @staticmethod
+    def _restart_workers_if_changed(before: tuple):
+        skip, first_tier = before
+        if feature_extractor._skip != skip or feature_extractor.first_tier is not first_tier:
+            extraction_pool.restart()
+
+    def start_watching(self, in_thread: bool = True):
+        """
+        Remember the model file's current state and check it every
+        ``watch_seconds`` on a thread, or, without ``in_thread``, whenever
+        the caller runs check_file().
+        """
+        if self.watch_seconds > 0 and self._watcher is None:
+            self._seen, self._pending = self._file_state(), None
+            if in_thread:
+                self._watcher = threading.Thread(target=self._watch, name='model-watcher', daemon=True)
+                self._watcher.start()
+            logger.info(f"Watching the model file for changes every {self.watch_seconds:g}s")
+
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_seconds)
+            self.check_file()
+
+    def check_file(self) -> Optional[Dict[str, Any]]:
+        """Reload if the model file changed and has stopped changing; returns the reload outcome, if any."""
+        state = self._file_state()
+        if state == self._seen:
+            self._pending = None
+        elif state != self._pending:
+            # Still being written (or just replaced); reload once two checks agree
+            self._pending = state
+        else:
+            outcome = self.reload('file change')
+            if not outcome.get('busy'):
+                self._seen, self._pending = state, None
+            return outcome
+        return None
+
+    @staticmethod
+    def _file_state():
+        model_path = find_model_path()
+        try:
+            stat = os.stat(model_path) if model_path is not None else None
+        except OSError:
+            return None
+        return (model_path, stat.st_mtime_ns, stat.st_size) if stat is not None else None
+
+    def stats(self) -> Dict[str, Any]:
         return {
-            'prediction': 'unknown',
-            'confidence': 0.0,
-            'probabilities': {
-                'christian': 0.5,
-                'secular': 0.5
-            },
-            'success': False,
-            'error': str(e)
+            'model_version': model_version,
+            'watch_seconds': self.watch_seconds,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_reload': self.last
         }
 
-# Load model
-if not load_model():
-    logger.error("❌ Failed to load model. Service may not work correctly.")
+model_reloader = ModelReloader(MODEL_WATCH_SECONDS)
+
+def admin_request_allowed() -> bool:
+    """Admin endpoints need X-Admin-Token when CLASSIFIER_ADMIN_TOKEN is set, otherwise a local caller."""
+    if ADMIN_TOKEN:
+        return hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode())
+    return request.remote_addr in ('127.0.0.1', '::1')
+
+# Set by start_service()
+service_started = False
+
+def start_service(prefork: bool = False) -> bool:
+    """
+    Load the model and start what serving needs: the extraction workers,
+    the warm-up and the model file watcher. Importing the module does none
+    of it, so tools, tests and the extraction workers (which re-import it)
+    stay cheap; the server entry points call this. With ``prefork`` nothing
+    is left running on other threads, so the pre-fork server can fork warm
+    workers. Returns whether a model is loaded; later calls only report that.
+    """
+    global service_started
+    if service_started:
+        return model_data is not None
+    service_started = True
+    
+    if not load_model():
+        logger.error("❌ Failed to load model. Service may not work correctly.")
+    startup_info['startup_seconds'] = round(time.perf_counter() - STARTUP_STARTED, 3)
+    logger.info(f"Startup took {startup_info['startup_seconds']}s")
+    if prefork:
+        # Before the warm-up: OpenMP pools started by it would not survive the fork
+        limit_native_threads(NATIVE_THREADS, include_numba=False)
+    if model_data is None:
+        warm_up_state['stage'] = 'model not loaded'
+    elif WARMUP and prefork:
+        # On this thread, before the server workers are forked, so every one of them starts warm
+        run_warm_up()
+    elif WARMUP:
+        threading.Thread(target=run_warm_up, name='warm-up', daemon=True).start()
+    else:
+        warm_up_state.update({'ready': True, 'stage': 'ready'})
+    if model_data is not None:
+        # The pre-fork server checks the model file from its own loop
+        model_reloader.start_watching(in_thread=not prefork)
+    return model_data is not None
+
+@atexit.register
+def shutdown_extraction_pool():
+    if extraction_pool is not None:
+        extraction_pool.shutdown()
+
+@app.after_request
+def read_streamed_upload_after_response(response):
+    """
+    Send the response before reading the rest of a streamed upload, so the
+    answer does not wait for bytes the decoder never needed. The upload is
+    then read to its end, and a result computed for it is also cached under
+    the file's own key, which buffered uploads of the same file look up.
+    Registered first, so it runs after the other after_request hooks.
+    """
+    upload = g.pop('streamed_upload', None)
+    if upload is None:
+        return response
+    computed = g.pop('streamed_upload_result', None)
+    body = response.get_data()
+    
+    def send_then_read_upload():
+        yield body
+        file_key = audio_decoder.finish_stream(upload)
+        if computed is not None and file_key is not None:
+            result_cache.put(file_key, *computed)
+    
+    response.response = send_then_read_upload()
+    return response
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.metrics_started = time.perf_counter()
+    service_metrics.request_started(g.metrics_endpoint, request.content_length or 0)
+
+@app.after_request
+def record_response_metrics(response):
+    if response.is_streamed and 'metrics_started' in g:
+        # Finished when the stream is closed, with the bytes counted as the chunks go out
+        endpoint, started, status = g.metrics_endpoint, g.pop('metrics_started'), response.status_code
+        chunks = response.response
+        sent = [0]
+        
+        def counted():
+            for chunk in chunks:
+                sent[0] += len(chunk)
+                yield chunk
+        
+        def finished():
+            service_metrics.request_finished(endpoint, status, time.perf_counter() - started, sent[0])
+        
+        callbacks = [chunks.close] if hasattr(chunks, 'close') else []
+        response.response = ClosingIterator(counted(), callbacks + [finished])
+    else:
+        g.response_status = response.status_code
+        g.response_bytes = response.calculate_content_length() or 0
+    return response
+
+@app.teardown_request
+def finish_request_metrics(error):
+    started = g.pop('metrics_started', None)
+    if started is None:
+        return
+    service_metrics.request_finished(
+        g.metrics_endpoint, g.get('response_status', 500), time.perf_counter() - started, g.get('response_bytes', 0)
+    )
+
+@app.before_request
+def admit_request():
+    traffic_class = ENDPOINT_TRAFFIC_CLASSES.get(g.metrics_endpoint)
+    if traffic_class is None or request.method not in ('POST', 'PUT') or admission.admit(traffic_class):
+        return None
+    retry_after = admission.retry_after(traffic_class)
+    response = jsonify({
+        'success': False,
+        'error': f'Too many {traffic_class} requests in progress, retry later',
+        'retry_after': retry_after
+    })
+    response.headers['Retry-After'] = str(retry_after)
+    return response, 429
+
+@app.teardown_request
+def finish_admitted_request(error):
+    admission.finish()
+
+def debug_timing_requested() -> bool:
+    """True when the caller sent X-Debug-Timing to get a stage breakdown."""
+    return request.headers.get('X-Debug-Timing', '').lower() not in ('', '0', 'false', 'no')
+
+@app.before_request
+def start_request_diagnostics():
+    if debug_timing_requested():
+        request_timings.start()
+        g.timing_started = time.perf_counter()
+        if not (STREAM_UPLOADS and request.endpoint == 'classify_audio_file'):
+            # Receive the body up front so its transfer time is reported on its own
+            with request_timings.stage('upload'):
+                request.get_data()
+    if request.method == 'POST' and not request.path.startswith('/admin/'):
+        profile_sampler.begin()
+
+@app.after_request
+def attach_request_timings(response):
+    if request_timings.active and not response.is_streamed:
+        timings = RequestTimings.report(request_timings.stop(), time.perf_counter() - g.timing_started)
+        body = response.get_json(silent=True)
+        if isinstance(body, dict):
+            body['timings'] = timings
+            response.set_data(app.json.dumps(body))
+        response.headers['Server-Timing'] = ', '.join(
+            f'{name[:-3]};dur={value}' for name, value in timings.items() if name.endswith('_ms')
+        )
+    return response
+
+@app.teardown_request
+def finish_request_diagnostics(error):
+    request_timings.stop()
+    if profile_sampler.active:
+        profile_sampler.end(request.url_rule.rule if request.url_rule is not None else 'unmatched')
 
 @app.route('/', methods=['GET'])
 def root():
@@ -410,10 +2889,16 @@ def root():
         'platform': 'Local PC',
         'endpoints': {
             'health': '/health',
+            'ready': '/ready',
             'classify': '/classify',
             'batch_classify': '/batch_classify',
+            'rescore': '/rescore',
+            'cascade_train': '/cascade/train',
+            'jobs': '/jobs',
+            'reload_model': '/admin/reload_model',
             'model_info': '/model_info',
-            'performance': '/performance'
+            'performance': '/performance',
+            'metrics': '/metrics'
         },
         'status': 'running'
     })
@@ -425,44 +2910,67 @@ def health_check():
         'service': 'music-classification-service',
         'version': '1.0.0',
         'model_loaded': model_data is not None,
+        'model_version': model_version,
+        'ready': warm_up_state['ready'],
+        'startup': startup_info,
+        'admission': admission.stats(),
         'platform': 'Local PC'
     })
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """200 once the model is loaded and warmed up, 503 until then."""
+    ready = model_data is not None and warm_up_state['ready']
+    return jsonify({
+        'ready': ready,
+        'stage': warm_up_state['stage'],
+        'warmup_seconds': warm_up_state.get('warmup_seconds')
+    }), 200 if ready else 503
+
 @app.route('/classify', methods=['POST'])
 def classify_single():
-    global request_count
-    request_count += 1
-    
     try:
-        data = request.get_json()
-        
-        if not data:
-            raise BadRequest("No JSON data provided")
-        
-        audio_data = data.get('audio_data')
-        sample_rate = data.get('sample_rate', 22050)
-        song_id = data.get('song_id', 'unknown')
-        
-        if audio_data is None:
-            raise BadRequest("audio_data field is required")
-        
-        if not isinstance(audio_data, list):
-            raise BadRequest("audio_data must be a list of numbers")
-        
-        audio_array = np.array(audio_data, dtype=np.float32)
+        if is_pcm_request():
+            song_id, sample_rate, audio_array = parse_pcm_frame(memoryview(request.get_data()))
+        else:
+            data = request.get_json()
+            
+            if not data:
+                raise BadRequest("No JSON data provided")
+            
+            audio_data = data.get('audio_data')
+            sample_rate = parse_sample_rate(data.get('sample_rate', 22050))
+            song_id = data.get('song_id', 'unknown')
+            
+            if audio_data is None:
+                raise BadRequest("audio_data field is required")
+            
+            if not isinstance(audio_data, list):
+                raise BadRequest("audio_data must be a list of numbers")
+            
+            audio_array = json_samples(audio_data)
         
         if len(audio_array) == 0:
             raise BadRequest("audio_data cannot be empty")
         
         logger.info(f"Classifying song {song_id} with {len(audio_array)} samples")
         
-        features = feature_extractor.extract_features_from_array(audio_array, sample_rate)
-        
-        if features is None:
-            raise BadRequest("Failed to extract features from audio data")
-        
-        result = classify_features(features)
+        content_key = audio_content_key('window', audio_array, sample_rate)
+        cached = result_cache.get(content_key)
+        if cached is not None:
+            features, result = cached
+        else:
+            features, outcome = extract_for_classification(audio_array, sample_rate)
+            
+            if features is None:
+                raise BadRequest("Failed to extract features from audio data")
+            
+            result = classify_features(features, outcome)
+            record_classification(content_key, song_id, features, result)
         result['song_id'] = song_id
+        result['cached'] = cached is not None
+        if wants_named_features():
+            result['features'] = features_to_dict(features, feature_extractor.feature_names)
         
         logger.info(f"Classification result for {song_id}: {result['prediction']} (confidence: {result['confidence']:.3f})")
         
@@ -504,7 +3012,7 @@ def classify_song_with_features():
             }), 400
         
         # Ensure we have the right number of features
-        expected_features = 65  # Based on the trained model (65 features, 30 selected)
+        expected_features = len(model_data['feature_names'])  # 65 features, 30 selected
         if len(features_array) != expected_features:
             logger.warning(f"Expected {expected_features} features, got {len(features_array)}")
             # Pad or truncate to match expected size
@@ -515,33 +3023,9 @@ def classify_song_with_features():
                 # Truncate
                 features_array = features_array[:expected_features]
         
-        # Use the same feature processing pipeline as classify_features function
-        feature_names = model_data['feature_names']
-        features_dict = {name: features_array[i] if i < len(features_array) else 0.0 for i, name in enumerate(feature_names)}
-        X = np.array([[features_dict.get(name, 0.0) for name in feature_names]])
-        
-        X_variance_filtered = model_data['variance_selector'].transform(X)
-        X_scaled = model_data['scaler'].transform(X_variance_filtered)
-        X_processed = model_data['feature_selector'].transform(X_scaled)
-        
-        prediction = model_data['model'].predict(X_processed)[0]
-        probabilities = model_data['model'].predict_proba(X_processed)[0]
-        
-        # Convert prediction to string and ensure all values are JSON serializable
-        prediction_str = str(prediction)
-        if hasattr(model_data, 'get') and 'label_map' in model_data:
-            prediction_str = model_data['label_map'].get(prediction, str(prediction))
-        
-        result = {
-            'success': True,
-            'prediction': prediction_str,
-            'confidence': float(max(probabilities)),
-            'probabilities': {
-                'christian': float(probabilities[0]),
-                'secular': float(probabilities[1])
-            },
-            'song_id': song_id
-        }
+        # Features arrive in model column order, so the vector goes straight to the model
+        result = classify_vector(features_array)
+        result['song_id'] = song_id
         
         return jsonify(result)
         
@@ -556,62 +3040,68 @@ def classify_song_with_features():
 def classify_song_with_audio_data():
     """Classify a song using raw audio data (server-side feature extraction)"""
     try:
-        data = request.get_json()
-        
-        if not data or 'audio_data' not in data:
-            return jsonify({
-                'success': False,
-                'error': 'audio_data field is required'
-            }), 400
-        
-        song_id = data.get('song_id', 'unknown')
-        audio_data = data.get('audio_data', [])
-        sample_rate = data.get('sample_rate', 22050)
+        if is_pcm_request():
+            try:
+                song_id, sample_rate, audio_array = parse_pcm_frame(memoryview(request.get_data()))
+            except BadRequest as e:
+                return jsonify({
+                    'success': False,
+                    'error': e.description
+                }), 400
+        else:
+            data = request.get_json()
+            
+            if not data or 'audio_data' not in data:
+                return jsonify({
+                    'success': False,
+                    'error': 'audio_data field is required'
+                }), 400
+            
+            song_id = data.get('song_id', 'unknown')
+            audio_data = data.get('audio_data', [])
+            try:
+                sample_rate = parse_sample_rate(data.get('sample_rate', 22050))
+            except BadRequest as e:
+                return jsonify({
+                    'success': False,
+                    'error': e.description
+                }), 400
+            
+            if not audio_data:
+                return jsonify({
+                    'success': False,
+                    'error': 'audio_data cannot be empty'
+                }), 400
+            
+            # Convert audio data to numpy array
+            audio_array = json_samples(audio_data)
         
-        if not audio_data:
+        if len(audio_array) == 0:
             return jsonify({
                 'success': False,
                 'error': 'audio_data cannot be empty'
             }), 400
         
-        # Convert audio data to numpy array
-        audio_array = np.array(audio_data, dtype=np.float32)
-        
-        # Extract features using the same method as the original training
-        features = extract_features_from_audio_data(audio_array, sample_rate)
-        
-        if features is None:
-            return jsonify({
-                'success': False,
-                'error': 'Failed to extract features from audio data'
-            }), 400
-        
-        # Convert features to the format expected by the model
-        feature_names = model_data['feature_names']
-        features_dict = {name: features.get(name, 0.0) for name in feature_names}
-        X = np.array([[features_dict.get(name, 0.0) for name in feature_names]])
-        
-        # Apply the same preprocessing pipeline
-        X_variance_filtered = model_data['variance_selector'].transform(X)
-        X_scaled = model_data['scaler'].transform(X_variance_filtered)
-        X_processed = model_data['feature_selector'].transform(X_scaled)
-        
-        prediction = model_data['model'].predict(X_processed)[0]
-        probabilities = model_data['model'].predict_proba(X_processed)[0]
-        
-        # Convert prediction to string
-        prediction_str = model_data['label_map'].get(prediction, str(prediction))
-        
-        result = {
-            'success': True,
-            'prediction': prediction_str,
-            'confidence': float(max(probabilities)),
-            'probabilities': {
-                'christian': float(probabilities[0]),
-                'secular': float(probabilities[1])
-            },
-            'song_id': song_id
-        }
+        content_key = audio_content_key('raw', audio_array, sample_rate)
+        cached = result_cache.get(content_key)
+        if cached is not None:
+            features, result = cached
+        else:
+            # Extract features using the same method as the original training
+            features, outcome = extract_for_classification(audio_array, sample_rate, fit_to_window=False)
+            
+            if features is None:
+                return jsonify({
+                    'success': False,
+                    'error': 'Failed to extract features from audio data'
+                }), 400
+            
+            result = classify_vector(features, outcome)
+            record_classification(content_key, song_id, features, result)
+        result['song_id'] = song_id
+        result['cached'] = cached is not None
+        if wants_named_features():
+            result['features'] = features_to_dict(features, feature_extractor.feature_names)
         
         return jsonify(result)
         
@@ -625,89 +3115,81 @@ def classify_song_with_audio_data():
 @app.route('/classify_audio_file', methods=['POST'])
 def classify_audio_file():
     """Classify a song using raw audio file data"""
-    global request_count
-    request_count += 1
-    
     try:
         # Get metadata from headers
         song_id = request.headers.get('X-Song-ID', 'unknown')
         file_name = request.headers.get('X-File-Name', 'unknown.opus')
         
-        # Get raw audio data
-        audio_data = request.get_data()
+        if STREAM_UPLOADS and request.content_length and audio_decoder.can_stop_early(file_name):
+            # Decode while the body arrives and stop reading at the analysis window
+            logger.info(f"Streaming audio data: {request.content_length} bytes for song: {song_id}")
+            g.streamed_upload = UploadStream(request.stream, request.content_length, STREAM_HEAD_BYTES)
+            y, sr = audio_decoder.decode_stream(g.streamed_upload, file_name, sr=22050, duration=10)
+            # The file's own key needs the bytes after the window, which are only read after the
+            # response has been sent; the decoded window identifies the upload instead
+            content_key = audio_content_key('raw', y, sr)
+        else:
+            # Get raw audio data
+            audio_data = request.get_data()
+            
+            if not audio_data:
+                return jsonify({
+                    'success': False,
+                    'error': 'No audio data provided'
+                }), 400
+            
+            logger.info(f"Received audio data: {len(audio_data)} bytes for song: {song_id}")
+            content_key = file_content_key(audio_data)
+            y = None
+        
+        cached = result_cache.get(content_key)
+        if cached is not None:
+            features, result = cached
+            result['song_id'] = song_id
+            result['file_name'] = file_name
+            result['cached'] = True
+            if wants_named_features():
+                result['features'] = features_to_dict(features, feature_extractor.feature_names)
+            logger.info(f"Cached classification result: {result['prediction']} (confidence: {result['confidence']:.3f})")
+            return jsonify(result)
+        
+        if y is None:
+            # Decode the upload in memory
+            y, sr = audio_decoder.decode(audio_data, file_name, sr=22050, duration=10)
         
-        if not audio_data:
+        if len(y) == 0:
             return jsonify({
                 'success': False,
-                'error': 'No audio data provided'
+                'error': 'Could not load audio from data'
             }), 400
         
-        logger.info(f"Received audio data: {len(audio_data)} bytes for song: {song_id}")
+        logger.info(f"Loaded audio: {len(y)} samples at {sr}Hz")
         
-        # Save audio data temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.opus') as temp_file:
-            temp_file.write(audio_data)
-            temp_file_path = temp_file.name
+        # Extract features using the same method as the original training
+        features, outcome = extract_for_classification(y, sr, fit_to_window=False)
+        
+        if features is None:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to extract features from audio data'
+            }), 400
+        
+        result = classify_vector(features, outcome)
+        record_classification(content_key, song_id, features, result)
+        if 'streamed_upload' in g:
+            g.streamed_upload_result = (features, result)
+        else:
+            # Streamed uploads of the same file look it up by its decoded window
+            result_cache.put(audio_content_key('raw', y, sr), features, result)
+        result['song_id'] = song_id
+        result['file_name'] = file_name
+        result['cached'] = False
+        if wants_named_features():
+            result['features'] = features_to_dict(features, feature_extractor.feature_names)
+        
+        logger.info(f"Classification result: {result['prediction']} (confidence: {result['confidence']:.3f})")
+        return jsonify(result)
         
-        try:
-            # Load audio file using librosa
-            y, sr = librosa.load(temp_file_path, sr=22050, duration=10)
-            
-            if len(y) == 0:
-                return jsonify({
-                    'success': False,
-                    'error': 'Could not load audio from data'
-                }), 400
-            
-            logger.info(f"Loaded audio: {len(y)} samples at {sr}Hz")
-            
-            # Extract features using the same method as the original training
-            features = extract_features_from_audio_data(y, sr)
-            
-            if features is None:
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to extract features from audio data'
-                }), 400
-            
-            # Convert features to the format expected by the model
-            feature_names = model_data['feature_names']
-            features_dict = {name: features.get(name, 0.0) for name in feature_names}
-            X = np.array([[features_dict.get(name, 0.0) for name in feature_names]])
-            
-            # Apply the same preprocessing pipeline
-            X_variance_filtered = model_data['variance_selector'].transform(X)
-            X_scaled = model_data['scaler'].transform(X_variance_filtered)
-            X_processed = model_data['feature_selector'].transform(X_scaled)
-            
-            prediction = model_data['model'].predict(X_processed)[0]
-            probabilities = model_data['model'].predict_proba(X_processed)[0]
-            
-            # Convert prediction to string
-            prediction_str = model_data['label_map'].get(prediction, str(prediction))
-            
-            result = {
-                'success': True,
-                'prediction': prediction_str,
-                'confidence': float(max(probabilities)),
-                'probabilities': {
-                    'christian': float(probabilities[0]),
-                    'secular': float(probabilities[1])
-                },
-                'song_id': song_id,
-                'file_name': file_name
-            }
-            
-            logger.info(f"Classification result: {prediction_str} (confidence: {max(probabilities):.3f})")
-            return jsonify(result)
-            
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
-                
     except Exception as e:
         logger.error(f"Error in audio file classification: {e}")
         return jsonify({
@@ -718,9 +3200,6 @@ def classify_audio_file():
 @app.route('/classify_file', methods=['POST'])
 def classify_file():
     """Classify a song using uploaded audio file (multipart form)"""
-    global request_count
-    request_count += 1
-    
     try:
         # Debug: Log what Flask is receiving
         logger.info(f"Request files: {list(request.files.keys())}")
@@ -744,67 +3223,48 @@ def classify_file():
                 'error': 'No file selected'
             }), 400
         
-        # Save uploaded file temporarily
-        with tempfile.NamedTemporaryFile(delete=False, suffix='.tmp') as temp_file:
-            file.save(temp_file.name)
-            temp_file_path = temp_file.name
-        
-        try:
-            # Load audio file using librosa (same as Python demo)
-            y, sr = librosa.load(temp_file_path, sr=22050, duration=10)
-            
-            if len(y) == 0:
-                return jsonify({
-                    'success': False,
-                    'error': 'Could not load audio from file'
-                }), 400
-            
-            # Extract features using the same method as the original training
-            features = extract_features_from_audio_data(y, sr)
-            
-            if features is None:
-                return jsonify({
-                    'success': False,
-                    'error': 'Failed to extract features from audio file'
-                }), 400
-            
-            # Convert features to the format expected by the model
-            feature_names = model_data['feature_names']
-            features_dict = {name: features.get(name, 0.0) for name in feature_names}
-            X = np.array([[features_dict.get(name, 0.0) for name in feature_names]])
-            
-            # Apply the same preprocessing pipeline
-            X_variance_filtered = model_data['variance_selector'].transform(X)
-            X_scaled = model_data['scaler'].transform(X_variance_filtered)
-            X_processed = model_data['feature_selector'].transform(X_scaled)
-            
-            prediction = model_data['model'].predict(X_processed)[0]
-            probabilities = model_data['model'].predict_proba(X_processed)[0]
-            
-            # Convert prediction to string
-            prediction_str = model_data['label_map'].get(prediction, str(prediction))
-            
-            result = {
-                'success': True,
-                'prediction': prediction_str,
-                'confidence': float(max(probabilities)),
-                'probabilities': {
-                    'christian': float(probabilities[0]),
-                    'secular': float(probabilities[1])
-                },
-                'song_id': song_id,
-                'file_name': file.filename
-            }
-            
+        file_data = file.read()
+        content_key = file_content_key(file_data)
+        cached = result_cache.get(content_key)
+        if cached is not None:
+            features, result = cached
+            result['song_id'] = song_id
+            result['file_name'] = file.filename
+            result['cached'] = True
+            if wants_named_features():
+                result['features'] = features_to_dict(features, feature_extractor.feature_names)
             return jsonify(result)
-            
-        finally:
-            # Clean up temporary file
-            try:
-                os.unlink(temp_file_path)
-            except:
-                pass
-                
+        
+        # Decode the upload in memory (same as librosa.load in the Python demo)
+        y, sr = audio_decoder.decode(file_data, file.filename, sr=22050, duration=10)
+        
+        if len(y) == 0:
+            return jsonify({
+                'success': False,
+                'error': 'Could not load audio from file'
+            }), 400
+        
+        # Extract features using the same method as the original training
+        features, outcome = extract_for_classification(y, sr, fit_to_window=False)
+        
+        if features is None:
+            return jsonify({
+                'success': False,
+                'error': 'Failed to extract features from audio file'
+            }), 400
+        
+        result = classify_vector(features, outcome)
+        record_classification(content_key, song_id, features, result)
+        # Streamed uploads of the same file look it up by its decoded window
+        result_cache.put(audio_content_key('raw', y, sr), features, result)
+        result['song_id'] = song_id
+        result['file_name'] = file.filename
+        result['cached'] = False
+        if wants_named_features():
+            result['features'] = features_to_dict(features, feature_extractor.feature_names)
+        
+        return jsonify(result)
+        
     except Exception as e:
         logger.error(f"Error in file classification: {e}")
         return jsonify({
@@ -814,16 +3274,19 @@ def classify_file():
 
 @app.route('/batch_classify', methods=['POST'])
 def batch_classify():
-    global request_count
-    request_count += 1
-    
     try:
-        data = request.get_json()
-        
-        if not data:
-            raise BadRequest("No JSON data provided")
-        
-        songs = data.get('songs', [])
+        if is_pcm_request():
+            songs = [
+                {'song_id': song_id, 'audio_data': audio, 'sample_rate': sample_rate}
+                for song_id, sample_rate, audio in parse_pcm_batch(request.get_data())
+            ]
+        else:
+            data = request.get_json()
+            
+            if not data:
+                raise BadRequest("No JSON data provided")
+            
+            songs = data.get('songs', [])
         
         if not isinstance(songs, list):
             raise BadRequest("songs must be a list")
@@ -836,71 +3299,61 @@ def batch_classify():
         
         logger.info(f"Processing batch of {len(songs)} songs")
         
-        results = []
+        results = [None] * len(songs)
         failed_count = 0
+        include_features = wants_named_features()
         
+        # 1. Validate songs and decode their audio; failures are recorded in place
+        pending = []
         for i, song_data in enumerate(songs):
             try:
                 song_id = song_data.get('song_id', f'song_{i}')
                 audio_data = song_data.get('audio_data')
-                sample_rate = song_data.get('sample_rate', 22050)
                 
                 if audio_data is None:
-                    results.append({
-                        'song_id': song_id,
-                        'prediction': 'unknown',
-                        'confidence': 0.0,
-                        'probabilities': {'christian': 0.5, 'secular': 0.5},
-                        'success': False,
-                        'error': 'audio_data field is required'
-                    })
+                    results[i] = failed_song_result(song_id, 'audio_data field is required')
                     failed_count += 1
                     continue
                 
-                audio_array = np.array(audio_data, dtype=np.float32)
-                
-                if len(audio_array) == 0:
-                    results.append({
-                        'song_id': song_id,
-                        'prediction': 'unknown',
-                        'confidence': 0.0,
-                        'probabilities': {'christian': 0.5, 'secular': 0.5},
-                        'success': False,
-                        'error': 'audio_data cannot be empty'
-                    })
+                try:
+                    sample_rate = parse_sample_rate(song_data.get('sample_rate', 22050))
+                except BadRequest as e:
+                    results[i] = failed_song_result(song_id, e.description)
                     failed_count += 1
                     continue
                 
-                features = feature_extractor.extract_features_from_array(audio_array, sample_rate)
+                audio_array = json_samples(audio_data)
                 
-                if features is None:
-                    results.append({
-                        'song_id': song_id,
-                        'prediction': 'unknown',
-                        'confidence': 0.0,
-                        'probabilities': {'christian': 0.5, 'secular': 0.5},
-                        'success': False,
-                        'error': 'Failed to extract features'
-                    })
+                if len(audio_array) == 0:
+                    results[i] = failed_song_result(song_id, 'audio_data cannot be empty')
                     failed_count += 1
                     continue
                 
-                result = classify_features(features)
-                result['song_id'] = song_id
-                results.append(result)
+                content_key = audio_content_key('window', audio_array, sample_rate)
+                cached = result_cache.get(content_key)
+                if cached is not None:
+                    features, result = cached
+                    result['song_id'] = song_id
+                    result['cached'] = True
+                    if include_features:
+                        result['features'] = features_to_dict(features, feature_extractor.feature_names)
+                    results[i] = result
+                    continue
+                
+                pending.append((i, song_id, content_key, audio_array, sample_rate))
                 
             except Exception as e:
                 logger.error(f"Error processing song {i}: {e}")
-                results.append({
-                    'song_id': song_data.get('song_id', f'song_{i}'),
-                    'prediction': 'unknown',
-                    'confidence': 0.0,
-                    'probabilities': {'christian': 0.5, 'secular': 0.5},
-                    'success': False,
-                    'error': str(e)
-                })
+                results[i] = failed_song_result(song_data.get('song_id', f'song_{i}'), str(e))
                 failed_count += 1
         
+        # 2. Extract and classify the rest together
+        batch_results = classify_audio_batch([song[1:] for song in pending], include_features=include_features)
+        for (i, *_), result in zip(pending, batch_results):
+            if not result['success']:
+                failed_count += 1
+            results[i] = result
+        
         successful = sum(1 for r in results if r['success'])
         logger.info(f"Batch classification complete: {successful}/{len(results)} successful")
         
@@ -920,6 +3373,358 @@ def batch_classify():
         logger.error(f"Error in batch_classify: {e}")
         return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/rescore', methods=['POST'])
+def rescore():
+    """Re-run the current model over every stored feature vector"""
+    if feature_store is None:
+        return jsonify({'success': False, 'error': 'Feature store is disabled'}), 503
+    if model_data is None:
+        return jsonify({'success': False, 'error': 'Model not loaded'}), 503
+    
+    options = request.get_json(silent=True) or {}
+    chunk_size = max(int(options.get('chunk_size', 8192)), 1)
+    include_unchanged = bool(options.get('include_unchanged', False))
+    stream = bool(options.get('stream', False))
+    
+    def rescored_rows():
+        """Yield one result per changed row (or every row), then a summary."""
+        started = time.perf_counter()
+        # One model for the whole pass, even if a reload swaps it meanwhile
+        model = model_data
+        X_all = feature_store.matrix()
+        changed = 0
+        for start in range(0, len(X_all), chunk_size):
+            stop = min(start + chunk_size, len(X_all))
+            with admission.slot():
+                predictions, probabilities = predict_matrix(X_all[start:stop], model)
+            updates = []
+            for (row, song_id, content_key, previous), prediction, row_probabilities in zip(
+                    feature_store.index(start, stop), predictions, probabilities):
+                result = build_result(prediction, row_probabilities, model)
+                updates.append((result['prediction'], result['confidence'], row))
+                if result['prediction'] != previous:
+                    changed += 1
+                elif not include_unchanged:
+                    continue
+                result['song_id'] = song_id
+                result['content_key'] = content_key
+                result['previous_prediction'] = previous
+                yield result
+            feature_store.update_predictions(updates, model['version'])
+        yield {
+            'summary': {
+                'model_version': model['version'],
+                'total': len(X_all),
+                'changed': changed,
+                'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)
+            }
+        }
+    
+    try:
+        if stream:
+            return Response(
+                stream_with_context(json.dumps(item) + '\n' for item in rescored_rows()),
+                mimetype='application/x-ndjson'
+            )
+        
+        *results, summary = rescored_rows()
+        return jsonify({'success': True, 'results': results, **summary})
+        
+    except Exception as e:
+        logger.error(f"Error in rescore: {e}")
+        return jsonify({'success': False, 'error': f'Rescoring failed: {str(e)}'}), 500
+
+@app.route('/cascade/train', methods=['POST'])
+def train_cascade():
+    """Train the cascade's first tier on the stored feature vectors"""
+    if feature_store is None:
+        return jsonify({'success': False, 'error': 'Feature store is disabled'}), 503
+    if model_data is None:
+        return jsonify({'success': False, 'error': 'Model not loaded'}), 503
+    
+    options = request.get_json(silent=True) or {}
+    min_rows = int(options.get('min_rows', 200))
+    max_rows = int(options.get('max_rows', 200000))
+    
+    try:
+        X = feature_store.matrix()
+        if len(X) < min_rows:
+            return jsonify({
+                'success': False,
+                'error': f'Feature store has {len(X)} rows, at least {min_rows} are needed'
+            }), 400
+        if len(X) > max_rows:
+            X = X[np.sort(np.random.default_rng(42).choice(len(X), max_rows, replace=False))]
+        
+        started = time.perf_counter()
+        report = cascade.train(
+            feature_extractor, np.asarray(X),
+            holdout=float(options.get('holdout', 0.2)),
+            n_estimators=int(options.get('n_estimators', 100)),
+            max_depth=int(options.get('max_depth', 12))
+        )
+        extraction_pool.restart()
+        
+        return jsonify({
+            'success': True,
+            'cascade': cascade.stats(),
+            'holdout': report,
+            'training_time_ms': round((time.perf_counter() - started) * 1000, 1)
+        })
+        
+    except Exception as e:
+        logger.error(f"Error in cascade training: {e}")
+        return jsonify({'success': False, 'error': f'Cascade training failed: {str(e)}'}), 500
+
+def job_not_found():
+    return jsonify({'success': False, 'error': 'Job not found'}), 404
+
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    """Start an asynchronous classification job from a manifest of songs"""
+    if job_store is None:
+        return jsonify({'success': False, 'error': 'Jobs are disabled'}), 503
+    try:
+        data = request.get_json(silent=True)
+        if not data:
+            raise BadRequest("No JSON data provided")
+        
+        songs = data.get('songs', [])
+        if not isinstance(songs, list):
+            raise BadRequest("songs must be a list")
+        if len(songs) == 0:
+            raise BadRequest("songs list cannot be empty")
+        if len(songs) > JOB_MAX_SONGS:
+            raise BadRequest(f"Maximum {JOB_MAX_SONGS} songs per job")
+        
+        song_ids = [
+            str(song.get('song_id', f'song_{i}')) if isinstance(song, dict) else str(song)
+            for i, song in enumerate(songs)
+        ]
+        job_id = job_store.create(song_ids)
+        logger.info(f"Created job {job_id} for {len(song_ids)} songs")
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'total': len(song_ids),
+            'state': 'awaiting_uploads',
+            'upload_url': f'/jobs/{job_id}/items/{{index}}',
+            'status_url': f'/jobs/{job_id}',
+            'results_url': f'/jobs/{job_id}/results',
+            'events_url': f'/jobs/{job_id}/events'
+        }), 201
+        
+    except BadRequest as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error creating job: {e}")
+        return jsonify({'success': False, 'error': f'Job creation failed: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>/items/<int:index>', methods=['PUT', 'POST'])
+def upload_job_song(job_id, index):
+    """Upload one song of a job: an audio file body, or a single XPCM frame"""
+    if job_store is None:
+        return jsonify({'success': False, 'error': 'Jobs are disabled'}), 503
+    item = job_store.item(job_id, index)
+    if item is None:
+        return jsonify({'success': False, 'error': 'Job song not found'}), 404
+    song_id, state = item
+    if state not in ('awaiting_upload', 'failed'):
+        # Uploaded before, e.g. a retry after the connection dropped
+        return jsonify({'success': True, 'job_id': job_id, 'index': index, 'song_id': song_id, 'state': state})
+    
+    try:
+        if is_pcm_request():
+            _, sample_rate, audio = parse_pcm_frame(memoryview(request.get_data()))
+            mode = 'window'
+        else:
+            file_name = request.headers.get('X-File-Name', 'unknown.opus')
+            if STREAM_UPLOADS and request.content_length and audio_decoder.can_stop_early(file_name):
+                g.streamed_upload = UploadStream(request.stream, request.content_length, STREAM_HEAD_BYTES)
+                audio, sample_rate = audio_decoder.decode_stream(g.streamed_upload, file_name, sr=22050, duration=10)
+            else:
+                audio_data = request.get_data()
+                if not audio_data:
+                    raise BadRequest("No audio data provided")
+                audio, sample_rate = audio_decoder.decode(audio_data, file_name, sr=22050, duration=10)
+            mode = 'raw'
+        if len(audio) == 0:
+            raise BadRequest("Could not load audio from data")
+    except BadRequest as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error decoding job {job_id} song {index}: {e}")
+        job_store.finish([(job_id, index, failed_song_result(song_id, f'Could not decode audio: {str(e)}'))])
+        return jsonify({'success': False, 'error': f'Could not decode audio: {str(e)}'}), 400
+    
+    try:
+        content_key = audio_content_key(mode, audio, sample_rate)
+        cached = result_cache.get(content_key)
+        if cached is not None:
+            _, result = cached
+            result['song_id'] = song_id
+            result['cached'] = True
+            job_store.finish([(job_id, index, result)])
+            state = 'done'
+        else:
+            job_store.queue(job_id, index, audio, sample_rate, mode, content_key)
+            job_runner.wake()
+            state = 'queued'
+        return jsonify({
+            'success': True, 'job_id': job_id, 'index': index, 'song_id': song_id,
+            'state': state, 'cached': cached is not None
+        })
+        
+    except Exception as e:
+        logger.error(f"Error queueing job {job_id} song {index}: {e}")
+        return jsonify({'success': False, 'error': f'Upload failed: {str(e)}'}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Progress of a job; ?missing=1 lists the songs still to upload"""
+    if job_store is None:
+        return jsonify({'success': False, 'error': 'Jobs are disabled'}), 503
+    status = job_store.status(job_id)
+    if status is None:
+        return job_not_found()
+    if request.args.get('missing', '').lower() in ('1', 'true', 'yes'):
+        status['awaiting_upload'] = job_store.awaiting_upload(job_id)
+    return jsonify({'success': True, **status})
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """Results finished after the ?after= cursor, in the order they finished"""
+    if job_store is None:
+        return jsonify({'success': False, 'error': 'Jobs are disabled'}), 503
+    try:
+        after = max(int(request.args.get('after', 0)), 0)
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'after and limit must be integers'}), 400
+    status = job_store.status(job_id)
+    if status is None:
+        return job_not_found()
+    
+    page = job_store.results(job_id, after, limit)
+    cursor = page[-1][0] if page else after
+    return jsonify({
+        'success': True,
+        'job_id': job_id,
+        'state': status['state'],
+        'results': [result for _, result in page],
+        'next': cursor,
+        'complete': status['state'] == 'completed' and cursor >= status['last_result']
+    })
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-Sent Events: 'progress' whenever the counts change, a 'result' per
+    finished song (its id is the results cursor, so reconnecting with
+    Last-Event-ID resumes after it) and 'completed' at the end.
+    """
+    if job_store is None:
+        return jsonify({'success': False, 'error': 'Jobs are disabled'}), 503
+    if job_store.status(job_id) is None:
+        return job_not_found()
+    try:
+        after = max(int(request.headers.get('Last-Event-ID') or request.args.get('after', 0)), 0)
+    except ValueError:
+        after = 0
+    if not job_event_streams.try_open():
+        response = jsonify({
+            'success': False,
+            'error': 'Too many job event streams open, poll the results instead',
+            'results_url': f'/jobs/{job_id}/results',
+            'retry_after': EventStreamLimit.RETRY_AFTER
+        })
+        response.headers['Retry-After'] = str(EventStreamLimit.RETRY_AFTER)
+        return response, 429
+    
+    def events():
+        cursor = after
+        last_progress = None
+        last_sent = time.monotonic()
+        while True:
+            status = job_store.status(job_id)
+            if status is None:
+                yield f'event: deleted\ndata: {json.dumps({"job_id": job_id})}\n\n'
+                return
+            page = job_store.results(job_id, cursor, 500)
+            for seq, result in page:
+                cursor = seq
+                yield f'id: {seq}\nevent: result\ndata: {json.dumps(result)}\n\n'
+            sent = bool(page)
+            progress = (status['state'], status['songs'])
+            if progress != last_progress:
+                last_progress = progress
+                yield f'event: progress\ndata: {json.dumps(status)}\n\n'
+                sent = True
+            if not sent and time.monotonic() - last_sent >= 15:
+                # Keeps proxies and the client from timing out an idle stream
+                yield ': keep-alive\n\n'
+                sent = True
+            if sent:
+                last_sent = time.monotonic()
+            if status['state'] == 'completed' and cursor >= status['last_result']:
+                yield f'event: completed\ndata: {json.dumps(status)}\n\n'
+                return
+            if len(page) < 500:
+                time.sleep(0.5)
+    
+    response = Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    response.call_on_close(job_event_streams.close)
+    return response
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Cancel a job and delete its state, audio and results"""
+    if job_store is None:
+        return jsonify({'success': False, 'error': 'Jobs are disabled'}), 503
+    if not job_store.delete(job_id):
+        return job_not_found()
+    logger.info(f"Deleted job {job_id}")
+    return jsonify({'success': True, 'job_id': job_id, 'deleted': True})
+
+@app.route('/admin/reload_model', methods=['POST'])
+def reload_model():
+    """Swap in the model file on disk without a restart; the old model keeps serving if it is rejected"""
+    if not admin_request_allowed():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    if model_data is None:
+        return jsonify({'success': False, 'error': 'Model not loaded'}), 503
+    
+    outcome = model_reloader.reload('admin')
+    if outcome.get('busy'):
+        return jsonify(outcome), 409
+    if outcome.get('changed') and prefork_server is not None:
+        # Only this worker has the new model; the server loads it and replaces the others
+        prefork_server.request_reload()
+    return jsonify(outcome), 200 if outcome['success'] else 422
+
+@app.route('/admin/profiles', methods=['GET'])
+def list_profiles():
+    """Sampled request profiles on disk, newest first"""
+    if not admin_request_allowed():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    return jsonify({'success': True, 'sampling': profile_sampler.stats(), 'profiles': profile_sampler.profiles()})
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """One saved profile as a .prof file, or with ?format=text the top functions by cumulative time"""
+    if not admin_request_allowed():
+        return jsonify({'success': False, 'error': 'Forbidden'}), 403
+    if name not in {profile['name'] for profile in profile_sampler.profiles()}:
+        return jsonify({'success': False, 'error': 'No such profile'}), 404
+    
+    if request.args.get('format') == 'text':
+        report = io.StringIO()
+        stats = pstats.Stats(os.path.join(profile_sampler.directory, name), stream=report)
+        stats.sort_stats('cumulative').print_stats(int(request.args.get('limit', 50)))
+        return Response(report.getvalue(), mimetype='text/plain')
+    return send_from_directory(profile_sampler.directory, name, as_attachment=True,
+                               mimetype='application/octet-stream')
+
 @app.route('/model_info', methods=['GET'])
 def model_info():
     if model_data is None:
@@ -938,9 +3743,12 @@ def model_info():
     
     uptime_seconds = time.time() - start_time
     uptime_hours = uptime_seconds / 3600
+    total_requests = combined_metrics()[0].snapshot()['total_requests']
     
     return jsonify({
         'model_type': model_data['model_type'],
+        'model_version': model_data['version'],
+        'model_reload': model_reloader.stats(),
         'total_features': len(model_data['feature_names']),
         'selected_features': len(model_data['selected_feature_names']),
         'label_map': model_data['label_map'],
@@ -950,8 +3758,8 @@ def model_info():
         'performance': {
             'max_workers': MAX_WORKERS,
             'uptime_hours': round(uptime_hours, 2),
-            'total_requests': request_count,
-            'requests_per_hour': round(request_count / max(uptime_hours, 0.01), 2),
+            'total_requests': total_requests,
+            'requests_per_hour': round(total_requests / max(uptime_hours, 0.01), 2),
             'optimization_level': 'local_full_featured'
         },
         'platform': 'Local PC'
@@ -961,33 +3769,95 @@ def model_info():
 def performance_stats():
     uptime_seconds = time.time() - start_time
     uptime_hours = uptime_seconds / 3600
+    metrics, _ = combined_metrics()
+    requests = metrics.snapshot()
+    total_requests = requests['total_requests']
+    latency_total = sum(stats['latency']['average_ms'] * stats['requests'] for stats in requests['endpoints'].values())
+    peak_memory = peak_memory_bytes()
     
     return jsonify({
-        'service_status': 'local_full_featured',
-        'optimization_level': 'high_performance_local',
-        'full_featured': True,
+        'service_status': warm_up_state['stage'],
         'performance_metrics': {
             'max_workers': MAX_WORKERS,
             'uptime_hours': round(uptime_hours, 2),
-            'total_requests': request_count,
-            'requests_per_hour': round(request_count / max(uptime_hours, 0.01), 2),
-            'average_response_time_ms': 'optimized',
-            'batch_capacity': '1000 songs',
-            'memory_efficient': True,
-            'cpu_optimized': True
+            'total_requests': total_requests,
+            'requests_per_hour': round(total_requests / max(uptime_hours, 0.01), 2),
+            'in_flight_requests': requests['in_flight_requests'],
+            'average_response_time_ms': round(latency_total / total_requests, 3) if total_requests else 0.0
         },
+        'endpoints': requests['endpoints'],
+        'stages': requests['stages'],
+        'server': prefork_server.stats() if prefork_server is not None else {'mode': 'development', 'pid': os.getpid()},
         'local_specs': {
             'platform': 'Local PC',
-            'memory': 'Unlimited',
             'cpu': f'{mp.cpu_count()} cores',
-            'optimization_strategy': 'full_featured_ml',
-            'max_concurrent_requests': MAX_WORKERS,
-            'recommended_batch_size': '100-500 songs',
-            'librosa_support': True,
-            'unlimited_size': True
-        }
+            'peak_memory_mb': round(peak_memory / 2**20, 1) if peak_memory is not None else None,
+            'extraction_workers': MAX_WORKERS
+        },
+        'inference_batching': inference_batcher.stats(),
+        'result_cache': result_cache.stats(),
+        'feature_store': feature_store.stats() if feature_store is not None else None,
+        'decoding': audio_decoder.stats(),
+        'cascade': cascade.stats(),
+        'admission': admission.stats(),
+        'jobs': {**job_runner.stats(), 'event_streams': job_event_streams.stats()} if job_runner is not None else None,
+        'profiling': profile_sampler.stats()
     })
 
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus text exposition of the request, stage, cache and cascade metrics"""
+    metrics, counters = combined_metrics()
+    peak_memory = peak_memory_bytes()
+    lines = metrics.prometheus() + [
+        '# HELP classifier_uptime_seconds Seconds since the service started.',
+        '# TYPE classifier_uptime_seconds gauge',
+        f'classifier_uptime_seconds {time.time() - start_time:.3f}',
+        '# HELP classifier_ready 1 once the model is loaded and warmed up.',
+        '# TYPE classifier_ready gauge',
+        f"classifier_ready {int(model_data is not None and warm_up_state['ready'])}",
+        '# HELP classifier_model_info Version of the serving model.',
+        '# TYPE classifier_model_info gauge',
+        f'classifier_model_info{{version="{prometheus_escape(str(model_version))}"}} 1',
+        '# HELP classifier_result_cache_lookups_total Result cache lookups by outcome.',
+        '# TYPE classifier_result_cache_lookups_total counter',
+        f'classifier_result_cache_lookups_total{{outcome="memory_hit"}} {counters["cache_memory_hits"]}',
+        f'classifier_result_cache_lookups_total{{outcome="disk_hit"}} {counters["cache_disk_hits"]}',
+        f'classifier_result_cache_lookups_total{{outcome="miss"}} {counters["cache_misses"]}',
+        '# HELP classifier_inference_batches_total Model calls made by the inference micro-batcher.',
+        '# TYPE classifier_inference_batches_total counter',
+        f"classifier_inference_batches_total {counters['inference_batches']}",
+        '# HELP classifier_inference_batch_rows_total Rows predicted by the inference micro-batcher.',
+        '# TYPE classifier_inference_batch_rows_total counter',
+        f"classifier_inference_batch_rows_total {counters['inference_batch_rows']}",
+        '# HELP classifier_cascade_answers_total Cascade classifications by answering tier.',
+        '# TYPE classifier_cascade_answers_total counter',
+        f'classifier_cascade_answers_total{{tier="1"}} {counters["cascade_tier1_answers"]}',
+        f'classifier_cascade_answers_total{{tier="2"}} {counters["cascade_tier2_answers"]}',
+        '# HELP classifier_extraction_timeouts_total Feature extractions that exceeded CLASSIFIER_TASK_TIMEOUT.',
+        '# TYPE classifier_extraction_timeouts_total counter',
+        f'classifier_extraction_timeouts_total {counters["extraction_timeouts"]}',
+        '# HELP classifier_admission_rejected_total Requests turned away with 429 by traffic class.',
+        '# TYPE classifier_admission_rejected_total counter',
+        f'classifier_admission_rejected_total{{class="interactive"}} {counters["admission_rejected_interactive"]}',
+        f'classifier_admission_rejected_total{{class="bulk"}} {counters["admission_rejected_bulk"]}'
+    ]
+    stats = admission.stats()
+    lines += [
+        '# HELP classifier_admission_admitted Requests admitted and not yet finished by traffic class (in production mode, the answering worker).',
+        '# TYPE classifier_admission_admitted gauge'
+    ] + [f'classifier_admission_admitted{{class="{cls}"}} {c["admitted"]}' for cls, c in stats['classes'].items()] + [
+        '# HELP classifier_admission_waiting Units of work waiting for a work slot by traffic class (in production mode, the answering worker).',
+        '# TYPE classifier_admission_waiting gauge'
+    ] + [f'classifier_admission_waiting{{class="{cls}"}} {c["waiting_for_slot"]}' for cls, c in stats['classes'].items()]
+    if peak_memory is not None:
+        lines += [
+            '# HELP classifier_process_peak_rss_bytes Peak resident memory of the serving process (in production mode, the answering worker).',
+            '# TYPE classifier_process_peak_rss_bytes gauge',
+            f'classifier_process_peak_rss_bytes {peak_memory}'
+        ]
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({'error': 'Endpoint not found'}), 404
@@ -996,62 +3866,110 @@ def not_found(error):
 def internal_error(error):
     return jsonify({'error': 'Internal server error'}), 500
 
+class ClassifierServer(PreforkServer):
+    """
+    The pre-fork server with this service plugged in: it starts the service
+    before forking, reloads the model through model_reloader, combines the
+    workers' metrics through WorkerMetrics and queues the job songs of a
+    worker that exited again.
+    """
+
+    def prepare(self):
+        global worker_metrics
+        if not start_service(prefork=True):
+            raise RuntimeError("No model could be loaded")
+        worker_metrics = WorkerMetrics(tempfile.mkdtemp(prefix='classifier-metrics-'), service_metrics, process_counters)
+        if job_store is not None:
+            # No worker has been forked yet, so songs still marked running were cut off by the last server
+            job_store.requeue()
+
+    def reload_model(self) -> Optional[Dict[str, Any]]:
+        return model_reloader.reload('SIGHUP')
+
+    def check_model(self) -> Optional[Dict[str, Any]]:
+        return model_reloader.check_file()
+
+    def worker_started(self):
+        # The server process's warm-up is not this worker's traffic
+        service_metrics.clear()
+        worker_metrics.start_writing()
+        if job_runner is not None:
+            job_runner.resume()
+
+    def worker_stopping(self):
+        if job_runner is not None:
+            job_runner.stop(self.graceful_timeout)
+        worker_metrics.write()
+
+    def worker_exited(self, pid: int):
+        worker_metrics.retire(pid)
+        if job_store is not None:
+            job_store.requeue(pid)
+
+    def stopped(self):
+        shutil.rmtree(worker_metrics.directory, ignore_errors=True)
+
+# Set in production mode
+prefork_server = None
+
 # Start the Flask app
 if __name__ == '__main__':
     logger.info("🚀 Starting Local Music Classification Service...")
     
-    if load_model():
-        logger.info("✅ Service ready!")
+    # The pre-fork server warms up on this thread, before it forks its workers
+    if start_service(prefork=PREFORK):
+        logger.info("✅ Service started!" + (" Warming up, see GET /ready" if WARMUP else ""))
         logger.info("📡 Available endpoints:")
         logger.info("   GET  /health - Health check")
+        logger.info("   GET  /ready - 200 once the warm-up has finished")
         logger.info("   POST /classify - Classify single song")
         logger.info("   POST /classify_features - Classify using pre-extracted features")
         logger.info("   POST /classify_audio_data - Classify using raw audio data (server-side feature extraction)")
         logger.info("   POST /classify_file - Classify using uploaded audio file (multipart)")
         logger.info("   POST /classify_audio_file - Classify using raw audio file data (RECOMMENDED)")
         logger.info("   POST /batch_classify - Classify multiple songs (up to 1000)")
+        logger.info("   POST /rescore - Re-score every stored feature vector with the current model")
+        logger.info("   POST /cascade/train - Train the cascade's first tier from the feature store")
+        logger.info("   POST /jobs - Classify a library in the background (upload songs, poll or stream progress)")
+        logger.info("   POST /admin/reload_model - Swap in a new model file without a restart")
+        logger.info("   GET  /admin/profiles - Sampled request profiles (CLASSIFIER_PROFILE_EVERY)")
         logger.info("   GET  /model_info - Get model information")
         logger.info("   GET  /performance - Performance statistics")
+        logger.info("   GET  /metrics - Prometheus metrics")
         logger.info("   GET  / - Service information")
-        logger.info(f"🔧 Optimization: {MAX_WORKERS} workers, full librosa support")
+        if PREFORK:
+            logger.info(f"🔧 Production mode: {SERVER_OPTIONS.workers} server workers, full librosa support")
+        else:
+            logger.info(f"🔧 Optimization: {MAX_WORKERS} workers, full librosa support")
+            logger.info("   Development server; use --production to serve from several processes")
         logger.info("💾 Memory: Unlimited, local hosting")
         
         # Get local IP address
-        import socket
         hostname = socket.gethostname()
         local_ip = socket.gethostbyname(hostname)
+        port = SERVER_OPTIONS.port
         
         print("\n" + "="*60)
         print("YOUR LOCAL SERVICE URLS:")
-        print(f"   Local: http://localhost:5000")
-        print(f"   Network: http://{local_ip}:5000")
+        print(f"   Local: http://localhost:{port}")
+        print(f"   Network: http://{local_ip}:{port}")
         print("Use the Network URL in your Android app!")
         print("="*60 + "\n")
         
-        # Test the service
-        try:
-            import requests
-            print("Testing local service...")
-            
-            # Test health check
-            response = requests.get("http://localhost:5000/health")
-            print(f"Health check: {response.json()}")
-            
-            # Test classification
-            test_data = {
-                "audio_data": [0.1, 0.2, 0.3, 0.4, 0.5],
-                "sample_rate": 22050,
-                "song_id": "test_local"
-            }
-            response = requests.post("http://localhost:5000/classify", json=test_data)
-            print(f"Classification test: {response.json()}")
-            
-        except Exception as e:
-            print(f"Service test failed: {e}")
-        
         print("\nService is running! Press Ctrl+C to stop.")
         
-        app.run(host='0.0.0.0', port=5000, debug=False)
+        if PREFORK:
+            prefork_server = ClassifierServer(
+                app, SERVER_OPTIONS.host, port, SERVER_OPTIONS.workers, SERVER_OPTIONS.threads,
+                SERVER_OPTIONS.max_requests, NATIVE_THREADS, SERVER_OPTIONS.graceful_timeout, MODEL_WATCH_SECONDS
+            )
+            prefork_server.serve()
+        else:
+            if job_store is not None:
+                # Nothing is classifying yet, so songs still marked running were cut off by the last server
+                job_store.requeue()
+                job_runner.resume()
+            app.run(host=SERVER_OPTIONS.host, port=port, debug=False)
     else:
         logger.error("Failed to start service - model loading failed")
         sys.exit(1)
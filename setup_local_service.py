@@ -25,9 +25,9 @@ def main():
         'flask-cors>=4.0.0',
         'librosa>=0.10.0',
         'soundfile>=0.12.0',
+        'soxr>=0.3.2',
         'scikit-learn>=1.3.0',
         'joblib>=1.3.0',
-        'pandas>=2.0.0',
         'numpy>=1.24.0'
     ]
     
@@ -0,0 +1,35 @@
+"""
+The tests import the service module directly; importing it starts nothing.
+Tests that classify use the ``started_service`` fixture, which loads the
+model in this process. It is configured here, before the import: extraction
+on the calling thread, no warm-up, and no result cache, feature store,
+compiled models or jobs written next to the repository.
+"""
+
+import os
+import sys
+
+import pytest
+
+os.environ.update({
+    'CLASSIFIER_WORKERS': '0',
+    'CLASSIFIER_WARMUP': '0',
+    'CLASSIFIER_CACHE_ENTRIES': '0',
+    'CLASSIFIER_CACHE_PATH': '',
+    'CLASSIFIER_FEATURE_STORE_DIR': '',
+    'CLASSIFIER_COMPILED_MODEL_DIR': '',
+    'CLASSIFIER_JOBS_DIR': '',
+    'CLASSIFIER_BATCH_WINDOW_MS': '0'
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def pytest_configure(config):
+    # librosa (silent or very short clips) and scikit-learn (model pickled with another version)
+    config.addinivalue_line('filterwarnings', 'ignore::UserWarning')
+
+@pytest.fixture(scope='session')
+def started_service():
+    """The service module with its model loaded."""
+    import local_music_classification_service as service
+    assert service.start_service()
+    return service
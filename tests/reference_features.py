@@ -0,0 +1,132 @@
+"""
+The feature extraction the model was trained against, kept as the reference
+the service's optimized extraction is checked against.
+
+``window_features`` is the original LocalAudioFeatureExtractor path (raw PCM
+endpoints: resampled with librosa.resample and padded/truncated to 10 s) and
+``raw_features`` the original extract_features_from_audio_data path (decoded
+files, analysed as-is). Both are one librosa call per feature group, exactly
+as the service computed them before the single-STFT engine.
+"""
+
+import numpy as np
+import librosa
+
+SAMPLE_RATE = 22050
+DURATION = 10
+
+def skewness(data):
+    mean = np.mean(data)
+    std = np.std(data)
+    if std == 0:
+        return 0.0
+    return np.mean(((data - mean) / std) ** 3)
+
+def window_features(audio_data, sample_rate):
+    target_length = SAMPLE_RATE * DURATION
+    if sample_rate != SAMPLE_RATE:
+        y = librosa.resample(audio_data, orig_sr=sample_rate, target_sr=SAMPLE_RATE)
+    else:
+        y = audio_data
+    if len(y) > target_length:
+        y = y[:target_length]
+    elif len(y) < target_length:
+        y = np.pad(y, (0, target_length - len(y)), mode='constant')
+    return raw_features(y, SAMPLE_RATE)
+
+def raw_features(y, sr):
+    features = {}
+    
+    features['signal_length_ratio'] = float(len(y) / (sr * DURATION))
+    features['rms_energy_ratio'] = float(np.sqrt(np.mean(y**2)) / (np.max(np.abs(y)) + 1e-8))
+    
+    spectral_centroids = librosa.feature.spectral_centroid(y=y, sr=sr)[0]
+    features['spectral_centroid_mean'] = float(np.mean(spectral_centroids))
+    features['spectral_centroid_std'] = float(np.std(spectral_centroids))
+    features['spectral_centroid_skew'] = float(skewness(spectral_centroids))
+    
+    spectral_rolloff = librosa.feature.spectral_rolloff(y=y, sr=sr)[0]
+    features['spectral_rolloff_mean'] = float(np.mean(spectral_rolloff))
+    features['spectral_rolloff_std'] = float(np.std(spectral_rolloff))
+    
+    spectral_bandwidth = librosa.feature.spectral_bandwidth(y=y, sr=sr)[0]
+    features['spectral_bandwidth_mean'] = float(np.mean(spectral_bandwidth))
+    features['spectral_bandwidth_std'] = float(np.std(spectral_bandwidth))
+    
+    zcr = librosa.feature.zero_crossing_rate(y)[0]
+    features['zcr_mean'] = float(np.mean(zcr))
+    features['zcr_std'] = float(np.std(zcr))
+    
+    mfccs = librosa.feature.mfcc(y=y, sr=sr, n_mfcc=13)
+    for i in range(13):
+        features[f'mfcc_{i+1}_mean'] = float(np.mean(mfccs[i]))
+        features[f'mfcc_{i+1}_std'] = float(np.std(mfccs[i]))
+    
+    chroma = librosa.feature.chroma_stft(y=y, sr=sr)
+    features['chroma_mean'] = float(np.mean(chroma))
+    features['chroma_std'] = float(np.std(chroma))
+    chroma_bins = np.mean(chroma, axis=1)
+    for i in range(12):
+        features[f'chroma_bin_{i}'] = float(chroma_bins[i])
+    
+    tonnetz = librosa.feature.tonnetz(y=y, sr=sr)
+    features['tonnetz_mean'] = float(np.mean(tonnetz))
+    features['tonnetz_std'] = float(np.std(tonnetz))
+    
+    tempo, beats = librosa.beat.beat_track(y=y, sr=sr)
+    tempo = float(np.atleast_1d(tempo)[0])
+    features['tempo'] = tempo if np.isfinite(tempo) else 120.0
+    features['beat_strength'] = float(len(beats) / (len(y) / sr)) if len(y) > 0 else 0.0
+    
+    contrast = librosa.feature.spectral_contrast(y=y, sr=sr)
+    features['spectral_contrast_mean'] = float(np.mean(contrast))
+    features['spectral_contrast_std'] = float(np.std(contrast))
+    
+    flatness = librosa.feature.spectral_flatness(y=y)
+    features['spectral_flatness_mean'] = float(np.mean(flatness))
+    features['spectral_flatness_std'] = float(np.std(flatness))
+    
+    features['dynamic_range'] = float(np.percentile(np.abs(y), 95) - np.percentile(np.abs(y), 5))
+    features['peak_to_rms_ratio'] = float(np.max(np.abs(y)) / (np.sqrt(np.mean(y**2)) + 1e-8))
+    
+    try:
+        y_harmonic, y_percussive = librosa.effects.hpss(y)
+        harmonic_energy = np.sum(y_harmonic**2)
+        percussive_energy = np.sum(y_percussive**2)
+        total_energy = harmonic_energy + percussive_energy
+        features['harmonic_ratio'] = float(harmonic_energy / (total_energy + 1e-8))
+        features['percussive_ratio'] = float(percussive_energy / (total_energy + 1e-8))
+    except Exception:
+        features['harmonic_ratio'] = 0.5
+        features['percussive_ratio'] = 0.5
+    
+    features['spectral_centroid_normalized'] = float(np.mean(spectral_centroids) / (sr / 2))
+    features['silence_ratio'] = float(np.sum(np.abs(y) < 0.01) / len(y))
+    return features
+
+def reference_clip(kind, sample_rate, seconds):
+    """Deterministic clip: the same kind, rate and length always give the same samples."""
+    rng = np.random.default_rng(sample_rate + len(kind))
+    t = np.arange(int(round(sample_rate * seconds))) / sample_rate
+    if kind == 'tone':
+        y = sum(0.2 * np.sin(2 * np.pi * frequency * t) for frequency in (220.0, 277.2, 329.6))
+    elif kind == 'noise':
+        y = 0.3 * rng.standard_normal(len(t))
+    elif kind == 'clicks':
+        y = np.zeros(len(t))
+        y[::sample_rate // 2] = 1.0
+        blip = np.exp(-np.arange(sample_rate // 50) / (sample_rate / 1000)) * np.sin(
+            2 * np.pi * 1000 * np.arange(sample_rate // 50) / sample_rate
+        )
+        y = np.convolve(y, blip, mode='same')
+    elif kind == 'music':
+        roots = np.array([220.0, 196.0, 174.6, 196.0, 220.0])[(t // 2).astype(int) % 5]
+        y = sum(0.15 * np.sin(2 * np.pi * roots * ratio * t) for ratio in (1.0, 1.26, 1.5))
+        kicks = np.zeros(len(t))
+        kicks[::sample_rate // 2] = 1.0
+        y += np.convolve(kicks, 0.6 * np.exp(-np.arange(2000) / 200.0) * np.sin(
+            2 * np.pi * 60 * np.arange(2000) / sample_rate), mode='same')
+        y += 0.02 * rng.standard_normal(len(t))
+    else:
+        raise ValueError(f"Unknown clip kind {kind}")
+    return y.astype(np.float32)
@@ -0,0 +1,111 @@
+"""AdmissionController: per-class admission limits, 429 rejections and the order work slots are handed out in."""
+
+import threading
+import time
+
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+def wait_for(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "Timed out"
+        time.sleep(0.005)
+
+def hold_admission(admission: service.AdmissionController, traffic_class: str, seconds: float = 0) -> threading.Event:
+    """Admit a request of ``traffic_class`` on another thread; it finishes ``seconds`` after the returned event is set."""
+    done = threading.Event()
+    admitted = threading.Event()
+
+    def request():
+        if not admission.admit(traffic_class):
+            return
+        admitted.set()
+        done.wait()
+        time.sleep(seconds)
+        admission.finish()
+
+    threading.Thread(target=request, daemon=True).start()
+    assert admitted.wait(10), f"The {traffic_class} request was not admitted"
+    return done
+
+def test_freed_slots_go_to_waiting_classes_by_weight():
+    admission = service.AdmissionController(1, {'interactive': 0, 'bulk': 0}, {'interactive': 2, 'bulk': 1})
+    order = []
+
+    def unit(traffic_class):
+        with admission.scheduled_as(traffic_class):
+            admission.acquire()
+            order.append(traffic_class)
+            admission.release()
+
+    threads = []
+    with admission.scheduled_as('bulk'):
+        admission.acquire()
+        # A batch's songs queue up before three single-song requests do
+        for traffic_class in ['bulk'] * 3 + ['interactive'] * 3:
+            waiting = admission.stats()['classes'][traffic_class]['waiting_for_slot']
+            threads.append(threading.Thread(target=unit, args=(traffic_class,)))
+            threads[-1].start()
+            wait_for(lambda: admission.stats()['classes'][traffic_class]['waiting_for_slot'] == waiting + 1)
+        admission.release()
+    for thread in threads:
+        thread.join(10)
+
+    assert order == ['interactive', 'interactive', 'bulk', 'interactive', 'bulk', 'bulk']
+    assert admission.stats()['free_slots'] == 1
+
+def test_unadmitted_work_does_not_take_slots():
+    admission = service.AdmissionController(1, {'interactive': 0, 'bulk': 0}, {'interactive': 1, 'bulk': 1})
+    with admission.scheduled_as('bulk'):
+        assert admission.acquire()
+        assert not admission.acquire(block=False)
+        # Warm-up or a reload on another thread
+        other = []
+        thread = threading.Thread(target=lambda: other.append(admission.acquire(block=False)))
+        thread.start()
+        thread.join()
+        assert other == [True]
+    # finish() returned the slot the thread still held
+    assert admission.stats()['free_slots'] == 1
+
+def test_full_class_is_rejected_with_an_estimate():
+    admission = service.AdmissionController(2, {'interactive': 1, 'bulk': 1}, {'interactive': 1, 'bulk': 1})
+    first = hold_admission(admission, 'bulk', seconds=1.2)
+    assert not admission.admit('bulk')
+    # Nothing has finished yet to estimate from
+    assert admission.retry_after('bulk') == 1
+    # The other class has its own limit
+    assert admission.admit('interactive')
+    admission.finish()
+
+    first.set()
+    wait_for(lambda: admission.stats()['classes']['bulk']['admitted'] == 0)
+    second = hold_admission(admission, 'bulk')
+    # The admitted request has just started, and bulk requests have taken about 1.2s
+    assert admission.retry_after('bulk') == 2
+    second.set()
+    assert admission.stats()['classes']['bulk']['rejected'] == 1
+
+@pytest.mark.usefixtures('started_service')
+def test_requests_beyond_the_limit_get_429(monkeypatch):
+    admission = service.AdmissionController(2, {'interactive': 1, 'bulk': 1}, {'interactive': 4, 'bulk': 1})
+    monkeypatch.setattr(service, 'admission', admission)
+    client = service.app.test_client()
+    body = {'audio_data': reference_clip('music', 22050, 2).tolist(), 'sample_rate': 22050}
+
+    batch = hold_admission(admission, 'bulk')
+    assert client.post('/classify', json=body).status_code == 200
+    rejected = client.post('/batch_classify', json={'songs': [{**body, 'song_id': 'a'}]})
+    assert rejected.status_code == 429
+    assert rejected.headers['Retry-After'] == str(rejected.get_json()['retry_after'])
+
+    single = hold_admission(admission, 'interactive')
+    assert client.post('/classify', json=body).status_code == 429
+    single.set()
+    batch.set()
+    wait_for(lambda: all(c['admitted'] == 0 for c in admission.stats()['classes'].values()))
+    assert client.post('/batch_classify', json={'songs': [{**body, 'song_id': 'a'}]}).status_code == 200
+    assert {cls: c['rejected'] for cls, c in admission.stats()['classes'].items()} == {'interactive': 1, 'bulk': 1}
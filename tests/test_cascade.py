@@ -0,0 +1,98 @@
+"""The two-tier cascade: training the first tier on stored features, and its confidence gate."""
+
+import numpy as np
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+KINDS = ('tone', 'noise', 'clicks', 'music')
+
+def jittered_rows(vectors: np.ndarray, copies: int, seed: int) -> np.ndarray:
+    """``copies`` of every vector with each feature scaled at random, as songs of a similar kind would vary."""
+    rng = np.random.default_rng(seed)
+    return np.repeat(vectors, copies, axis=0) * rng.lognormal(0, 0.3, (len(vectors) * copies, vectors.shape[1]))
+
+def first_tier_answers(X: np.ndarray) -> tuple:
+    """(predictions, confidences) of the trained first tier on full feature rows."""
+    first_tier = service.cascade.first_tier
+    columns = [service.feature_extractor.feature_names.index(name) for name in first_tier['feature_names']]
+    probabilities = first_tier['model'].predict_proba(np.asarray(X, dtype=np.float64)[:, columns])
+    return first_tier['model'].classes_[probabilities.argmax(axis=1)], probabilities.max(axis=1)
+
+def set_threshold(threshold: float):
+    service.cascade.threshold = threshold
+    service.feature_extractor.set_first_tier(service.cascade.first_tier, threshold)
+
+@pytest.fixture
+def reference_vectors(started_service) -> np.ndarray:
+    return np.array([service.feature_extractor.extract_vector(reference_clip(kind, 22050, 3), 22050) for kind in KINDS])
+
+@pytest.fixture
+def trained(reference_vectors, tmp_path, monkeypatch):
+    """A first tier trained through /cascade/train on 400 stored rows; returns the training response."""
+    store = service.FeatureStore(str(tmp_path / 'features'), service.feature_extractor.feature_names,
+                                 service.current_model_version)
+    X = jittered_rows(reference_vectors, 100, seed=0)
+    store.append([
+        (f'row-{i}', f'song-{i}', row, {'success': True, 'prediction': '', 'confidence': 0.0})
+        for i, row in enumerate(X)
+    ])
+    monkeypatch.setattr(service, 'feature_store', store)
+    monkeypatch.setattr(service, 'cascade', service.ClassificationCascade(str(tmp_path / 'first_tier.joblib'), 0.9))
+    monkeypatch.setattr(service, 'result_cache', service.ResultCache(0, '', 0, service.current_model_version))
+
+    response = service.app.test_client().post('/cascade/train', json={'min_rows': 100, 'n_estimators': 30})
+    assert response.status_code == 200
+    yield response.get_json()
+    monkeypatch.undo()
+    service.cascade.load(service.feature_extractor)
+    service.extraction_pool.restart()
+
+def test_training_needs_enough_stored_rows(started_service, tmp_path, monkeypatch):
+    store = service.FeatureStore(str(tmp_path), service.feature_extractor.feature_names, service.current_model_version)
+    monkeypatch.setattr(service, 'feature_store', store)
+    response = service.app.test_client().post('/cascade/train', json={'min_rows': 10})
+    assert response.status_code == 400
+    assert 'at least 10' in response.get_json()['error']
+
+def test_gate_sends_unconfident_songs_to_the_full_model(reference_vectors, trained):
+    client = service.app.test_client()
+    audio = reference_clip('music', 22050, 3)
+    _, full_probabilities = service.predict_matrix(reference_vectors[-1:])
+    [tier1_label], [confidence] = first_tier_answers(reference_vectors[-1:])
+
+    set_threshold(confidence + 1e-3)
+    result = client.post('/classify', json={'audio_data': audio.tolist(), 'sample_rate': 22050}).get_json()
+    assert result['tier'] == 2
+    assert result['model_version'] == service.model_version
+    assert list(result['probabilities'].values()) == pytest.approx(full_probabilities[0])
+
+    set_threshold(confidence - 1e-3)
+    result = client.post('/classify', json={'audio_data': audio.tolist(), 'sample_rate': 22050}).get_json()
+    assert result['tier'] == 1
+    assert result['prediction'] == service.model_data['label_map'][tier1_label]
+    assert result['confidence'] == pytest.approx(confidence)
+    assert result['model_version'] == trained['cascade']['first_tier']['trained_for'] == service.model_version
+
+    stats = service.cascade.stats()
+    assert (stats['tier1_answers'], stats['tier2_answers']) == (1, 1)
+
+def test_confident_first_tier_agrees_with_the_full_model(reference_vectors, trained):
+    threshold = service.cascade.threshold
+    X = jittered_rows(reference_vectors, 50, seed=1)
+    full_labels, _ = service.predict_matrix(X)
+    labels, confidence = first_tier_answers(X)
+
+    answered = confidence >= threshold
+    assert answered.mean() > 0.2
+    assert (labels[answered] == full_labels[answered]).mean() >= 0.95
+    # The training report's estimate for the serving threshold, from its held-out rows
+    report = trained['holdout'][f'{threshold:g}']
+    assert report['tier1_coverage'] > 0 and report['agreement_with_full_model'] >= 0.95
+
+def test_first_tier_of_another_model_is_not_used(trained, monkeypatch):
+    monkeypatch.setattr(service, 'model_version', 'replacement')
+    service.cascade.load(service.feature_extractor)
+    assert not service.cascade.active
+    assert service.feature_extractor.first_tier is None
@@ -0,0 +1,70 @@
+"""The compiled model against scikit-learn: the same model inputs, labels and probabilities, bit for bit."""
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+
+import local_music_classification_service as service
+
+@pytest.fixture(scope='module')
+def shipped_model(started_service):
+    return service.model_data['model']
+
+@pytest.fixture(scope='module')
+def forest_with_missing_values():
+    """A forest trained on NaNs, so its splits send missing values both ways."""
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((400, 6))
+    y = np.where(X[:, 0] + X[:, 1] > 0, 'high', 'low').astype(object)
+    y[X[:, 2] > 1.0] = 'peak'
+    X[rng.random(X.shape) < 0.15] = np.nan
+    # Missing first columns mean 'low' here and 'high' there, so both directions get learned
+    y[np.isnan(X[:, 0])] = 'low'
+    y[np.isnan(X[:, 1])] = 'high'
+    return RandomForestClassifier(n_estimators=25, random_state=0).fit(X, y)
+
+def model_inputs(n_features: int, kind: str, n_rows: int = 600) -> np.ndarray:
+    """Scaled model inputs: standard normal rows, extreme magnitudes, or rows with NaNs."""
+    rng = np.random.default_rng(len(kind))
+    X = rng.standard_normal((n_rows, n_features))
+    if kind == 'extreme':
+        X *= rng.choice([0.0, 1e-30, 1e6, 1e30, -1e30], size=X.shape)
+    elif kind == 'missing':
+        X[rng.random(X.shape) < 0.2] = np.nan
+        X[0] = np.nan
+    return X
+
+def assert_same_predictions(model, X):
+    labels, probabilities = service.CompiledForest(model).predict(X)
+    np.testing.assert_array_equal(probabilities, model.predict_proba(X))
+    np.testing.assert_array_equal(labels, model.predict(X))
+
+@pytest.mark.parametrize('kind', ['random', 'extreme', 'missing'])
+def test_shipped_model(shipped_model, kind):
+    assert_same_predictions(shipped_model, model_inputs(shipped_model.n_features_in_, kind))
+
+@pytest.mark.parametrize('kind', ['random', 'missing'])
+def test_missing_go_to_left(forest_with_missing_values, kind):
+    compiled = service.CompiledForest(forest_with_missing_values)
+    assert compiled.missing_left.any() and not compiled.missing_left.all()
+    assert_same_predictions(forest_with_missing_values, model_inputs(6, kind))
+
+def test_single_rows_match_batch(shipped_model):
+    compiled = service.CompiledForest(shipped_model)
+    X = model_inputs(shipped_model.n_features_in_, 'missing', n_rows=20)
+    labels, probabilities = compiled.predict(X)
+    for i in range(len(X)):
+        row_labels, row_probabilities = compiled.predict(X[i:i + 1])
+        np.testing.assert_array_equal(row_probabilities, shipped_model.predict_proba(X[i:i + 1]))
+        np.testing.assert_array_equal(row_probabilities[0], probabilities[i])
+        assert row_labels[0] == labels[i] == shipped_model.predict(X[i:i + 1])[0]
+
+@pytest.mark.usefixtures('started_service')
+@pytest.mark.parametrize('kind', ['random', 'extreme'])
+def test_feature_projection_matches_pipeline(kind):
+    """The folded preprocessing against variance_selector -> scaler -> feature_selector."""
+    n_features = len(service.model_data['feature_names'])
+    # Rows spanning the magnitudes of the real features, from ratios to frequencies in Hz
+    X = model_inputs(n_features, kind) * np.logspace(-3, 4, n_features)
+    projection = service.FeatureProjection(service.model_data)
+    np.testing.assert_array_equal(projection.transform(X), service.transform_stepwise(service.model_data, X))
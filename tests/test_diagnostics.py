@@ -0,0 +1,84 @@
+"""Request diagnostics: X-Debug-Timing stage timings and sampled request profiles."""
+
+import os
+import pstats
+import threading
+
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+def sampled_work():
+    return sum(i * i for i in range(1000))
+
+def test_one_in_every_requests_is_profiled_into_a_ring(tmp_path):
+    sampler = service.ProfileSampler(2, str(tmp_path), keep=2)
+    for _ in range(8):
+        sampler.begin()
+        sampled_work()
+        sampler.end('/classify')
+
+    assert (sampler.captured, sampler.skipped) == (4, 0)
+    profiles = sampler.profiles()
+    assert len(profiles) == 2 and sorted(os.listdir(tmp_path)) == sorted(p['name'] for p in profiles)
+    # Newest first: the ring kept the third and fourth captures
+    assert [p['name'].split('-')[2] for p in profiles] == ['000004', '000003']
+    assert profiles[0]['endpoint'] == 'classify'
+    functions = {name for _, _, name in pstats.Stats(str(tmp_path / profiles[0]['name'])).stats}
+    assert 'sampled_work' in functions
+
+def test_sample_during_another_capture_is_skipped(tmp_path):
+    sampler = service.ProfileSampler(1, str(tmp_path), keep=5)
+    assert sampler.begin()
+    other = []
+    thread = threading.Thread(target=lambda: other.append((sampler.begin(), sampler.active)))
+    thread.start()
+    thread.join()
+    sampler.end('/classify')
+
+    assert other == [(False, False)]
+    assert (sampler.captured, sampler.skipped) == (1, 1)
+    assert service.ProfileSampler(0, str(tmp_path), keep=5).begin() is False
+
+@pytest.fixture
+def profile_sampler(started_service, tmp_path, monkeypatch):
+    sampler = service.ProfileSampler(1, str(tmp_path), keep=5)
+    monkeypatch.setattr(service, 'profile_sampler', sampler)
+    monkeypatch.setattr(service, 'result_cache', service.ResultCache(0, '', 0, service.current_model_version))
+    return sampler
+
+def test_profiles_of_classify_requests_are_served(profile_sampler):
+    client = service.app.test_client()
+    body = {'audio_data': reference_clip('music', 22050, 2).tolist(), 'sample_rate': 22050}
+    assert client.post('/classify', json=body).status_code == 200
+    # GET requests and the admin endpoints are not sampled
+    client.get('/health')
+
+    listing = client.get('/admin/profiles').get_json()
+    assert listing['sampling']['captured'] == 1
+    [profile] = listing['profiles']
+    assert profile['endpoint'] == 'classify'
+
+    report = client.get(f"/admin/profiles/{profile['name']}?format=text").get_data(as_text=True)
+    assert 'cumulative' in report and 'extract_vector' in report
+    with open(os.path.join(profile_sampler.directory, profile['name']), 'rb') as f:
+        assert client.get(f"/admin/profiles/{profile['name']}").data == f.read()
+    assert client.get('/admin/profiles/nothing.prof').status_code == 404
+
+@pytest.mark.usefixtures('started_service')
+def test_debug_timing_reports_stages(monkeypatch):
+    monkeypatch.setattr(service, 'result_cache', service.ResultCache(0, '', 0, service.current_model_version))
+    client = service.app.test_client()
+    body = {'audio_data': reference_clip('music', 22050, 2).tolist(), 'sample_rate': 22050}
+    assert 'timings' not in client.post('/classify', json=body).get_json()
+
+    response = client.post('/classify', json=body, headers={'X-Debug-Timing': '1'})
+    timings = response.get_json()['timings']
+    for stage in ('total_ms', 'upload_ms', 'decode_ms', 'extract_ms', 'inference_ms'):
+        assert timings[stage] >= 0
+    assert {'stft_ms', 'mfcc_ms', 'chroma_ms'} <= set(timings['extraction'])
+    assert timings['extract_ms'] <= timings['total_ms']
+    assert sum(timings['extraction'].values()) <= timings['extract_ms'] + 1
+    assert response.headers['Server-Timing'].startswith('total;dur=')
+    assert 'extraction' not in response.headers['Server-Timing']
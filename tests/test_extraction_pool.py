@@ -0,0 +1,31 @@
+"""ExtractionPool with real worker processes."""
+
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+def test_timed_out_task_replaces_the_pool():
+    pool = service.ExtractionPool(service.LocalAudioFeatureExtractor(), workers=1, task_timeout=60,
+                                  max_tasks_per_worker=0)
+    clip = reference_clip('music', 22050, 10)
+    try:
+        assert pool.warm_up(60)
+        hung = pool._pool
+        stuck_workers = list(hung._pool)
+
+        pool.task_timeout = 0.001
+        with pytest.raises(TimeoutError):
+            pool.extract_vector(clip, 22050)
+        assert pool.timeouts == 1
+        assert pool._pool is not hung
+
+        pool.task_timeout = 60
+        features = pool.extract_vector(clip, 22050)
+        assert features is not None
+        assert features.shape == (len(service.FEATURE_NAMES),)
+        for worker in stuck_workers:
+            worker.join(10)
+            assert not worker.is_alive()
+    finally:
+        pool.shutdown()
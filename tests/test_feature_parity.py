@@ -0,0 +1,124 @@
+"""
+The service's extraction against the original one (tests/reference_features.py),
+feature by feature, on a fixed set of synthetic clips at 22.05, 44.1 and 48 kHz.
+
+Both paths are covered: the window path (``fit_to_window``, raw PCM endpoints)
+and the raw path (decoded files). The set includes clips shorter than the
+analysis window and clips within a few thousand samples of it, where padding
+and truncation happen.
+"""
+
+from functools import lru_cache
+
+import librosa
+import numpy as np
+import pytest
+
+import local_music_classification_service as service
+from reference_features import DURATION, SAMPLE_RATE, raw_features, reference_clip, window_features
+
+RTOL = 1e-4
+ATOL = 1e-6
+
+# Derived from the STFT chroma instead of a separate CQT chroma (removed by the model's variance selector)
+TONNETZ = ('tonnetz_mean', 'tonnetz_std')
+HPSS = ('harmonic_ratio', 'percussive_ratio')
+# Difference of the ratios where SpectralFeatureEngine.hpss_energy sums the masked spectrogram
+HPSS_ATOL = 0.003
+# Largest difference in class probability from the reference features
+PROBABILITY_ATOL = 0.01
+
+CLIPS = [
+    ('music', 22050, 10),
+    ('music', 44100, 12),
+    ('tone', 48000, 8),
+    ('noise', 22050, 3),
+    ('clicks', 44100, 10),
+    ('music', 22050, 0.1),
+    ('tone', 22050, 1),
+    ('music', 22050, 0.3),
+    ('music', 44100, 0.3),
+    ('music', 48000, 0.3),
+    ('tone', 44100, 10 - 2000 / 44100),
+    ('tone', 44100, 10 + 3000 / 44100),
+    ('music', 44100, 10 + 4097 / 44100),
+    ('music', 48000, 10 - 2000 / 48000),
+    ('music', 48000, 10 + 4096 / 48000)
+]
+PATHS = ('window', 'raw')
+
+# Source lengths (rate, samples) short of the window and around it, where Resampler trims its input
+MARGIN = service.Resampler.MARGIN
+RESAMPLED_LENGTHS = [
+    (sample_rate, sample_rate * DURATION + offset)
+    for sample_rate in (44100, 48000)
+    for offset in (-sample_rate * 97 // 10, -2000, -1, 0, 1, 2000, MARGIN - 1, MARGIN, MARGIN + 1, 2 * MARGIN)
+]
+
+def clip_id(clip):
+    kind, sample_rate, seconds = clip
+    return f"{kind}-{sample_rate}-{seconds:.3f}s"
+
+@lru_cache(maxsize=None)
+def extracted(path, clip):
+    """(reference features, service features) for one clip, both as name -> value."""
+    kind, sample_rate, seconds = clip
+    y = reference_clip(kind, sample_rate, seconds)
+    if path == 'window':
+        reference = window_features(y, sample_rate)
+    else:
+        reference = raw_features(y, sample_rate)
+    vector = service.LocalAudioFeatureExtractor().extract_vector(y, sample_rate, fit_to_window=(path == 'window'))
+    return reference, {name: float(vector[index]) for name, index in service.FEATURE_INDEX.items()}
+
+def mismatches(reference, features, names, rtol, atol):
+    return [
+        f"{name}: reference {reference[name]:.8g}, service {features[name]:.8g}"
+        for name in names
+        if not abs(features[name] - reference[name]) <= atol + rtol * abs(reference[name])
+    ]
+
+def test_reference_covers_every_feature():
+    reference, features = extracted('raw', CLIPS[0])
+    assert set(reference) == set(features) == set(service.FEATURE_NAMES)
+    assert len(features) == 65
+
+@pytest.mark.parametrize('clip', CLIPS, ids=clip_id)
+@pytest.mark.parametrize('path', PATHS)
+def test_features_match_reference(path, clip):
+    reference, features = extracted(path, clip)
+    names = [name for name in service.FEATURE_NAMES if name not in TONNETZ + HPSS]
+    assert not mismatches(reference, features, names, RTOL, ATOL)
+
+@pytest.mark.parametrize('clip', CLIPS, ids=clip_id)
+@pytest.mark.parametrize('path', PATHS)
+def test_hpss_ratios_match_reference(path, clip):
+    kind, sample_rate, seconds = clip
+    reference, features = extracted(path, clip)
+    analysed_rate = SAMPLE_RATE if path == 'window' else sample_rate
+    # Frames the clip's sound reaches, including the ones the STFT centering adds around it
+    sounding_frames = int(seconds * analysed_rate) // service.spectral_engine.hop_length + 5
+    if sounding_frames <= service.SpectralFeatureEngine.EXACT_HPSS_FRAMES:
+        assert not mismatches(reference, features, HPSS, RTOL, ATOL)
+    else:
+        assert not mismatches(reference, features, HPSS, 0, HPSS_ATOL)
+
+@pytest.mark.usefixtures('started_service')
+@pytest.mark.parametrize('clip', CLIPS, ids=clip_id)
+@pytest.mark.parametrize('path', PATHS)
+def test_predictions_match_reference(path, clip):
+    reference, features = extracted(path, clip)
+    names = service.model_data['feature_names']
+    X = np.array([[reference[name] for name in names], [features[name] for name in names]])
+    labels, probabilities = service.predict_matrix(X)
+    assert labels[0] == labels[1]
+    np.testing.assert_allclose(probabilities[1], probabilities[0], rtol=0, atol=PROBABILITY_ATOL)
+
+@pytest.mark.parametrize('sample_rate, n_samples', RESAMPLED_LENGTHS)
+def test_resampler_matches_librosa(sample_rate, n_samples):
+    y = reference_clip('music', sample_rate, n_samples / sample_rate)
+    assert len(y) == n_samples
+    window = SAMPLE_RATE * DURATION
+    expected = librosa.resample(y, orig_sr=sample_rate, target_sr=SAMPLE_RATE)[:window]
+    resampled = service.Resampler('hq').resample(y, sample_rate, SAMPLE_RATE, max_output=window)
+    np.testing.assert_array_equal(resampled, expected)
@@ -0,0 +1,98 @@
+"""The feature store and /rescore, which re-runs the model over every stored vector."""
+
+import json
+
+import numpy as np
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+NAMES = ['a', 'b', 'c']
+
+def result(prediction: str, version: str = 'v1') -> dict:
+    return {'success': True, 'prediction': prediction, 'confidence': 0.9, 'model_version': version}
+
+def test_rows_are_stored_once_per_content_key(tmp_path):
+    store = service.FeatureStore(str(tmp_path), NAMES, lambda: 'v1')
+    store.append([('k1', 'song-1', np.array([1, 2, 3]), result('secular')),
+                  ('k2', 'song-2', np.array([4, 5, 6]), result('christian'))])
+    # The same input uploaded again under another song id
+    store.append([('k1', 'song-1b', np.array([1, 2, 3]), result('christian'))])
+
+    np.testing.assert_array_equal(store.matrix(), [[1, 2, 3], [4, 5, 6]])
+    assert store.index(0, 2) == [(0, 'song-1b', 'k1', 'christian'), (1, 'song-2', 'k2', 'christian')]
+    assert store.stats()['rows'] == 2
+
+def test_processes_share_the_store_and_repair_an_interrupted_append(tmp_path):
+    first = service.FeatureStore(str(tmp_path), NAMES, lambda: 'v1')
+    second = service.FeatureStore(str(tmp_path), NAMES, lambda: 'v1')
+    first.append([('k1', 'song-1', np.array([1, 2, 3]), result('secular'))])
+    # A crash after writing a row but before indexing it
+    with open(tmp_path / 'features.f32', 'ab') as f:
+        f.write(np.array([9, 9, 9], dtype=np.float32).tobytes())
+    second.append([('k2', 'song-2', np.array([4, 5, 6]), result('secular'))])
+
+    np.testing.assert_array_equal(first.matrix(), [[1, 2, 3], [4, 5, 6]])
+    assert [row[2] for row in first.index(0, 10)] == ['k1', 'k2']
+
+def test_another_feature_layout_is_refused(tmp_path):
+    service.FeatureStore(str(tmp_path), NAMES, lambda: 'v1').append([('k1', 's', np.zeros(3), result('secular'))])
+    other = service.FeatureStore(str(tmp_path), ['a', 'b', 'd'], lambda: 'v1')
+    with pytest.raises(ValueError, match='different feature layout'):
+        other.matrix()
+
+@pytest.fixture
+def feature_store(started_service, tmp_path, monkeypatch):
+    store = service.FeatureStore(str(tmp_path), service.model_data['feature_names'], service.current_model_version)
+    monkeypatch.setattr(service, 'feature_store', store)
+    monkeypatch.setattr(service, 'result_cache', service.ResultCache(0, '', 0, service.current_model_version))
+    return store
+
+@pytest.fixture
+def classified(feature_store):
+    """Three songs classified through /classify, which keeps their features; returns their results."""
+    client = service.app.test_client()
+    results = []
+    for i, kind in enumerate(('music', 'tone', 'noise')):
+        audio = reference_clip(kind, 22050, 2)
+        response = client.post('/classify', json={'audio_data': audio.tolist(), 'sample_rate': 22050,
+                                                  'song_id': f'song-{i}'})
+        results.append(response.get_json())
+    assert all(r['success'] for r in results)
+    return results
+
+def other_label(prediction: str) -> str:
+    return next(label for label in service.model_data['label_map'].values() if label != prediction)
+
+def test_rescore_reports_what_the_current_model_changes(feature_store, classified):
+    client = service.app.test_client()
+    unchanged = client.post('/rescore', json={}).get_json()
+    assert unchanged['success']
+    assert (unchanged['summary']['total'], unchanged['summary']['changed'], unchanged['results']) == (3, 0, [])
+
+    # Stored as if an earlier model had predicted the other class for the second song
+    feature_store.update_predictions([(other_label(classified[1]['prediction']), 0.6, 1)], 'earlier')
+    rescored = client.post('/rescore', json={'include_unchanged': True, 'chunk_size': 2}).get_json()
+    assert (rescored['summary']['total'], rescored['summary']['changed']) == (3, 1)
+    assert rescored['summary']['model_version'] == service.model_version
+    for song, row in zip(classified, rescored['results']):
+        assert row['song_id'] == song['song_id']
+        assert row['prediction'] == song['prediction']
+        assert row['probabilities'] == song['probabilities']
+    assert rescored['results'][1]['previous_prediction'] == other_label(classified[1]['prediction'])
+
+    # The new predictions are recorded, so the next pass changes nothing
+    assert client.post('/rescore', json={}).get_json()['summary']['changed'] == 0
+
+def test_rescore_streams_one_line_per_result(feature_store, classified):
+    response = service.app.test_client().post('/rescore', json={'stream': True, 'include_unchanged': True})
+    assert response.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [line['song_id'] for line in lines[:-1]] == ['song-0', 'song-1', 'song-2']
+    assert lines[-1]['summary']['total'] == 3
+
+@pytest.mark.usefixtures('started_service')
+def test_rescore_without_a_store(monkeypatch):
+    monkeypatch.setattr(service, 'feature_store', None)
+    assert service.app.test_client().post('/rescore', json={}).status_code == 503
@@ -0,0 +1,78 @@
+"""InferenceBatcher: single-row predictions from concurrent requests coalesced into one model call."""
+
+import threading
+
+import numpy as np
+import pytest
+
+import local_music_classification_service as service
+
+ROWS = 8
+# A feature value the failing model below rejects
+POISON = -12345.0
+
+def feature_rows(n_rows: int) -> np.ndarray:
+    rng = np.random.default_rng(n_rows)
+    return rng.standard_normal((n_rows, len(service.model_data['feature_names']))) * 10
+
+def predict_concurrently(batcher: service.InferenceBatcher, rows: np.ndarray) -> list:
+    """Predict every row from a thread of its own, all released at once; returns results or raised errors."""
+    outcomes = [None] * len(rows)
+    start = threading.Barrier(len(rows))
+
+    def predict(i):
+        start.wait()
+        try:
+            outcomes[i] = batcher.predict(rows[i])
+        except Exception as e:
+            outcomes[i] = e
+
+    threads = [threading.Thread(target=predict, args=(i,)) for i in range(len(rows))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(60)
+    return outcomes
+
+@pytest.fixture
+def batcher(started_service):
+    # A window long enough for every thread to queue its row; the batch closes when it is full
+    return service.InferenceBatcher(window_ms=2000, max_rows=ROWS)
+
+def test_concurrent_rows_are_predicted_in_one_call(batcher):
+    rows = feature_rows(ROWS)
+    outcomes = predict_concurrently(batcher, rows)
+
+    stats = batcher.stats()
+    assert stats['batches'] == 1
+    assert stats['rows'] == stats['max_batch_size'] == ROWS
+    labels, probabilities = service.predict_matrix(rows)
+    for i, (label, row_probabilities, model) in enumerate(outcomes):
+        assert model is service.model_data
+        assert label == labels[i]
+        np.testing.assert_array_equal(row_probabilities, probabilities[i])
+
+def test_failing_row_only_fails_its_own_request(batcher, monkeypatch):
+    predict_matrix = service.predict_matrix
+
+    def rejecting_poison(X, model=None):
+        if (X == POISON).any():
+            raise ValueError("Input contains a poisoned value")
+        return predict_matrix(X, model)
+
+    monkeypatch.setattr(service, 'predict_matrix', rejecting_poison)
+    rows = feature_rows(ROWS)
+    rows[3, 0] = POISON
+    outcomes = predict_concurrently(batcher, rows)
+
+    assert batcher.stats()['batches'] == 1
+    assert isinstance(outcomes[3], ValueError)
+    labels, probabilities = predict_matrix(np.delete(rows, 3, axis=0))
+    healthy = [outcome for i, outcome in enumerate(outcomes) if i != 3]
+    for (label, row_probabilities, _), expected_label, expected in zip(healthy, labels, probabilities):
+        assert label == expected_label
+        np.testing.assert_array_equal(row_probabilities, expected)
+
+    # The batcher thread survives the failure and keeps serving
+    label, _, _ = batcher.predict(rows[0])
+    assert label == labels[0]
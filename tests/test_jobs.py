@@ -0,0 +1,72 @@
+"""The asynchronous job store."""
+
+import os
+import subprocess
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+import local_music_classification_service as service
+
+def test_importing_the_service_leaves_running_songs_alone(tmp_path):
+    store = service.JobStore(str(tmp_path), 24)
+    job_id = store.create(['song'])
+    store.queue(job_id, 0, np.zeros(100, dtype=np.float32), 22050, 'window', 'key')
+    assert store.claim(1, os.getpid())
+
+    # Another process importing the service, e.g. a tool, while this one is classifying the song
+    subprocess.run(
+        [sys.executable, '-c', 'import local_music_classification_service'],
+        env=dict(os.environ, CLASSIFIER_JOBS_DIR=str(tmp_path)),
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True, timeout=300
+    )
+    assert store.item(job_id, 0) == ('song', 'running')
+    # Still this process's song, not requeued and claimed by the other one
+    assert store.requeue(os.getpid()) == 1
+    assert store.item(job_id, 0) == ('song', 'queued')
+
+@pytest.fixture
+def jobs(tmp_path, monkeypatch):
+    store = service.JobStore(str(tmp_path), 24)
+    monkeypatch.setattr(service, 'job_store', store)
+    runner = service.JobRunner(store, 4, service.classify_job_songs, service.failed_song_result, service.model_loaded)
+    monkeypatch.setattr(service, 'job_runner', runner)
+    return store
+
+def test_job_submission_is_bulk_traffic(jobs, monkeypatch):
+    admission = service.AdmissionController(2, {'interactive': 0, 'bulk': 1}, {'interactive': 4, 'bulk': 1})
+    monkeypatch.setattr(service, 'admission', admission)
+    client = service.app.test_client()
+    job_id = client.post('/jobs', json={'songs': ['a']}).get_json()['job_id']
+
+    # A batch holds the only bulk admission
+    batch = threading.Thread(target=admission.admit, args=('bulk',))
+    batch.start()
+    batch.join()
+    assert client.post('/jobs', json={'songs': ['b']}).status_code == 429
+    upload = client.put(f'/jobs/{job_id}/items/0', data=b'audio', headers={'X-File-Name': 'a.wav'})
+    assert upload.status_code == 429
+    assert 'Retry-After' in upload.headers
+    # Reading progress is not classification work
+    assert client.get(f'/jobs/{job_id}').status_code == 200
+    assert admission.stats()['classes']['bulk']['rejected'] == 2
+
+def test_event_streams_are_limited(jobs, monkeypatch):
+    monkeypatch.setattr(service, 'job_event_streams', service.EventStreamLimit(1))
+    client = service.app.test_client()
+    job_id = jobs.create(['song'])
+
+    first = client.get(f'/jobs/{job_id}/events')
+    assert first.status_code == 200
+    second = client.get(f'/jobs/{job_id}/events')
+    assert second.status_code == 429
+    assert second.headers['Retry-After'] == str(service.EventStreamLimit.RETRY_AFTER)
+    assert second.get_json()['results_url'] == f'/jobs/{job_id}/results'
+
+    first.close()
+    assert service.job_event_streams.stats() == {'open': 0, 'limit': 1, 'rejected': 1}
+    third = client.get(f'/jobs/{job_id}/events')
+    assert third.status_code == 200
+    third.close()
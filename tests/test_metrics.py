@@ -0,0 +1,113 @@
+"""Request metrics: LatencyHistogram, ServiceMetrics and their Prometheus exposition on /metrics."""
+
+import re
+import threading
+
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+SAMPLE = re.compile(r'^([a-z_]+)(\{[^}]*\})? (-?[0-9.e+]+)$')
+
+def parse_exposition(text: str) -> dict:
+    """{(name, labels): value} of every sample, checking each belongs to a family declared with HELP and TYPE."""
+    declared = {}
+    samples = {}
+    for line in text.splitlines():
+        if line.startswith('# HELP '):
+            declared[line.split()[2]] = None
+        elif line.startswith('# TYPE '):
+            _, _, name, kind = line.split()
+            assert name in declared and kind in ('counter', 'gauge', 'histogram')
+            declared[name] = kind
+        else:
+            match = SAMPLE.match(line)
+            assert match, f"Not a sample line: {line!r}"
+            name, labels, value = match.groups()
+            family = re.sub(r'_(bucket|sum|count)$', '', name) if name not in declared else name
+            assert declared.get(family), f"{name} is not declared"
+            samples[(name, labels or '')] = float(value)
+    return samples
+
+def test_histogram_quantiles_interpolate_inside_a_bucket():
+    histogram = service.LatencyHistogram()
+    for seconds in (0.0005, 0.001, 0.03, 0.04, 0.2):
+        histogram.observe(seconds)
+    # Bucket upper bounds are inclusive
+    assert histogram.counts[:8] == [2, 0, 0, 0, 0, 2, 0, 1]
+    # The 3rd and 4th observations fall in (0.025, 0.05]: the median is halfway into it
+    assert histogram.quantile(0.5) == pytest.approx(0.025 + 0.025 * 0.5 / 2)
+    assert histogram.quantile(1.0) == 0.2
+    assert histogram.summary()['max_ms'] == 200.0
+
+    histogram.observe(500)
+    assert histogram.quantile(1.0) == 500
+    assert service.LatencyHistogram().quantile(0.99) == 0.0
+
+def test_histogram_states_merge_into_the_same_counts():
+    values = [0.002, 0.07, 0.07, 1.5, 40.0]
+    whole, first, second = service.LatencyHistogram(), service.LatencyHistogram(), service.LatencyHistogram()
+    for i, seconds in enumerate(values):
+        whole.observe(seconds)
+        (first if i % 2 else second).observe(seconds)
+    first.merge(second.state())
+    assert first.state() == pytest.approx(whole.state())
+
+def test_histogram_exposition_is_cumulative():
+    histogram = service.LatencyHistogram()
+    for seconds in (0.003, 0.003, 0.3, 200):
+        histogram.observe(seconds)
+    samples = parse_exposition('# HELP t T\n# TYPE t histogram\n' + '\n'.join(histogram.prometheus('t', 'a="b"')))
+    buckets = [value for (name, _), value in samples.items() if name == 't_bucket']
+    assert buckets == sorted(buckets)
+    assert samples[('t_bucket', '{a="b",le="0.005"}')] == 2
+    assert samples[('t_bucket', '{a="b",le="120"}')] == 3
+    assert samples[('t_bucket', '{a="b",le="+Inf"}')] == samples[('t_count', '{a="b"}')] == 4
+    assert samples[('t_sum', '{a="b"}')] == pytest.approx(200.306)
+
+def test_concurrent_requests_are_all_counted():
+    metrics = service.ServiceMetrics()
+
+    def requests():
+        for _ in range(500):
+            metrics.request_started('/classify', 10)
+            metrics.request_finished('/classify', 200, 0.01, 20)
+
+    threads = [threading.Thread(target=requests) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = metrics.snapshot()['endpoints']['/classify']
+    assert (stats['requests'], stats['in_flight'], stats['bytes_in'], stats['bytes_out']) == (4000, 0, 40000, 80000)
+    assert stats['latency']['count'] == 4000
+
+@pytest.mark.usefixtures('started_service')
+def test_metrics_endpoint_counts_requests_and_stages(monkeypatch):
+    monkeypatch.setattr(service, 'service_metrics', service.ServiceMetrics())
+    client = service.app.test_client()
+    for _ in range(3):
+        client.get('/health')
+    client.get('/no/such/endpoint')
+    body = {'audio_data': reference_clip('music', 22050, 2).tolist(), 'sample_rate': 22050}
+    assert client.post('/classify', json=body).status_code == 200
+    assert client.post('/classify', json={**body, 'sample_rate': 0}).status_code == 400
+
+    response = client.get('/metrics')
+    assert response.mimetype == 'text/plain'
+    samples = parse_exposition(response.get_data(as_text=True))
+    requests = {labels: n for (name, labels), n in samples.items() if name == 'classifier_http_requests_total'}
+    assert requests == {
+        '{endpoint="/health",status="200"}': 3,
+        '{endpoint="unmatched",status="404"}': 1,
+        '{endpoint="/classify",status="200"}': 1,
+        '{endpoint="/classify",status="400"}': 1
+    }
+    assert samples[('classifier_http_request_duration_seconds_count', '{endpoint="/classify"}')] == 2
+    assert samples[('classifier_http_request_bytes_total', '{endpoint="/classify"}')] > 0
+    # /metrics itself is still being answered
+    assert samples[('classifier_http_requests_in_flight', '{endpoint="/metrics"}')] == 1
+    for stage in service.ServiceMetrics.STAGES:
+        assert samples[('classifier_stage_duration_seconds_count', f'{{stage="{stage}"}}')] >= 1
+    assert samples[('classifier_model_info', f'{{version="{service.model_version}"}}')] == 1
@@ -0,0 +1,97 @@
+"""Hot model reloads: a new model file swapped in atomically, and rejected models that leave the old one serving."""
+
+import shutil
+import threading
+
+import joblib
+import pytest
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+@pytest.fixture
+def model_file(started_service, tmp_path, monkeypatch):
+    """Path the reloader reads the model from; the model serving before the test is restored after it."""
+    path = str(tmp_path / 'model.joblib')
+    shutil.copyfile(service.find_model_path(), path)
+    monkeypatch.setattr(service, 'find_model_path', lambda: path)
+    monkeypatch.setattr(service, 'result_cache', service.ResultCache(0, '', 0, service.current_model_version))
+    yield path
+    monkeypatch.undo()
+    assert service.ModelReloader(0).reload('test')['success']
+
+def pruned(model_file: str) -> dict:
+    """The model in ``model_file`` with half of its trees: same features and labels, other probabilities."""
+    model = joblib.load(model_file)
+    forest = model['model']
+    forest.estimators_ = forest.estimators_[:len(forest.estimators_) // 2]
+    forest.n_estimators = len(forest.estimators_)
+    return model
+
+def classify(client, audio) -> tuple:
+    result = client.post('/classify', json={'audio_data': audio, 'sample_rate': 22050}).get_json()
+    assert result['success']
+    return result['model_version'], result['prediction'], tuple(result['probabilities'].values())
+
+def test_new_model_file_is_swapped_in(model_file):
+    client = service.app.test_client()
+    audio = reference_clip('music', 22050, 3).tolist()
+    previous_version = service.model_version
+    assert client.post('/admin/reload_model').get_json()['changed'] is False
+
+    joblib.dump(pruned(model_file), model_file)
+    outcome = client.post('/admin/reload_model').get_json()
+    assert outcome['success'] and outcome['changed']
+    assert outcome['previous_version'] == previous_version
+    assert outcome['model_version'] == service.model_version == service.model_file_version(model_file)
+    assert classify(client, audio)[0] == service.model_version
+
+@pytest.mark.parametrize('breakage', ['feature layout', 'labels', 'unreadable'])
+def test_rejected_model_leaves_the_old_one_serving(model_file, breakage):
+    client = service.app.test_client()
+    audio = reference_clip('music', 22050, 3).tolist()
+    before = classify(client, audio)
+    model = pruned(model_file)
+    if breakage == 'feature layout':
+        model['feature_names'] = list(reversed(model['feature_names']))
+        joblib.dump(model, model_file)
+    elif breakage == 'labels':
+        model['label_map'] = {0: 'Secular', 1: 'Christian'}
+        joblib.dump(model, model_file)
+    else:
+        with open(model_file, 'wb') as f:
+            f.write(b'not a model')
+
+    response = client.post('/admin/reload_model')
+    assert response.status_code == 422
+    assert not response.get_json()['success']
+    assert classify(client, audio) == before
+
+def test_requests_during_a_reload_see_one_model_or_the_other(model_file):
+    client = service.app.test_client()
+    audio = reference_clip('music', 22050, 3).tolist()
+    old = classify(client, audio)
+    seen = []
+    reloaded = threading.Event()
+
+    def classify_until_reloaded():
+        requests = service.app.test_client()
+        while not reloaded.is_set() or len(seen) < 4:
+            seen.append(classify(requests, audio))
+
+    threads = [threading.Thread(target=classify_until_reloaded) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    joblib.dump(pruned(model_file), model_file)
+    try:
+        assert service.ModelReloader(0).reload('test')['changed']
+    finally:
+        reloaded.set()
+        for thread in threads:
+            thread.join(60)
+    new = classify(client, audio)
+
+    assert new[0] != old[0] and new[2] != old[2]
+    # Every result is the old model's or the new model's, never its probabilities under the other's version
+    assert set(seen) <= {old, new}
+    assert seen[-1] == new
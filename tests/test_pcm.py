@@ -0,0 +1,30 @@
+"""Binary PCM payloads (XPCM frames)."""
+
+import numpy as np
+import pytest
+from werkzeug.exceptions import BadRequest
+
+import local_music_classification_service as service
+
+def pcm_frame(song_id: bytes, samples: np.ndarray, sample_rate: int = 22050) -> bytes:
+    padding = b'\0' * (-len(song_id) % 4)
+    header = service.PCM_HEADER.pack(service.PCM_MAGIC, 1, 1, len(song_id), sample_rate, len(samples))
+    return header + song_id + padding + samples.astype('<f4').tobytes()
+
+def test_parse_frame():
+    samples = np.linspace(-1, 1, 100, dtype=np.float32)
+    song_id, sample_rate, audio = service.parse_pcm_frame(memoryview(pcm_frame('café'.encode(), samples, 44100)))
+    assert song_id == 'café'
+    assert sample_rate == 44100
+    np.testing.assert_array_equal(audio, samples)
+
+def test_song_id_that_is_not_utf8_is_a_bad_request():
+    frame = pcm_frame(b'\xff\xfesong', np.zeros(100, dtype=np.float32))
+    with pytest.raises(BadRequest, match='not valid UTF-8'):
+        service.parse_pcm_frame(memoryview(frame))
+
+    response = service.app.test_client().post(
+        '/classify', data=frame, content_type=service.PCM_CONTENT_TYPES[0]
+    )
+    assert response.status_code == 400
+    assert 'UTF-8' in response.get_json()['error']
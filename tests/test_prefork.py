@@ -0,0 +1,132 @@
+"""The pre-fork server: its worker lifecycle, and the service served in production mode."""
+
+import http.client
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from classification_service.prefork import PreforkServer
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+pytestmark = pytest.mark.skipif(not hasattr(os, 'fork'), reason='the pre-fork server needs os.fork')
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def get(port: int, path: str, timeout: float = 30):
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        return response.status, response.read()
+    finally:
+        connection.close()
+
+def wait_until_serving(port: int, path: str, alive, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        assert alive(), "The server exited"
+        try:
+            status, _ = get(port, path, timeout=5)
+            if status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise AssertionError(f"Nothing served {path} on port {port} within {timeout:g}s")
+
+def pid_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [str(os.getpid()).encode()]
+
+class RecordingServer(PreforkServer):
+    """Appends every hook call, with the pid it ran in, to ``log_path``."""
+
+    def __init__(self, log_path: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.log_path = log_path
+
+    def _record(self, *event):
+        with open(self.log_path, 'a') as f:
+            f.write(json.dumps([os.getpid(), *event]) + '\n')
+
+    def prepare(self):
+        self._record('prepare')
+
+    def worker_started(self):
+        self._record('worker_started')
+
+    def worker_stopping(self):
+        self._record('worker_stopping')
+
+    def worker_exited(self, pid):
+        self._record('worker_exited', pid)
+
+    def stopped(self):
+        self._record('stopped')
+
+def test_workers_are_recycled_and_stopped(tmp_path):
+    port = free_port()
+    log_path = str(tmp_path / 'hooks.jsonl')
+    server = RecordingServer(log_path, pid_app, '127.0.0.1', port, workers=2, threads=2, max_requests=3,
+                             native_threads=1, graceful_timeout=10)
+    process = multiprocessing.get_context('fork').Process(target=server.serve)
+    process.start()
+    try:
+        wait_until_serving(port, '/', process.is_alive)
+        pids = {int(get(port, '/')[1]) for _ in range(20)}
+    finally:
+        os.kill(process.pid, signal.SIGTERM)
+        process.join(30)
+    assert process.exitcode == 0
+
+    with open(log_path) as f:
+        events = [json.loads(line) for line in f]
+    assert events[0] == [process.pid, 'prepare']
+    assert events[-1] == [process.pid, 'stopped']
+    started = {pid for pid, event, *_ in events if event == 'worker_started'}
+    stopping = {pid for pid, event, *_ in events if event == 'worker_stopping'}
+    exited = {args[0] for pid, event, *args in events if event == 'worker_exited'}
+    # Served from workers only, each recycled after about three requests and replaced by a fresh fork
+    assert process.pid not in pids
+    assert pids <= started
+    assert len(started) > 2
+    assert started == stopping == exited
+
+def test_service_in_production_mode(tmp_path):
+    port = free_port()
+    env = dict(os.environ, CLASSIFIER_JOBS_DIR=str(tmp_path / 'jobs'))
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPOSITORY, 'local_music_classification_service.py'),
+         '--production', '--workers', '2', '--threads', '2', '--port', str(port)],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        wait_until_serving(port, '/ready', lambda: process.poll() is None)
+        server = json.loads(get(port, '/performance')[1])['server']
+        assert server['mode'] == 'prefork' and server['workers'] == 2
+        assert server['pid'] != server['server_pid'] == process.pid
+
+        for _ in range(6):
+            assert get(port, '/health')[0] == 200
+        # Workers write their counts every WorkerMetrics.WRITE_SECONDS; /metrics adds up all of them
+        time.sleep(1.5)
+        metrics = get(port, '/metrics')[1].decode()
+        health = [
+            line for line in metrics.splitlines()
+            if line.startswith('classifier_http_requests_total{endpoint="/health"')
+        ]
+        assert health and sum(int(line.rsplit(' ', 1)[1]) for line in health) == 6
+    finally:
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(60) == 0
@@ -0,0 +1,132 @@
+"""The result cache and the content keys requests are cached under."""
+
+import numpy as np
+import pytest
+from werkzeug.exceptions import BadRequest
+
+import local_music_classification_service as service
+from test_pcm import pcm_frame
+
+INVALID_SAMPLE_RATES = [-1, 0, 2**33, 'abc', None, True, 22050.5]
+
+@pytest.mark.parametrize('sample_rate', INVALID_SAMPLE_RATES)
+def test_invalid_sample_rate_is_rejected(sample_rate):
+    with pytest.raises(BadRequest):
+        service.parse_sample_rate(sample_rate)
+
+@pytest.mark.parametrize('sample_rate', [22050, 44100.0, 2**32 - 1])
+def test_valid_sample_rate(sample_rate):
+    assert service.parse_sample_rate(sample_rate) == int(sample_rate)
+    assert isinstance(service.parse_sample_rate(sample_rate), int)
+
+@pytest.mark.parametrize('endpoint', ['/classify', '/classify_audio_data'])
+@pytest.mark.parametrize('sample_rate', INVALID_SAMPLE_RATES)
+def test_invalid_sample_rate_is_a_bad_request(endpoint, sample_rate):
+    response = service.app.test_client().post(
+        endpoint, json={'audio_data': [0.1] * 2000, 'sample_rate': sample_rate}
+    )
+    assert response.status_code == 400
+    assert 'sample_rate' in response.get_json()['error']
+
+@pytest.mark.usefixtures('started_service')
+@pytest.mark.parametrize('sample_rate', INVALID_SAMPLE_RATES)
+def test_invalid_sample_rate_fails_only_its_batch_song(sample_rate):
+    response = service.app.test_client().post('/batch_classify', json={'songs': [
+        {'song_id': 'bad', 'audio_data': [0.1] * 2000, 'sample_rate': sample_rate},
+        {'song_id': 'good', 'audio_data': [0.1] * 2000, 'sample_rate': 22050}
+    ]})
+    assert response.status_code == 200
+    bad, good = response.get_json()['results']
+    assert not bad['success'] and 'sample_rate' in bad['error']
+    assert good['success']
+
+def test_pcm_frame_with_zero_sample_rate_is_a_bad_request():
+    frame = pcm_frame(b'song', np.zeros(100, dtype=np.float32), sample_rate=0)
+    response = service.app.test_client().post('/classify', data=frame, content_type=service.PCM_CONTENT_TYPES[0])
+    assert response.status_code == 400
+    assert 'sample rate' in response.get_json()['error']
+
+def cached_result(prediction: str = 'secular') -> dict:
+    return {
+        'success': True, 'prediction': prediction, 'confidence': 0.8,
+        'probabilities': {'christian': 0.2, 'secular': 0.8}, 'song_id': 'song', 'processing_time': 0.5
+    }
+
+def test_miss_then_hit_without_request_fields():
+    cache = service.ResultCache(16, '', 0, lambda: 'v1')
+    features = np.arange(4, dtype=np.float32)
+    assert cache.get('pcm-window:abc') is None
+    cache.put('pcm-window:abc', features, cached_result())
+
+    hit_features, result = cache.get('pcm-window:abc')
+    np.testing.assert_array_equal(hit_features, features)
+    assert result == {
+        'success': True, 'prediction': 'secular', 'confidence': 0.8,
+        'probabilities': {'christian': 0.2, 'secular': 0.8}, 'model_version': 'v1'
+    }
+    assert cache.stats()['memory_hits'] == 1 and cache.stats()['misses'] == 1
+
+def test_failed_results_are_not_cached():
+    cache = service.ResultCache(16, '', 0, lambda: 'v1')
+    cache.put('key', np.zeros(4), {**cached_result(), 'success': False})
+    assert cache.get('key') is None
+
+def test_entries_belong_to_the_model_version_that_computed_them(tmp_path):
+    version = ['v1']
+    cache = service.ResultCache(16, str(tmp_path / 'cache.sqlite3'), 100, lambda: version[0])
+    cache.put('key', np.zeros(4), cached_result('secular'))
+    assert cache.get('key')[1]['prediction'] == 'secular'
+
+    version[0] = 'v2'
+    assert cache.get('key') is None
+    cache.put('key', np.zeros(4), cached_result('christian'))
+    _, result = cache.get('key')
+    assert (result['prediction'], result['model_version']) == ('christian', 'v2')
+
+    # A result computed by the model that was just replaced is stored under that model's version
+    cache.put('late', np.zeros(4), {**cached_result(), 'model_version': 'v1'})
+    assert cache.get('late') is None
+    version[0] = 'v1'
+    assert cache.get('key')[1]['prediction'] == 'secular'
+    assert cache.get('late') is not None
+
+def test_memory_tier_evicts_the_least_recently_used():
+    cache = service.ResultCache(2, '', 0, lambda: 'v1')
+    for key in ('a', 'b'):
+        cache.put(key, np.zeros(4), cached_result())
+    assert cache.get('a') is not None
+    cache.put('c', np.zeros(4), cached_result())
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert cache.stats()['memory_evictions'] == 1
+
+def test_disk_tier_survives_a_restart(tmp_path):
+    path = str(tmp_path / 'cache.sqlite3')
+    features = np.linspace(0, 1, 4, dtype=np.float32)
+    service.ResultCache(16, path, 100, lambda: 'v1').put('key', features, cached_result())
+
+    restarted = service.ResultCache(16, path, 100, lambda: 'v1')
+    hit_features, result = restarted.get('key')
+    np.testing.assert_array_equal(hit_features, features)
+    assert result['prediction'] == 'secular'
+    assert restarted.get('key') is not None
+    assert restarted.stats()['disk_hits'] == 1 and restarted.stats()['memory_hits'] == 1
+
+@pytest.mark.usefixtures('started_service')
+def test_classification_is_cached_until_the_model_changes(monkeypatch):
+    monkeypatch.setattr(service, 'result_cache', service.ResultCache(16, '', 0, service.current_model_version))
+    client = service.app.test_client()
+    body = {'audio_data': np.sin(np.arange(22050) / 10).tolist(), 'sample_rate': 22050}
+
+    first = client.post('/classify', json=body).get_json()
+    second = client.post('/classify', json=body).get_json()
+    assert not first['cached'] and second['cached']
+    assert second['probabilities'] == first['probabilities']
+
+    # What a reload does: another model computes the results, and they are cached for its version
+    monkeypatch.setattr(service, 'model_data', {**service.model_data, 'version': 'replacement'})
+    monkeypatch.setattr(service, 'model_version', 'replacement')
+    third = client.post('/classify', json=body).get_json()
+    assert not third['cached']
+    assert third['model_version'] == 'replacement'
+    assert client.post('/classify', json=body).get_json()['cached']
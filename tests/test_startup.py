@@ -0,0 +1,39 @@
+"""Importing the service against starting it."""
+
+import json
+import os
+import subprocess
+import sys
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_importing_the_service_starts_nothing(tmp_path):
+    # The default configuration, run from an empty directory the service would write its state to
+    env = {name: value for name, value in os.environ.items() if not name.startswith('CLASSIFIER_')}
+    probe = (
+        "import json, multiprocessing, sys, threading\n"
+        f"sys.path.insert(0, {REPOSITORY!r})\n"
+        "import local_music_classification_service as service\n"
+        "print(json.dumps({\n"
+        "    'model_loaded': service.model_data is not None,\n"
+        "    'extraction_pool': service.extraction_pool is not None,\n"
+        "    'threads': threading.active_count(),\n"
+        "    'processes': len(multiprocessing.active_children()),\n"
+        "    'ready': service.warm_up_state['ready'],\n"
+        "    'audio_modules': sorted({'librosa', 'soundfile', 'soxr', 'numba', 'scipy'} & set(sys.modules))\n"
+        "}))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', probe], env=env, cwd=tmp_path, check=True,
+                            capture_output=True, text=True, timeout=300).stdout
+    assert json.loads(output.splitlines()[-1]) == {
+        'model_loaded': False, 'extraction_pool': False, 'threads': 1, 'processes': 0, 'ready': False,
+        'audio_modules': []
+    }
+    assert list(tmp_path.iterdir()) == []
+
+def test_start_service_loads_the_model_once(started_service):
+    model = started_service.model_data
+    assert model is not None
+    assert started_service.warm_up_state['ready']
+    assert started_service.start_service()
+    assert started_service.model_data is model
@@ -0,0 +1,146 @@
+"""Audio file uploads: UploadStream, decoding from memory and the result cache of file uploads."""
+
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+
+import librosa
+import numpy as np
+import pytest
+import soundfile as sf
+from werkzeug.test import EnvironBuilder
+
+import local_music_classification_service as service
+from reference_features import reference_clip
+
+def wav_bytes(seconds: float, sample_rate: int = 22050) -> bytes:
+    out = io.BytesIO()
+    sf.write(out, reference_clip('music', sample_rate, seconds), sample_rate, format='WAV', subtype='PCM_16')
+    return out.getvalue()
+
+@pytest.fixture
+def result_cache(started_service, monkeypatch):
+    cache = service.ResultCache(16, '', 0, service.current_model_version)
+    monkeypatch.setattr(service, 'result_cache', cache)
+    monkeypatch.setattr(service, 'STREAM_UPLOADS', True)
+    return cache
+
+def test_upload_stream_stops_at_the_window_and_drains_the_rest():
+    data = wav_bytes(60)
+    body = io.BytesIO(data)
+    upload = service.UploadStream(body, len(data), head_bytes=64 * 1024)
+    y, sr = service.audio_decoder.decode_stream(upload, 'song.wav', sr=22050, duration=10)
+
+    assert len(y) == 10 * sr
+    np.testing.assert_array_equal(y, service.audio_decoder.decode(data, 'song.wav', sr=22050, duration=10)[0])
+    # The window is a sixth of the file; a few chunks past it at most are read
+    assert upload.received < len(data) // 4
+    assert upload.content_key is None
+
+    assert service.audio_decoder.finish_stream(upload) == service.file_content_key(data)
+    assert body.tell() == upload.received == len(data)
+
+def test_upload_stream_seeks_back_into_the_head_and_the_tail():
+    data = bytes(range(256)) * 3 * 4096
+    upload = service.UploadStream(io.BytesIO(data), len(data), head_bytes=1000)
+    upload.seek(-100, io.SEEK_END)
+    assert upload.read(100) == data[-100:]
+    upload.seek(10)
+    assert upload.read(20) == data[10:30]
+    upload.seek(len(data) - service.UploadStream.TAIL_BYTES - 1)
+    with pytest.raises(OSError, match='no longer buffered'):
+        upload.read(10)
+
+def test_response_is_sent_before_the_upload_is_read_to_its_end(result_cache):
+    data = wav_bytes(60)
+    body = io.BytesIO(data)
+    environ = EnvironBuilder(
+        path='/classify_audio_file', method='POST', input_stream=body, content_length=len(data),
+        headers={'X-File-Name': 'song.wav', 'X-Song-ID': 'song'}
+    ).get_environ()
+    started = []
+    app_iter = service.app(environ, lambda status, headers: started.append(status))
+    chunks = iter(app_iter)
+    first = next(chunks)
+
+    assert started == ['200 OK']
+    assert b'"success":true' in first.replace(b' ', b'')
+    assert body.tell() < len(data) // 4
+    assert list(chunks) == []
+    assert body.tell() == len(data)
+    app_iter.close()
+
+def test_repeated_upload_is_a_cache_hit(result_cache):
+    client = service.app.test_client()
+    data = wav_bytes(30)
+    headers = {'X-File-Name': 'song.wav', 'X-Song-ID': 'song'}
+
+    first = client.post('/classify_audio_file', data=data, headers=headers).get_json()
+    second = client.post('/classify_audio_file', data=data, headers=headers).get_json()
+    assert first['success'] and not first['cached']
+    assert second['cached']
+    assert second['prediction'] == first['prediction']
+    assert second['probabilities'] == first['probabilities']
+
+    # Read to its end after the response, the streamed upload is cached under the file's key too
+    buffered = client.post('/classify_file', data={'file': (io.BytesIO(data), 'song.wav'), 'song_id': 'song'})
+    assert buffered.get_json()['cached']
+    assert result_cache.counters['memory_hits'] == 2
+
+def test_buffered_upload_is_a_hit_for_a_later_streamed_one(result_cache):
+    client = service.app.test_client()
+    data = wav_bytes(20)
+    buffered = client.post('/classify_file', data={'file': (io.BytesIO(data), 'song.wav')}).get_json()
+    streamed = client.post('/classify_audio_file', data=data, headers={'X-File-Name': 'song.wav'}).get_json()
+    assert not buffered['cached']
+    assert streamed['cached']
+    assert streamed['prediction'] == buffered['prediction']
+
+@pytest.mark.parametrize('file_name, stops_early', [
+    ('song.wav', True), ('song.flac', True), ('song.m4a', True),
+    ('song.opus', False), ('song.OGG', False), ('song.mp3', False)
+])
+def test_formats_read_to_their_end_are_received_whole(file_name, stops_early):
+    assert service.audio_decoder.can_stop_early(file_name) == stops_early
+
+@pytest.fixture
+def decoder(started_service, tmp_path, monkeypatch):
+    # Any temporary file would be created here
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    return service.AudioDecoder(None, 30)
+
+@pytest.mark.parametrize('file_format', ['WAV', 'FLAC'])
+def test_uploads_are_decoded_in_memory(decoder, tmp_path, file_format):
+    path = str(tmp_path / f'song.{file_format.lower()}')
+    sf.write(path, reference_clip('music', 44100, 12), 44100, format=file_format)
+    with open(path, 'rb') as f:
+        data = f.read()
+    expected, _ = librosa.load(path, sr=22050, duration=10)
+    os.unlink(path)
+
+    y, sr = decoder.decode(data, os.path.basename(path), sr=22050, duration=10)
+    assert sr == 22050
+    np.testing.assert_array_equal(y, expected)
+    assert decoder.counters['soundfile'] == 1 and decoder.counters['tempfile'] == 0
+    assert os.listdir(tmp_path) == []
+
+def test_undecodable_upload_leaves_no_temporary_file(decoder, tmp_path):
+    with pytest.raises(Exception):
+        decoder.decode(b'not audio' * 100, 'song.m4a')
+    assert decoder.counters['failed'] == 1
+    assert os.listdir(tmp_path) == []
+
+@pytest.mark.skipif(not shutil.which('ffmpeg'), reason='needs ffmpeg')
+def test_containers_soundfile_cannot_read_are_piped_through_ffmpeg(decoder, tmp_path):
+    decoder.ffmpeg_path = shutil.which('ffmpeg')
+    aac = subprocess.run(
+        [decoder.ffmpeg_path, '-v', 'quiet', '-i', 'pipe:0', '-f', 'adts', '-c:a', 'aac', 'pipe:1'],
+        input=wav_bytes(12), stdout=subprocess.PIPE, check=True
+    ).stdout
+
+    y, sr = decoder.decode(aac, 'song.aac', sr=22050, duration=10)
+    assert sr == 22050 and abs(len(y) - 10 * sr) < sr // 10
+    assert decoder.counters['ffmpeg_pipe'] == 1 and decoder.counters['tempfile'] == 0
+    assert os.listdir(tmp_path) == []